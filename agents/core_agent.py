@@ -1,7 +1,7 @@
+import inspect
 import json
 import logging
 import os
-import random
 import time
 import requests
 from datetime import datetime, timedelta
@@ -9,12 +9,23 @@ from pathlib import Path
 from typing import Dict, Any, List, Optional
 import dotenv
 from core.config import PromptConfig
-from core.llm import call_llm_with_tools, call_llm, LLMError
+from core.llm import call_llm_async, call_llm_with_tools_async, LLMError
+from core.llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_DEFAULT, PRIORITY_BACKGROUND
 from core.imgen import generate_image_with_retry, generate_image_prompt, generate_image_with_retry_smartgen
 from core.voice import transcribe_audio, speak_text
 from core.embedding import get_embedding, MessageStore, PostgresConfig, PostgresVectorStorage, EmbeddingError, SQLiteConfig, SQLiteVectorStorage, MessageData
+from core.context import ContextBuilder
+from core.prompt_assembly import PromptAssembler
+from core.pipeline import StagePipeline, PipelineAbort
+from core.prefilter import MessagePrefilter, FILTER_TOPICS, TIER_LLM
+from core.outbound import OutboundBus
+from core.admission import get_admission_controller, admission_class_for, shed_response, CLASS_NAMES
+from core.conversation import ConversationMemory
+from core.semantic_cache import SemanticResponseCache, CONTEXTUAL_RESPONSE
+from core.deadline import Deadline, DeadlineExceeded, request_deadline
+from core.tracing import get_tracer, span
+from core.metrics import QUEUE_DEPTH, counter, gauge, histogram
 import threading
-from queue import Queue
 import asyncio
 from agents.tools import Tools
 
@@ -36,13 +47,37 @@ SMALL_MODEL_ID = os.getenv("SMALL_MODEL_ID")
 TWEET_WORD_LIMITS = [15, 20, 30, 35]
 IMAGE_GENERATION_PROBABILITY = 0.3
 BASE_IMAGE_PROMPT = ""
+# Sources whose replies are not awaited by a user, scheduled behind interactive traffic
+SCHEDULED_SOURCES = ["twitter", "farcaster"]
+# Sources where a user waits on the reply, the main LLM call is hedged for tail latency
+HEDGED_SOURCES = ["telegram", "discord", "api", "terminal"]
+# Sources whose messages are always answered, everything else goes through pre-validation
+UNVALIDATED_SOURCES = ["api", "twitter", "twitter_reply", "farcaster", "farcaster_reply", "terminal"]
+# Enrichment (response embedding, classification, topics) is skipped with less time left
+ENRICH_MIN_SECONDS = 5
+
+MESSAGES_TOTAL = counter("radiant_messages_total", "Messages handled by source interface and outcome")
+MESSAGE_SECONDS = histogram("radiant_message_seconds", "End-to-end handle_message duration including admission")
+IN_FLIGHT = gauge("radiant_admission_in_flight", "Requests currently admitted")
 
 class CoreAgent:
     def __init__(self):
         self.prompt_config = PromptConfig()
+        self.prompt_assembler = PromptAssembler(self.prompt_config)
         self.tools = Tools()
         self.interfaces = {}
-        self._message_queue = Queue()
+        self.outbound_bus = OutboundBus()
+        self.admission = get_admission_controller()
+        IN_FLIGHT.set_function(lambda: self.admission.get_stats()["in_flight"])
+        for class_name in CLASS_NAMES.values():
+            QUEUE_DEPTH.set_function(
+                lambda class_name=class_name: self.admission.get_stats()["classes"][class_name]["queued"],
+                queue=f"admission_{class_name}"
+            )
+        QUEUE_DEPTH.set_function(
+            lambda: sum(s["queued"] for s in self.outbound_bus.get_stats().values()),
+            queue="outbound"
+        )
         self._lock = threading.Lock()
         self.last_tweet_id = 0
         self.last_raid_tweet_id = 0
@@ -63,21 +98,46 @@ class CoreAgent:
             storage = SQLiteVectorStorage(config)
         
         self.message_store = MessageStore(storage)
+        self.context_builder = ContextBuilder(self.message_store)
+        self.conversation_memory = ConversationMemory(self.message_store, self._summarize_conversation)
+        self.response_cache = SemanticResponseCache(self.message_store)
+        self.prefilter = MessagePrefilter(self.prompt_config.get_name(), get_embedding)
+        if self.prefilter.use_embeddings:
+            self.prefilter.warm_up()
     
     def register_interface(self, name, interface):
         with self._lock:
             self.interfaces[name] = interface
         
-    async def pre_validation(self, message: str) -> bool:
+    async def pre_validation(self, message: str, message_embedding=None, deadline: Optional[Deadline] = None) -> bool:
         """
-        Pre-validation of the message
+        Pre-validation of the message. Keyword rules and the embedding topic
+        classifier decide obvious cases, only ambiguous messages reach the LLM.
         
         Args:
             message: The user's message
+            message_embedding: Optional embedding of the message, or an
+                awaitable of it that is only awaited if the keyword rules
+                cannot decide
+            deadline: Optional request deadline for the LLM filter call
             
         Returns:
             True if the message is valid, False otherwise
         """
+        decision = self.prefilter.keyword_tier(message)
+        if decision is None and self.prefilter.use_embeddings:
+            embedding_failed = False
+            if inspect.isawaitable(message_embedding):
+                message_embedding = await message_embedding
+                # The shared embedding failed, don't call the embedding API a second time
+                embedding_failed = message_embedding is None
+            if not embedding_failed:
+                decision = await asyncio.to_thread(self.prefilter.embedding_tier, message, message_embedding)
+        if decision is not None:
+            logger.info(f"Pre-validation decided locally: {'process' if decision else 'ignore'}")
+            return decision
+        self.prefilter.record(TIER_LLM)
+
         name = self.prompt_config.get_name()
         filter_message_tool = [
             {
@@ -88,7 +148,7 @@ class CoreAgent:
                         Return TRUE (ignore message) if:
                             - Message does not mention {name}
                             - Message does not mention 'start raid'
-                            - Message does not discuss: The Wired, Consciousness, Reality, Existence, Self, Philosophy, Technology, Crypto, AI, Machines
+                            - Message does not discuss: {', '.join(FILTER_TOPICS)}
                             - For image requests: ignore if {name} is not specifically mentioned
                         
                         Return FALSE (process message) only if:
@@ -112,25 +172,29 @@ class CoreAgent:
             }
         ]
         try:
-            response = call_llm_with_tools(
+            response = await call_llm_with_tools_async(
                 HEURIST_BASE_URL,
                 HEURIST_API_KEY, 
                 SMALL_MODEL_ID,
                 "",#"Always call the filter_message tool with the message as the argument",#self.prompt_config.get_telegram_rules(),
                 message,
                 temperature=0.5,
-                tools=filter_message_tool
+                tools=filter_message_tool,
+                priority=PRIORITY_INTERACTIVE,
+                deadline=deadline
             )
-            print(response)
+            if get_tracer().verbose():
+                print(response)
             #response = response.lower()
             #validation = False if "false" in response else True if "true" in response else False
             validation = False
             if 'tool_calls' in response and response['tool_calls']:
-                tool_call = response['tool_calls']
+                tool_call = response['tool_calls'][0]
                 args = json.loads(tool_call.function.arguments)
                 filter_result = str(args['should_ignore']).lower()
                 validation = False if filter_result == "true" else True
-            print("validation: ", validation)
+            if get_tracer().verbose():
+                print("validation: ", validation)
             return validation
         except Exception as e:
             logger.error(f"Pre-validation failed: {str(e)}")
@@ -141,7 +205,7 @@ class CoreAgent:
         prompt = self.prompt_config.get_template_image_prompt().format(tweet=message)
         logger.info("Prompt: %s", prompt)
         try:
-            image_prompt = call_llm(
+            image_prompt = await call_llm_async(
                 HEURIST_BASE_URL,
                 HEURIST_API_KEY, 
                 SMALL_MODEL_ID,
@@ -155,13 +219,14 @@ class CoreAgent:
         logger.info("Generated image prompt: %s", image_prompt)
         return image_prompt
     
-    async def handle_image_generation(self, prompt: str, base_prompt: str = "") -> Optional[str]:
+    async def handle_image_generation(self, prompt: str, base_prompt: str = "", deadline: Optional[Deadline] = None) -> Optional[str]:
         """
         Handle image generation requests with retry logic
         
         Args:
             prompt: The image generation prompt
             base_prompt: Optional base prompt to prepend
+            deadline: Optional request deadline bounding the retries
             
         Returns:
             Generated image URL or None if failed
@@ -170,9 +235,9 @@ class CoreAgent:
             full_prompt = base_prompt + prompt if base_prompt else prompt
             #result = generate_image_with_retry(prompt=full_prompt)
             #SMARTGEN
-            print("full_image_prompt: ", full_prompt)
-            result = await generate_image_with_retry_smartgen(prompt=full_prompt)
-            print(result)
+            logger.debug(f"full_image_prompt: {full_prompt}")
+            result = await generate_image_with_retry_smartgen(prompt=full_prompt, deadline=deadline)
+            logger.debug(f"Image generation result: {result}")
             return result
         except Exception as e:
             logger.error(f"Image generation failed: {str(e)}")
@@ -219,9 +284,93 @@ class CoreAgent:
                              system_prompt_fixed: str = None, 
                              skip_embedding: bool = False, 
                              skip_tools: bool = False,
-                             external_tools: List[str] = []
+                             external_tools: List[str] = [],
+                             conversation_id: str = None,
+                             deadline: Optional[Deadline] = None,
+                             use_memory: bool = True,
+                             memory_text: str = None,
+                             memory_speaker: str = None,
+                             client_id: str = None
                              ):
         """
+        Handle message once the admission controller grants a slot. Messages
+        the keyword rules reject are ignored before admission, so they never
+        take a chat's slots. Requests that cannot be admitted in time are shed,
+        with a canned reply only where someone waits on it (see
+        core.admission.shed_response). Other arguments as for _process_message.
+
+        Args:
+            conversation_id: Optional id of the chat the message came from, used
+                to queue chats fairly against each other. Defaults to chat_id.
+            client_id: Optional identity of the caller (e.g. its address) to
+                queue by when there is no chat id. Without any id the request
+                gets a flow of its own instead of sharing one with every
+                anonymous caller.
+            deadline: Time budget for the whole request, created by the
+                interface. Defaults to core.deadline.request_deadline(source_interface).
+
+        Returns:
+            tuple: (text_response, image_url, tool_back)
+        """
+        if deadline is None:
+            deadline = request_deadline(source_interface)
+        admission_class = admission_class_for(source_interface)
+        flow_key = (source_interface, conversation_id or chat_id or client_id or object())
+        with span("handle_message", source=source_interface, chars=len(message)) as request_span, \
+                MESSAGE_SECONDS.time(source=source_interface):
+            # Local keyword tier first, messages the bot would ignore never reach admission
+            validated = source_interface in UNVALIDATED_SOURCES
+            if not validated:
+                decision = self.prefilter.keyword_tier(message)
+                if decision is False:
+                    request_span.set("ignored", True)
+                    MESSAGES_TOTAL.inc(source=source_interface, outcome="ignored")
+                    return None, None, None
+                validated = decision is True
+            with span("admission", admission_class=admission_class) as admission_span:
+                admitted = await self.admission.acquire(admission_class, flow_key, timeout=deadline.remaining())
+                admission_span.set("admitted", admitted)
+            if not admitted:
+                request_span.set("shed", True)
+                MESSAGES_TOTAL.inc(source=source_interface, outcome="shed")
+                # Only a sender waiting on the bot hears that it is busy
+                return shed_response(source_interface, self.prefilter.addressed(message))
+            MESSAGES_TOTAL.inc(source=source_interface, outcome="admitted")
+            try:
+                return await self._process_message(
+                    message,
+                    source_interface=source_interface,
+                    chat_id=chat_id,
+                    system_prompt_fixed=system_prompt_fixed,
+                    skip_embedding=skip_embedding,
+                    skip_tools=skip_tools,
+                    external_tools=external_tools,
+                    conversation_id=conversation_id,
+                    deadline=deadline,
+                    use_memory=use_memory,
+                    memory_text=memory_text,
+                    memory_speaker=memory_speaker,
+                    validated=validated
+                )
+            finally:
+                self.admission.release(admission_class, flow_key)
+
+    async def _process_message(self, 
+                               message: str, 
+                               source_interface: str = None, 
+                               chat_id: str = None, 
+                               system_prompt_fixed: str = None, 
+                               skip_embedding: bool = False, 
+                               skip_tools: bool = False,
+                               external_tools: List[str] = [],
+                               conversation_id: str = None,
+                               deadline: Optional[Deadline] = None,
+                               use_memory: bool = True,
+                               memory_text: str = None,
+                               memory_speaker: str = None,
+                               validated: bool = False
+                               ):
+        """
         Handle message and optionally notify other interfaces.        
         Args:
             message: The message to process
@@ -230,233 +379,394 @@ class CoreAgent:
             skip_validation: Optional flag to skip pre-validation
             skip_embedding: Optional flag to skip embedding
             skip_tools: Optional flag to skip tools
+            conversation_id: Optional chat the message belongs to, keys the
+                rolling conversation memory. Defaults to chat_id.
+            deadline: Optional time budget, every stage sizes its timeouts
+                and retries to what is left and optional stages are skipped
+            use_memory: False for one-shot messages that belong to no
+                conversation, skips loading and storing memory
+            memory_text: The user's own words when `message` is a templated
+                prompt, stored in memory instead of the whole prompt
+            memory_speaker: Who wrote the message (e.g. '@handle'), so memory
+                of a thread with several people keeps them apart. Defaults to 'User'.
+            validated: True when the message needs no pre-validation (its
+                source is always answered, or the keyword tier accepted it)
 
         Returns:
             tuple: (text_response, image_url, tool_back)
         """
         logger.info(f"Handling message from {source_interface}")
-        logger.info(f"registered interfaces: {self.interfaces}")
+        if deadline is None:
+            deadline = Deadline.unbounded()
+        tracer = get_tracer()
+        if tracer.verbose():
+            logger.info(f"registered interfaces: {list(self.interfaces)}")
 
-        do_pre_validation = False if source_interface in ["api", "twitter", "twitter_reply", "farcaster", "farcaster_reply", "terminal"] else True
-        if do_pre_validation and not await self.pre_validation(message):
-            logger.debug(f"Message failed pre-validation: {message[:100]}...")
-            return None, None, None
-        
-        try:
-            similar_messages = []
-            message_embedding = None
-            if not skip_embedding:
+        do_pre_validation = not validated and source_interface not in UNVALIDATED_SOURCES
+        priority = PRIORITY_DEFAULT if source_interface in SCHEDULED_SOURCES else PRIORITY_INTERACTIVE
+        # Only hedge replies someone is actively waiting on
+        hedge = source_interface in HEDGED_SOURCES
+        memory_id = conversation_id or chat_id
+        use_memory = use_memory and bool(source_interface and memory_id) and system_prompt_fixed is None
+        # Fixed-prompt generations (scheduled posts) must stay fresh, never serve them from cache
+        cacheable = self.response_cache.enabled and system_prompt_fixed is None and not skip_embedding
+
+        # Stages run as soon as their inputs are ready: validation runs next to the
+        # embedding (waiting for it only if the keywords can't decide), the similarity
+        # lookup follows the embedding, and fan-out overlaps enrichment/persistence
+        async def compute_embedding():
+            if skip_embedding:
+                return None
+            try:
                 # Generate embedding for the incoming message
-                message_embedding = get_embedding(message)
-                logger.info(f"Generated embedding for message: {message[:50]}...")
-            
-                # First find messages similar to the incoming user message
-                similar_messages = self.message_store.find_similar_messages(
-                    message_embedding, 
-                    threshold=0.9            
-                )
-                logger.info(f"Found {len(similar_messages)} similar messages")
-            
+                deadline.check("embedding")
+                message_embedding = await asyncio.to_thread(get_embedding, message, timeout=deadline.timeout())
+            except Exception as e:
+                # Only context and caching depend on it, the reply can go ahead without
+                logger.warning(f"Message embedding failed, continuing without it: {str(e)}")
+                return None
+            logger.info(f"Generated embedding for message: {message[:50]}...")
+            return message_embedding
+
+        embedding_task = None
+
+        def message_embedding() -> asyncio.Task:
+            """One embedding call shared by the embed and validate stages"""
+            nonlocal embedding_task
+            if embedding_task is None:
+                embedding_task = asyncio.ensure_future(compute_embedding())
+            return embedding_task
+
+        async def validate(ctx):
+            if do_pre_validation and not await self.pre_validation(message, message_embedding(), deadline):
+                logger.debug(f"Message failed pre-validation: {message[:100]}...")
+                raise PipelineAbort((None, None, None))
+
+        async def embed(ctx):
+            return await message_embedding()
+
+        async def search(ctx):
+            if ctx["embed"] is None:
+                return []
+            # First find messages similar to the incoming user message
+            similar_messages = await asyncio.to_thread(
+                self.message_store.find_similar_messages,
+                ctx["embed"],
+                0.9
+            )
+            logger.info(f"Found {len(similar_messages)} similar messages")
+            return similar_messages
+
+        async def build_context(ctx):
             # Build context from similar conversations and responses
-            if system_prompt_fixed is None:
-                system_prompt_fixed = "Use the following settings as part of your personality and voice if applicable in the conversation context: "
-                basic_options = random.sample(self.prompt_config.get_basic_settings(), 2)
-                style_options = random.sample(self.prompt_config.get_interaction_styles(), 2)
-                system_prompt_fixed = system_prompt_fixed + ' '.join(basic_options) + ' ' + ' '.join(style_options)
-            
-            system_prompt_context = ""
-            if similar_messages:
-                context = "\n\nRelated previous conversations and responses\nNOTE: Please provide a response that differs from these recent replies, don't use the same words:\n"
-                seen_responses = set()  # Track unique responses
-                message_count = 0
-                
-                for similar_msg in similar_messages:
-                    # Find the agent's response where this similar message was the original_query
-                    agent_responses = self.message_store.find_messages(
-                        message_type='agent_response',
-                        original_query=similar_msg['message']
-                    )
-                    
-                    for response in agent_responses:
-                        if response['message'] in seen_responses:
-                            continue
-                        seen_responses.add(response['message'])
-                        context += f"""
-                            Previous similar question: {similar_msg['message']}
-                            My response: {response['message']}
-                            Similarity score: {similar_msg.get('similarity', 0):.2f}
-                            """
-                        message_count += 1
-                        if message_count >= 60:  # Check limit after adding each message
-                            break
-
-                context += "\nConsider the above responses for context, but provide a fresh perspective that adds value to the conversation, don't repeat the same responses.\n"
-                system_prompt_context += context
-                
-                logger.info("Added context from similar conversations")
-            
-            print("system_prompt_context: ", system_prompt_context)
-            print("system_prompt_fixed: ", system_prompt_fixed)
-            print("message: ", message)
+            if not ctx["search"]:
+                return ""
+            context = await asyncio.to_thread(self.context_builder.build, ctx["search"])
+            logger.info("Added context from similar conversations")
+            return context.text
+
+        async def cache_lookup(ctx):
+            # A reply shaped by this conversation's memory can't stand in for a fresh one
+            if not cacheable or not ctx["search"] or ctx["recall"]:
+                return None
+            hit = await asyncio.to_thread(self.response_cache.lookup, ctx["search"])
+            if hit:
+                logger.info(f"Semantic cache hit (similarity {hit.similarity:.3f}, {hit.age_seconds:.0f}s old)")
+            return hit
+
+        async def recall(ctx):
+            if not use_memory:
+                return ""
+            return await asyncio.to_thread(self.conversation_memory.get_context, source_interface, memory_id)
+
+        async def generate(ctx):
+            started = time.perf_counter()
+            hit = ctx["cache"]
+            if hit is not None:
+                content = hit.response
+                if self.response_cache.paraphrase:
+                    content = await self._paraphrase_response(hit.response, priority, deadline)
+                self.response_cache.record(source_interface, True, time.perf_counter() - started)
+                return {"content": content}
+
+            persona = system_prompt_fixed
+            if persona is None:
+                persona = self.prompt_assembler.sample_persona()
+            system_prompt_context = ctx["recall"] + ctx["context"]
+            if tracer.verbose():
+                print("system_prompt_context: ", system_prompt_context)
+                print("system_prompt_fixed: ", persona)
+                print("message: ", message)
             # Call LLM with tools and enhanced context
-            system_prompt = self.prompt_config.get_system_prompt() + system_prompt_fixed + system_prompt_context
+            # Static prefix first so provider-side prompt caching can hit, randomized/dynamic parts last
+            system_prompt = self.prompt_assembler.assemble(persona, system_prompt_context)
             if skip_tools:
-                response_content = call_llm(
+                response_content = await call_llm_async(
                     HEURIST_BASE_URL,
                     HEURIST_API_KEY,
                     LARGE_MODEL_ID,
                     system_prompt,
                     message,
                     temperature=0.4,
+                    priority=priority,
+                    hedge=hedge,
+                    deadline=deadline
                 )
                 response = {
                     "content": response_content
                 }
             else:
-                response = call_llm_with_tools(
+                response = await call_llm_with_tools_async(
                     HEURIST_BASE_URL,
                     HEURIST_API_KEY,
                     LARGE_MODEL_ID,
                     system_prompt,
                     message,
-                temperature=0.4,
-                tools=self.tools.get_tools_config() + external_tools
-            )
-            
+                    temperature=0.4,
+                    tools=self.tools.get_tools_config() + external_tools,
+                    priority=priority,
+                    hedge=hedge,
+                    deadline=deadline
+                )
+            if tracer.verbose():
+                print("response: ", response)
+            if cacheable and not ctx["recall"]:
+                self.response_cache.record(source_interface, False, time.perf_counter() - started)
+            if not response:
+                raise PipelineAbort(("Sorry, I couldn't process your message.", None, None))
+            return response
+
+        async def run_tools(ctx):
             # Process response and handle tools
+            response = ctx["generate"]
             text_response = ""
             image_url = None
             tool_back = None
-            logger.info("response: ", response)
-            print("response: ", response)
-            if not response:
-                return "Sorry, I couldn't process your message.", None
-            
             if 'content' in response and response['content']:  # Add null check
                 text_response = response['content'].strip('"') if isinstance(response['content'], str) else str(response['content'])
 
-            # Handle tool calls
-            
+            # Handle tool calls, all calls from this turn run concurrently
             if 'tool_calls' in response and response['tool_calls']:
-                tool_call = response['tool_calls']
-                args = json.loads(tool_call.function.arguments)
-                tool_name = tool_call.function.name
-                available_tools = [t["function"]["name"] for t in self.tools.get_tools_config()]
-                if tool_name in available_tools:
-                    logger.info(f"Executing tool {tool_name} with args {args}")
-                    tool_result = await self.tools.execute_tool(
-                        tool_name,
-                        args,
-                        self
-                    )
-                    if tool_result:
+                tool_result = await self.tools.execute_tools(response['tool_calls'], self, deadline=deadline)
+                if tool_result:
+                    if tracer.verbose():
                         print("tool_result: ", tool_result)
-                        if 'image_url' in tool_result:
-                            image_url = tool_result['image_url']
-                        if 'message' in tool_result:
-                            text_response += f"\n{tool_result['message']}"
-                        if 'tool_call' in tool_result:
-                            tool_back = tool_result['tool_call']
-                else:
-                    logger.info(f"Tool {tool_name} not found in tools config")
-                    tool_back = json.dumps({
-                        "tool_call": tool_name,
-                        "processed": False,
-                        "args": args
-                    }, default=str)  # default=str handles any non-JSON serializable objects
-            
-            if not skip_embedding:
-                #moved to post post processing as it is not relevant until finished processing
-                # Create MessageData for incoming message
-                message_data = MessageData(
-                    message=message,
-                    embedding=message_embedding,
-                    timestamp=datetime.now().isoformat(),
-                    message_type="user_message",
-                    chat_id=chat_id,
-                    source_interface=source_interface,
-                    original_query=None,
-                    original_embedding=None,
-                    response_type=None,
-                    key_topics=None, 
-                    tool_call=None
-                )
-                
-                # Store the incoming message
-                self.message_store.add_message(message_data)
-                logger.info("Stored message and embedding in database")
-                # Create and store MessageData for the response
-                response_data = MessageData(
-                    message=text_response,
-                    embedding=get_embedding(text_response),
-                    timestamp=datetime.now().isoformat(),
-                    message_type="agent_response",
-                    chat_id=chat_id,
-                    source_interface=source_interface,
-                    original_query=message,
-                    original_embedding=message_embedding,
-                    response_type=await self._classify_response_type(text_response),
-                    key_topics=await self._extract_key_topics(text_response),
-                    tool_call=tool_back
+                    if 'image_url' in tool_result:
+                        image_url = tool_result['image_url']
+                    if 'message' in tool_result:
+                        text_response += f"\n{tool_result['message']}"
+                    if 'tool_call' in tool_result:
+                        tool_back = tool_result['tool_call']
+            return text_response, image_url, tool_back
+
+        async def remember(ctx):
+            text_response = ctx["tools"][0]
+            if use_memory and text_response:
+                await self.conversation_memory.add_turns(source_interface, memory_id, [
+                    (memory_speaker or "User", memory_text or message),
+                    (self.prompt_config.get_name(), text_response)
+                ])
+
+        async def enrich(ctx):
+            # Cached replies are already stored, re-storing them would keep them fresh forever
+            if ctx["embed"] is None or ctx["cache"] is not None:
+                return None
+            if not deadline.allows(ENRICH_MIN_SECONDS):
+                logger.warning(f"Skipping enrichment and response storage, {deadline}")
+                return None
+            text_response = ctx["tools"][0]
+
+            async def response_type():
+                # Marked so the semantic cache never serves it to another conversation
+                if ctx["recall"]:
+                    return CONTEXTUAL_RESPONSE
+                return await self._classify_response_type(text_response, deadline)
+
+            try:
+                return await asyncio.gather(
+                    asyncio.to_thread(get_embedding, text_response, timeout=deadline.timeout()),
+                    response_type(),
+                    self._extract_key_topics(text_response, deadline)
                 )
-                
-                # Store the response
-                self.message_store.add_message(response_data)
-            
+            except Exception as e:
+                # The reply is already out, only its storage is lost
+                logger.warning(f"Response enrichment failed, storing the user message only: {str(e)}")
+                return None
+
+        async def persist(ctx):
+            # Stored rows need an embedding, without one the message can't be stored
+            if ctx["embed"] is None:
+                return
+            #moved to post post processing as it is not relevant until finished processing
+            text_response, _, tool_back = ctx["tools"]
+            # Create MessageData for incoming message
+            message_data = MessageData(
+                message=message,
+                embedding=ctx["embed"],
+                timestamp=datetime.now().isoformat(),
+                message_type="user_message",
+                chat_id=chat_id,
+                source_interface=source_interface,
+                original_query=None,
+                original_embedding=None,
+                response_type=None,
+                key_topics=None, 
+                tool_call=None
+            )
+            if ctx["enrich"] is None:
+                # Enrichment skipped or failed, the user message is kept regardless
+                await asyncio.to_thread(self._store_messages, [message_data])
+                logger.info("Stored message embedding in database")
+                return
+            response_embedding, response_type, key_topics = ctx["enrich"]
+            # Create MessageData for the response
+            response_data = MessageData(
+                message=text_response,
+                embedding=response_embedding,
+                timestamp=datetime.now().isoformat(),
+                message_type="agent_response",
+                chat_id=chat_id,
+                source_interface=source_interface,
+                original_query=message,
+                original_embedding=ctx["embed"],
+                response_type=response_type,
+                key_topics=key_topics,
+                tool_call=tool_back
+            )
+            await asyncio.to_thread(self._store_messages, [message_data, response_data])
+            logger.info("Stored message and response embeddings in database")
+
+        async def fanout(ctx):
             # Notify other interfaces if needed
-            if source_interface and chat_id:
-                for interface_name, interface in self.interfaces.items():
-                    if interface_name != source_interface:
-                        await self.send_to_interface(interface_name, {
-                            'type': 'message',
-                            'content': text_response,
-                            'image_url': image_url,
-                            'source': source_interface,
-                            'chat_id': chat_id
-                        })
-            
-            return text_response, image_url, tool_back
-            
+            if not (source_interface and chat_id):
+                return
+            text_response, image_url, _ = ctx["tools"]
+            for interface_name, interface in self.interfaces.items():
+                if interface_name != source_interface:
+                    await self.send_to_interface(interface_name, {
+                        'type': 'message',
+                        'content': text_response,
+                        'image_url': image_url,
+                        'source': source_interface,
+                        'chat_id': chat_id
+                    })
+
+        pipeline = (
+            StagePipeline("handle_message")
+            .stage("embed", embed)
+            .stage("validate", validate)
+            .stage("search", search, after=["embed"])
+            .stage("context", build_context, after=["search"])
+            .stage("recall", recall)
+            .stage("cache", cache_lookup, after=["search", "recall"])
+            .stage("generate", generate, after=["validate", "context", "cache", "recall"])
+            .stage("tools", run_tools, after=["generate"])
+            .stage("remember", remember, after=["tools"])
+            .stage("enrich", enrich, after=["tools"])
+            .stage("persist", persist, after=["enrich"])
+            .stage("fanout", fanout, after=["tools"])
+        )
+        try:
+            ctx = await pipeline.run({})
+            return ctx["tools"]
+
+        except PipelineAbort as e:
+            return e.result
         except LLMError as e:
             logger.error(f"LLM processing failed: {str(e)}")
             return "Sorry, I encountered an error processing your message.", None, None
+        except DeadlineExceeded as e:
+            logger.warning(f"Message handling ran out of time: {str(e)}")
+            return "Sorry, that took too long, please try again.", None, None
         except Exception as e:
             logger.error(f"Message handling failed: {str(e)}")
             return "Sorry, something went wrong.", None, None
+        finally:
+            if embedding_task is not None and not embedding_task.done():
+                embedding_task.cancel()
 
-    async def _classify_response_type(self, response: str) -> str:
+    def _store_messages(self, messages: List[MessageData]):
+        """Store messages sequentially, called from a worker thread"""
+        for message_data in messages:
+            self.message_store.add_message(message_data)
+
+    async def _classify_response_type(self, response: str, deadline: Optional[Deadline] = None) -> str:
         """Classify the type of response (factual, opinion, question, etc.)"""
         classify_prompt = {
             "role": "system",
             "content": "Classify this response as one of: FACTUAL, OPINION, QUESTION, EMOTIONAL, ACTION. Response:"
         }
         try:
-            classification = await call_llm(
+            classification = await call_llm_async(
                 HEURIST_BASE_URL,
                 HEURIST_API_KEY,
                 SMALL_MODEL_ID,  # Use smaller model for classification
                 classify_prompt["content"],
                 response,
-                temperature=0.3
+                temperature=0.3,
+                priority=PRIORITY_BACKGROUND,
+                deadline=deadline
             )
             return classification.strip().upper()
         except:
             return "general"
 
-    async def _extract_key_topics(self, text: str) -> List[str]:
+    async def _paraphrase_response(self, response: str, priority: int, deadline: Optional[Deadline] = None) -> str:
+        """Reword a cached response with the small model, falling back to it verbatim"""
+        paraphrase_prompt = (
+            "Rephrase the following reply in the same voice, tone and language. Keep the meaning "
+            "and roughly the same length. Reply with the rephrased text only."
+        )
+        try:
+            paraphrased = await call_llm_async(
+                HEURIST_BASE_URL,
+                HEURIST_API_KEY,
+                SMALL_MODEL_ID,
+                paraphrase_prompt,
+                response,
+                temperature=0.7,
+                priority=priority,
+                deadline=deadline
+            )
+            return paraphrased.strip() or response
+        except LLMError as e:
+            logger.warning(f"Paraphrasing cached response failed: {str(e)}")
+            return response
+
+    async def _summarize_conversation(self, previous_summary: str, transcript: str, max_tokens: int) -> str:
+        """Fold older chat turns into the rolling conversation summary"""
+        summary_prompt = (
+            "Update the running summary of a chat with the new messages below. Keep names, "
+            "facts, open questions and promises, drop small talk. Reply with the summary only, "
+            f"in at most {max_tokens // 2} words.\n\nCurrent summary: {previous_summary or '(none)'}"
+        )
+        return await call_llm_async(
+            HEURIST_BASE_URL,
+            HEURIST_API_KEY,
+            SMALL_MODEL_ID,
+            summary_prompt,
+            transcript,
+            temperature=0.3,
+            max_tokens=max_tokens,
+            priority=PRIORITY_BACKGROUND
+        )
+
+    async def _extract_key_topics(self, text: str, deadline: Optional[Deadline] = None) -> List[str]:
         """Extract key topics from the response for better similarity matching"""
         topic_prompt = {
             "role": "system",
             "content": "Extract 2-3 main topics from this text as comma-separated keywords:"
         }
         try:
-            topics = await call_llm(
+            topics = await call_llm_async(
                 HEURIST_BASE_URL,
                 HEURIST_API_KEY,
                 SMALL_MODEL_ID,
                 topic_prompt["content"],
                 text,
-                temperature=0.3
+                temperature=0.3,
+                priority=PRIORITY_BACKGROUND,
+                deadline=deadline
             )
             return [t.strip() for t in topics.split(',')]
         except:
@@ -481,47 +791,26 @@ class CoreAgent:
         """
         try:
             with self._lock:
-                if target_interface not in self.interfaces:
-                    logger.error(f"Interface {target_interface} not registered")
-                    return False
-                
-                # Validate message format
-                if not isinstance(message, dict) or 'type' not in message or 'content' not in message:
-                    logger.error("Invalid message format")
-                    return False
-                
-                # Add timestamp and target
-                message['timestamp'] = datetime.now().isoformat()
-                message['target'] = target_interface
-                
-                # Queue the message
-                self._message_queue.put(message)
-                
-                # Get interface instance
-                interface = self.interfaces[target_interface]
-                logger.info(f"Interface: {interface}")
-                logger.info(f"Message: {message}")
-                logger.info("trying to send message")
-                # Handle different message types
-                logger.info(f"Message type: {message['type']}")
-                if message['type'] == 'message':
-                    logger.info(f"interface has method {hasattr(interface, 'send_message')}")
-                    if hasattr(interface, 'send_message'):
-                        try:
-                            logger.info(f"Attempting to send message via {target_interface} interface")
-                            await interface.send_message(
-                                chat_id=message['chat_id'],
-                                message=message['content'],
-                                image_url=message['image_url']
-                            )
-                            logger.info("Message sent successfully")
-                        except Exception as e:
-                            logger.error(f"Failed to send message via {target_interface}: {str(e)}")
-                            raise
-                # Log successful queue
+                interface = self.interfaces.get(target_interface)
+            if interface is None:
+                logger.error(f"Interface {target_interface} not registered")
+                return False
+
+            # Validate message format
+            if not isinstance(message, dict) or 'type' not in message or 'content' not in message:
+                logger.error("Invalid message format")
+                return False
+
+            # Add timestamp and target
+            message['timestamp'] = datetime.now().isoformat()
+            message['target'] = target_interface
+
+            # Delivery happens on the bus's sender task, the caller never waits on the platform
+            queued = await self.outbound_bus.publish(target_interface, interface, message)
+            if queued:
                 logger.info(f"Message queued for {target_interface}: {message['type']}")
-                return True
-                
+            return queued
+
         except Exception as e:
             logger.error(f"Error sending message to {target_interface}: {str(e)}")
             return False
\ No newline at end of file
@@ -89,6 +89,7 @@ class ToolBox(AsyncHTTPHandler):
             logger.error(error_msg)
             return {"error": error_msg}
 
+    @staticmethod
     @tool("Get the current price of a cryptocurrency in USD")
     async def get_crypto_price(ticker: str) -> float:
         """
@@ -117,6 +118,9 @@ class ToolBox(AsyncHTTPHandler):
 
         except Exception as e:
             error_msg = f"Error getting crypto price: {str(e)}"
+            logger.error(error_msg)
+            return {"message": error_msg}
+
     @staticmethod
     @tool("Monitor token purchases and send Telegram notifications")
     async def monitor_token_purchases(pair_address: str, telegram_chat_id: str, telegram_bot_token: str) -> Dict[str, Any]:
@@ -1,13 +1,33 @@
 from typing import List, Dict, Any, Optional, Callable
+import asyncio
 import logging
+import os
 import requests
 import json
 from .tool_decorator import get_tool_schemas
 from .tool_box import ToolBox
 from .tool_decorator_example import DECORATED_TOOLS_EXAMPLES
+from core.deadline import Deadline
+from core.tracing import span
 from interfaces.xrpl_integration import create_wallet, get_account_balance, send_payment, get_transaction_history
 logger = logging.getLogger(__name__)
 
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", 30))
+# Tools that legitimately take longer than the default timeout
+TOOL_TIMEOUT_OVERRIDES = {
+    "handle_image_generation": 120,
+}
+# Tools that are skipped when a request deadline leaves less time than this
+TOOL_MIN_SECONDS = {
+    "handle_image_generation": 15,
+}
+# How failed tools are named in the note appended to the reply, others use their name
+TOOL_LABELS = {
+    "handle_image_generation": "image generation",
+}
+# Tools that produce the reply's image, only the first call of a turn runs since a reply carries one image
+IMAGE_TOOLS = {"handle_image_generation"}
+
 class XRPLAgent:
     """A class that wraps XRPL operations for agent usage."""
 
@@ -70,18 +90,103 @@ class Tools(ToolBox):
                     if tool["function"]["name"] in filter_tools]
         return all_tools
 
-    async def execute_tool(self, tool_name: str, args: Dict[str, Any], agent_context: Any) -> Optional[Dict[str, Any]]:
-        """Execute a tool by name with given arguments"""
-        if tool_name not in self.tool_handlers:
-            logger.error(f"Unknown tool: {tool_name}")
+    async def execute_tools(self, tool_calls: List[Any], agent_context: Any, timeout: Optional[float] = None, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        Execute all tool calls from one LLM turn concurrently and merge the results
+
+        Args:
+            tool_calls: Tool calls as returned by the LLM (objects with function.name/function.arguments)
+            agent_context: Agent instance passed to the tool handlers
+            timeout: Optional per-tool timeout in seconds, overrides the configured defaults
+            deadline: Optional request deadline, caps every tool's timeout and
+                skips slow tools when too little time is left
+
+        Returns:
+            Merged result with combined 'message', first 'image_url', 'tool_call' JSON
+            (an object for one call, a list for several) and the names of tools that failed or timed out in 'failed_tools', or None
+        """
+        if not tool_calls:
             return None
-        result = await self.tool_handlers[tool_name](args, agent_context)
-        result["tool_call"] = json.dumps({
-                        "tool_call": tool_name,
-                        "processed": True,
-                        "args": args,
-                        "result": result
-                    }, default=str)
-        return result
+        image_call_seen = False
+        calls = []
+        for tool_call in tool_calls:
+            if tool_call.function.name in IMAGE_TOOLS:
+                if image_call_seen:
+                    calls.append(self._refuse_tool_call(tool_call, "only one image per reply"))
+                    continue
+                image_call_seen = True
+            calls.append(self._execute_tool_call(tool_call, agent_context, timeout, deadline))
+        results = await asyncio.gather(*calls)
+        return self.merge_tool_results(results)
+
+    async def _refuse_tool_call(self, tool_call: Any, reason: str) -> Dict[str, Any]:
+        """Result of a tool call that is not run, the reason is kept in the stored call"""
+        tool_name = tool_call.function.name
+        logger.warning(f"Not running tool {tool_name}: {reason}")
+        return {"tool_call": {"tool_call": tool_name, "processed": False, "args": None, "skipped": reason}}
 
+    async def _execute_tool_call(self, tool_call: Any, agent_context: Any, timeout: Optional[float], deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Run a single tool call with a timeout, never raising"""
+        tool_name = tool_call.function.name
+        try:
+            args = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid arguments for tool {tool_name}: {str(e)}")
+            return {"error": str(e), "tool_call": {"tool_call": tool_name, "processed": False, "args": None}}
+
+        if tool_name not in self.tool_handlers:
+            # External tools are handed back to the caller unprocessed
+            logger.info(f"Tool {tool_name} not found in tools config")
+            return {"tool_call": {"tool_call": tool_name, "processed": False, "args": args}}
 
+        tool_timeout = timeout or TOOL_TIMEOUT_OVERRIDES.get(tool_name, TOOL_TIMEOUT_SECONDS)
+        if deadline is not None:
+            if not deadline.allows(TOOL_MIN_SECONDS.get(tool_name, 0)) or deadline.expired():
+                logger.warning(f"Skipping tool {tool_name}, not enough time left ({deadline})")
+                return {"error": f"{tool_name} skipped, not enough time", "tool_call": {"tool_call": tool_name, "processed": False, "args": args}}
+            tool_timeout = deadline.timeout(tool_timeout)
+        logger.info(f"Executing tool {tool_name} with args {args}")
+        try:
+            with span("tool", tool=tool_name, timeout=tool_timeout):
+                result = await asyncio.wait_for(self.tool_handlers[tool_name](args, agent_context), timeout=tool_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Tool {tool_name} timed out after {tool_timeout}s")
+            result = {"error": f"{tool_name} timed out"}
+        except Exception as e:
+            logger.error(f"Tool {tool_name} failed: {str(e)}")
+            result = {"error": str(e)}
+        if not isinstance(result, dict):
+            result = {"message": str(result)} if result is not None else {}
+        result["tool_call"] = {
+            "tool_call": tool_name,
+            "processed": True,
+            "args": args,
+            "result": dict(result)
+        }
+        return result
+
+    @staticmethod
+    def merge_tool_results(results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Merge per-tool results into a single response, keeping call order"""
+        if not results:
+            return None
+        merged = {}
+        messages = [r["message"] for r in results if r.get("message")]
+        failed = [r["tool_call"]["tool_call"] for r in results if r.get("error") and r.get("tool_call")]
+        if failed:
+            # Tell the user instead of silently leaving out what was asked for
+            merged["failed_tools"] = failed
+            labels = [TOOL_LABELS.get(name, name.replace("_", " ")) for name in failed]
+            messages.append(f"(Couldn't complete: {', '.join(labels)})")
+        image_urls = [r["image_url"] for r in results if r.get("image_url")]
+        if image_urls:
+            merged["image_url"] = image_urls[0]
+            # A reply carries one image, further ones are linked in the text
+            messages.extend(image_urls[1:])
+        if messages:
+            merged["message"] = "\n".join(messages)
+        calls = [r["tool_call"] for r in results if r.get("tool_call")]
+        if calls:
+            # A single call keeps the object shape API clients receive as tool_calls, several become a list
+            merged["tool_call"] = json.dumps(calls[0] if len(calls) == 1 else calls, default=str)
+        return merged
@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Hashable, List, Optional
+from core.llm_scheduler import TokenBucket
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Admission classes, lower value is admitted first
+ADMISSION_CHAT = 0
+ADMISSION_API = 1
+ADMISSION_SCHEDULED = 2
+ADMISSION_BACKGROUND = 3
+
+CLASS_NAMES = {
+    ADMISSION_CHAT: "chat",
+    ADMISSION_API: "api",
+    ADMISSION_SCHEDULED: "scheduled",
+    ADMISSION_BACKGROUND: "background",
+}
+
+# Interface name -> admission class, unknown sources count as direct chat
+SOURCE_CLASSES = {
+    "telegram": ADMISSION_CHAT,
+    "discord": ADMISSION_CHAT,
+    "terminal": ADMISSION_CHAT,
+    "api": ADMISSION_API,
+    "twitter": ADMISSION_SCHEDULED,
+    "farcaster": ADMISSION_SCHEDULED,
+    "twitter_reply": ADMISSION_BACKGROUND,
+    "farcaster_reply": ADMISSION_BACKGROUND,
+}
+
+# Seconds a request may wait for a slot before it is shed
+DEFAULT_MAX_WAIT = {
+    ADMISSION_CHAT: 10.0,
+    ADMISSION_API: 20.0,
+    ADMISSION_SCHEDULED: 60.0,
+    ADMISSION_BACKGROUND: 120.0,
+}
+
+OVERLOAD_REPLY = "I'm getting a lot of messages right now, try me again in a moment."
+
+def admission_class_for(source_interface: Optional[str]) -> int:
+    return SOURCE_CLASSES.get(source_interface, ADMISSION_CHAT)
+
+# Sources where the caller waits on this very request
+WAITING_SOURCES = ("api", "terminal")
+
+def shed_response(source_interface: Optional[str], addressed: bool = False) -> tuple:
+    """
+    Result returned instead of handle_message output when a request is shed.
+    Only callers known to wait on the reply get the canned text: API and
+    terminal requests, and chat messages that address the bot directly.
+    Group chatter, scheduled posts and the reply workers get nothing, so it
+    is never posted publicly and the workers can requeue the item.
+    """
+    if source_interface in WAITING_SOURCES or (addressed and admission_class_for(source_interface) == ADMISSION_CHAT):
+        return OVERLOAD_REPLY, None, None
+    return None, None, None
+
+@dataclass
+class AdmissionConfig:
+    """Limits for the admission controller"""
+    max_in_flight: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 8))
+    queue_limit: int = int(os.getenv("ADMISSION_QUEUE_LIMIT", 32))
+    max_wait: Dict[int, float] = field(default_factory=lambda: dict(DEFAULT_MAX_WAIT))
+    # Per-chat limits, a chat is (source_interface, conversation id)
+    chat_max_in_flight: int = int(os.getenv("ADMISSION_CHAT_MAX_IN_FLIGHT", 2))
+    chat_queue_limit: int = int(os.getenv("ADMISSION_CHAT_QUEUE_LIMIT", 8))
+    chat_rate_per_minute: float = float(os.getenv("ADMISSION_CHAT_RATE_PER_MINUTE", 20))
+    chat_burst: int = int(os.getenv("ADMISSION_CHAT_BURST", 5))
+    quantum: float = 1.0
+    max_idle_flows: int = 1000
+
+class _Waiter:
+    __slots__ = ("future", "loop", "enqueued_at", "granted", "cost")
+
+    def __init__(self, future: asyncio.Future, loop: asyncio.AbstractEventLoop, cost: float):
+        self.future = future
+        self.loop = loop
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cost = cost
+
+class _Flow:
+    """Waiters, in-flight count, DRR deficit and rate bucket of one chat"""
+
+    def __init__(self, admission_class: int, config: AdmissionConfig):
+        self.admission_class = admission_class
+        self.waiters: Deque[_Waiter] = deque()
+        self.in_flight = 0
+        self.deficit = 0.0
+        self.bucket = None
+        if config.chat_rate_per_minute > 0:
+            self.bucket = TokenBucket(max(1, config.chat_burst), config.chat_rate_per_minute / 60.0)
+
+    def rate_wait(self, now: float) -> float:
+        return self.bucket.wait_time(1, now) if self.bucket else 0.0
+
+    def idle(self, now: float) -> bool:
+        return not self.waiters and self.in_flight == 0 and (
+            self.bucket is None or self.bucket.wait_time(self.bucket.capacity, now) == 0
+        )
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+class AdmissionController:
+    """
+    Caps concurrent handle_message calls across all interfaces.
+
+    Requests beyond `max_in_flight` wait in a bounded queue per admission
+    class; free slots always go to the highest class with an eligible waiter.
+    Within a class, chats (source interface + conversation id) are served by
+    deficit round-robin, and each chat is limited in concurrency and request
+    rate, so a noisy chat is throttled while quiet chats keep their latency.
+    Requests are shed when their queue is full or their class's wait deadline
+    passes. Safe to use from several threads and event loops at once.
+    """
+
+    def __init__(self, config: AdmissionConfig = None):
+        self.config = config or AdmissionConfig()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._flows: Dict[Hashable, _Flow] = {}
+        # Round-robin ring of flow keys with waiters, per class
+        self._rings: Dict[int, Deque[Hashable]] = {c: deque() for c in CLASS_NAMES}
+        self._depth: Dict[int, int] = {c: 0 for c in CLASS_NAMES}
+        self._timer: Optional[threading.Timer] = None
+        self._timer_due = 0.0
+        self._stats = {
+            c: {"admitted": 0, "shed_queue_full": 0, "shed_chat_limit": 0, "shed_deadline": 0, "wait_seconds": 0.0}
+            for c in CLASS_NAMES
+        }
+
+    async def acquire(self, admission_class: int, flow_key: Hashable = None, cost: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a processing slot.
+
+        Args:
+            admission_class: One of the ADMISSION_* classes
+            flow_key: Chat the request belongs to, e.g. (source_interface, chat_id)
+            cost: Relative cost of the request for deficit round-robin
+            timeout: Optional cap on the class's wait deadline, e.g. the time
+                left before the request's own deadline
+
+        Returns:
+            bool: True once admitted (call release() with the same flow_key
+            when done), False if shed
+        """
+        loop = asyncio.get_running_loop()
+        flow_key = (admission_class, flow_key)
+        waiter = _Waiter(loop.create_future(), loop, cost)
+        with self._lock:
+            if self._depth[admission_class] >= self.config.queue_limit:
+                self._stats[admission_class]["shed_queue_full"] += 1
+                logger.warning(f"Admission queue for {CLASS_NAMES[admission_class]} full, shedding request")
+                return False
+            flow = self._flows.get(flow_key)
+            if flow is None:
+                flow = self._flows[flow_key] = _Flow(admission_class, self.config)
+            if len(flow.waiters) >= self.config.chat_queue_limit:
+                self._stats[admission_class]["shed_chat_limit"] += 1
+                logger.warning(f"Too many queued requests for {flow_key[1]}, shedding request")
+                return False
+            if not flow.waiters:
+                self._rings[admission_class].append(flow_key)
+            flow.waiters.append(waiter)
+            self._depth[admission_class] += 1
+            granted = self._dispatch()
+        self._wake(w for w in granted if w is not waiter)
+        if waiter.granted:
+            return True
+
+        max_wait = self.config.max_wait.get(admission_class, DEFAULT_MAX_WAIT[ADMISSION_CHAT])
+        if timeout is not None:
+            max_wait = min(max_wait, timeout)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not waiter.granted:
+                    self._remove(flow_key, flow, waiter)
+                    self._stats[admission_class]["shed_deadline"] += 1
+                    logger.warning(f"{CLASS_NAMES[admission_class]} request waited {max_wait}s for a slot, shedding")
+                    return False
+            # The slot was handed over while the timeout fired, keep it
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.granted:
+                    self._remove(flow_key, flow, waiter)
+                    raise
+            self.release(admission_class, flow_key[1])
+            raise
+
+        with self._lock:
+            self._stats[admission_class]["wait_seconds"] += time.monotonic() - waiter.enqueued_at
+        return True
+
+    def release(self, admission_class: int, flow_key: Hashable = None):
+        """Free a slot and hand free capacity to the next eligible waiters"""
+        with self._lock:
+            self._in_flight -= 1
+            flow = self._flows.get((admission_class, flow_key))
+            if flow is not None:
+                flow.in_flight -= 1
+            granted = self._dispatch()
+        self._wake(granted)
+
+    def _remove(self, flow_key: Hashable, flow: _Flow, waiter: _Waiter):
+        flow.waiters.remove(waiter)
+        self._depth[flow.admission_class] -= 1
+        if not flow.waiters:
+            flow.deficit = 0.0
+            self._rings[flow.admission_class].remove(flow_key)
+
+    def _wake(self, waiters):
+        lost = 0
+        for waiter in waiters:
+            try:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            except RuntimeError:
+                # The waiter's loop is gone, its slot goes back to the pool
+                lost += 1
+        if lost:
+            with self._lock:
+                self._in_flight -= lost
+                granted = self._dispatch()
+            self._wake(granted)
+
+    def _dispatch(self) -> List[_Waiter]:
+        """Grant free slots. Caller holds the lock and wakes the returned waiters."""
+        granted = []
+        now = time.monotonic()
+        rate_wait = None
+        while self._in_flight < self.config.max_in_flight:
+            waiter = None
+            for admission_class in sorted(self._rings):
+                waiter, wait = self._pick(admission_class, now)
+                if wait is not None:
+                    rate_wait = wait if rate_wait is None else min(rate_wait, wait)
+                if waiter is not None:
+                    break
+            if waiter is None:
+                break
+            waiter.granted = True
+            self._in_flight += 1
+            granted.append(waiter)
+
+        if rate_wait is not None and self._in_flight < self.config.max_in_flight:
+            self._schedule(now, rate_wait)
+        if len(self._flows) > self.config.max_idle_flows:
+            for key in [k for k, f in self._flows.items() if f.idle(now)]:
+                del self._flows[key]
+        return granted
+
+    def _pick(self, admission_class: int, now: float):
+        """
+        Next waiter of a class by deficit round-robin over its chats.
+
+        Returns:
+            (waiter or None, seconds until a rate-limited chat may run or None)
+        """
+        ring = self._rings[admission_class]
+        rate_wait = None
+        eligible = 0
+        for key in ring:
+            flow = self._flows[key]
+            if flow.in_flight >= self.config.chat_max_in_flight:
+                continue
+            wait = flow.rate_wait(now)
+            if wait > 0:
+                rate_wait = wait if rate_wait is None else min(rate_wait, wait)
+                continue
+            eligible += 1
+        if not eligible:
+            return None, rate_wait
+
+        while True:
+            key = ring[0]
+            flow = self._flows[key]
+            if flow.in_flight >= self.config.chat_max_in_flight or flow.rate_wait(now) > 0:
+                ring.rotate(-1)
+                continue
+            waiter = flow.waiters[0]
+            if flow.deficit < waiter.cost:
+                flow.deficit += self.config.quantum
+                ring.rotate(-1)
+                continue
+            flow.waiters.popleft()
+            flow.deficit -= waiter.cost
+            flow.in_flight += 1
+            if flow.bucket:
+                flow.bucket.consume(1)
+            self._depth[admission_class] -= 1
+            self._stats[admission_class]["admitted"] += 1
+            if not flow.waiters:
+                flow.deficit = 0.0
+                ring.popleft()
+            elif flow.deficit < flow.waiters[0].cost:
+                ring.rotate(-1)
+            return waiter, rate_wait
+
+    def _schedule(self, now: float, delay: float):
+        """Re-run dispatch when a rate-limited chat gets its next token"""
+        due = now + delay
+        if self._timer is not None and self._timer.is_alive() and self._timer_due <= due:
+            return
+        self._timer_due = due
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            granted = self._dispatch()
+        self._wake(granted)
+
+    def get_stats(self) -> Dict[str, object]:
+        """In-flight count plus queue depth, admissions and sheds per class"""
+        with self._lock:
+            active = {c: len(self._rings[c]) for c in CLASS_NAMES}
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.config.max_in_flight,
+                "chats": len(self._flows),
+                "classes": {
+                    CLASS_NAMES[c]: dict(self._stats[c], queued=self._depth[c], waiting_chats=active[c])
+                    for c in CLASS_NAMES
+                }
+            }
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
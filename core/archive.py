@@ -0,0 +1,111 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REPLY_ARCHIVE_DIR = os.getenv("REPLY_ARCHIVE_DIR", "reply_archive")
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+class ReplyArchive:
+    """
+    Append-only archive of finished queue items, one gzip-compressed JSONL
+    file per queue and UTC day: <archive_dir>/<queue>/<YYYY-MM-DD>.jsonl.gz.
+
+    Each append writes a new gzip member, which gzip readers treat as one
+    continuous stream, so files are never rewritten.
+    """
+
+    def __init__(self, archive_dir: str = None):
+        self.archive_dir = Path(archive_dir or REPLY_ARCHIVE_DIR)
+
+    def append(self, queue: str, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Append records, partitioned by their `completed_at` day.
+
+        Returns:
+            int: Number of records written
+        """
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_day.setdefault(_day(record.get("completed_at") or record["enqueued_at"]), []).append(record)
+        queue_dir = self.archive_dir / queue
+        queue_dir.mkdir(parents=True, exist_ok=True)
+        for day, day_records in by_day.items():
+            with gzip.open(queue_dir / f"{day}.jsonl.gz", "at", encoding="utf-8") as f:
+                for record in day_records:
+                    f.write(json.dumps(record, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return sum(len(r) for r in by_day.values())
+
+    def files(self, queue: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None) -> List[Path]:
+        """Archive files in date order, optionally of one queue and within [since, until] (YYYY-MM-DD)"""
+        pattern = f"{queue}/*.jsonl.gz" if queue else "*/*.jsonl.gz"
+        files = []
+        for path in self.archive_dir.glob(pattern):
+            day = path.name[:10]
+            if (since and day < since) or (until and day > until):
+                continue
+            files.append(path)
+        return sorted(files, key=lambda p: (p.name, p.parent.name))
+
+    def search(
+        self,
+        queue: Optional[str] = None,
+        item_id: Optional[str] = None,
+        text: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream archived records matching all given filters.
+
+        Args:
+            queue: Queue name, e.g. twitter_reply
+            item_id: Exact tweet id or cast hash
+            text: Case-insensitive substring of the payload or result
+            since: First day to search, YYYY-MM-DD
+            until: Last day to search, YYYY-MM-DD
+        """
+        needle = text.lower() if text else None
+        for path in self.files(queue, since, until):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if item_id and f'"{item_id}"' not in line:
+                        continue
+                    if needle and needle not in line.lower():
+                        continue
+                    record = json.loads(line)
+                    if item_id and record.get("item_id") != item_id:
+                        continue
+                    yield record
+
+def main():
+    parser = argparse.ArgumentParser(description="Search archived reply queue items")
+    parser.add_argument("--dir", default=None, help=f"Archive directory (default {REPLY_ARCHIVE_DIR})")
+    parser.add_argument("--queue", help="Queue name, e.g. twitter_reply or farcaster_reply")
+    parser.add_argument("--id", dest="item_id", help="Tweet id or cast hash")
+    parser.add_argument("--text", help="Substring to look for in the message or response")
+    parser.add_argument("--since", help="First day, YYYY-MM-DD")
+    parser.add_argument("--until", help="Last day, YYYY-MM-DD")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of records to print")
+    args = parser.parse_args()
+
+    archive = ReplyArchive(args.dir)
+    for i, record in enumerate(archive.search(args.queue, args.item_id, args.text, args.since, args.until)):
+        if i >= args.limit:
+            break
+        print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import logging
+import threading
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
+import numpy as np
+from utils.token_utils import count_tokens
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CONTEXT_HEADER = "\n\nRelated previous conversations and responses\nNOTE: Please provide a response that differs from these recent replies, don't use the same words:\n"
+CONTEXT_FOOTER = "\nConsider the above responses for context, but provide a fresh perspective that adds value to the conversation, don't repeat the same responses.\n"
+
+@dataclass
+class ContextConfig:
+    """Configuration for similar-conversation context packing"""
+    token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+    mmr_lambda: float = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))
+    max_pairs: int = 60
+
+@dataclass
+class ContextResult:
+    """Packed context and its token accounting"""
+    text: str = ""
+    pairs_selected: int = 0
+    pairs_considered: int = 0
+    tokens_used: int = 0
+    tokens_unpacked: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_unpacked - self.tokens_used)
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def _format_pair(question: str, response: str, similarity: float) -> str:
+    return (
+        f"\nPrevious similar question: {question}"
+        f"\nMy response: {response}"
+        f"\nSimilarity score: {similarity:.2f}\n"
+    )
+
+class ContextBuilder:
+    """
+    Builds the "related previous conversations" block of the system prompt.
+
+    Candidate question/response pairs are deduplicated and then picked with
+    maximal marginal relevance (MMR) over the stored question embeddings, so
+    the context stays diverse, until the token budget is used up.
+    """
+
+    def __init__(self, message_store, config: ContextConfig = None):
+        self.message_store = message_store
+        self.config = config or ContextConfig()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "tokens_used": 0, "tokens_saved": 0}
+
+    def build(self, similar_messages: List[Dict[str, Any]], token_budget: Optional[int] = None) -> ContextResult:
+        """
+        Build the context block from similar messages.
+
+        Args:
+            similar_messages: Results of MessageStore.find_similar_messages
+            token_budget: Optional override of the configured token budget
+
+        Returns:
+            ContextResult: Packed context text with token accounting
+        """
+        if not similar_messages:
+            return ContextResult()
+
+        budget = token_budget if token_budget is not None else self.config.token_budget
+        candidates = self._collect_candidates(similar_messages)
+        if not candidates:
+            return ContextResult()
+
+        frame_tokens = count_tokens(CONTEXT_HEADER) + count_tokens(CONTEXT_FOOTER)
+        unpacked = frame_tokens + sum(c["tokens"] for c in candidates)
+        selected = self._select_mmr(candidates, budget - frame_tokens)
+
+        result = ContextResult(
+            pairs_considered=len(candidates),
+            pairs_selected=len(selected),
+            tokens_unpacked=unpacked
+        )
+        if selected:
+            result.text = CONTEXT_HEADER + "".join(c["text"] for c in selected) + CONTEXT_FOOTER
+            result.tokens_used = frame_tokens + sum(c["tokens"] for c in selected)
+
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["tokens_used"] += result.tokens_used
+            self._stats["tokens_saved"] += result.tokens_saved
+
+        logger.info(
+            f"Packed {result.pairs_selected}/{result.pairs_considered} similar pairs "
+            f"into {result.tokens_used} tokens (saved {result.tokens_saved} prompt tokens)"
+        )
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        """Cumulative token accounting across all built contexts"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _collect_candidates(self, similar_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Look up agent responses for each similar question, dropping duplicates"""
+        candidates = []
+        seen_questions = set()
+        seen_responses = set()
+
+        for similar_msg in similar_messages:
+            question = similar_msg["message"]
+            question_key = _normalize(question)
+            if question_key in seen_questions:
+                continue
+            seen_questions.add(question_key)
+
+            agent_responses = self.message_store.find_messages(
+                message_type='agent_response',
+                original_query=question
+            )
+            for response in agent_responses:
+                response_key = _normalize(response['message'] or "")
+                if not response_key or response_key in seen_responses:
+                    continue
+                seen_responses.add(response_key)
+
+                similarity = float(similar_msg.get('similarity', 0))
+                text = _format_pair(question, response['message'], similarity)
+                candidates.append({
+                    "text": text,
+                    "tokens": count_tokens(text),
+                    "similarity": similarity,
+                    "embedding": similar_msg.get('embedding')
+                })
+                if len(candidates) >= self.config.max_pairs:
+                    return candidates
+        return candidates
+
+    def _select_mmr(self, candidates: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+        """Greedy MMR selection of candidates that fit in the token budget"""
+        lam = self.config.mmr_lambda
+        vectors = []
+        for candidate in candidates:
+            vector = None
+            if candidate["embedding"] is not None:
+                vector = np.asarray(candidate["embedding"], dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm else None
+            vectors.append(vector)
+
+        remaining = list(range(len(candidates)))
+        selected = []
+        redundancy = [0.0] * len(candidates)
+
+        while remaining and budget > 0:
+            fitting = [i for i in remaining if candidates[i]["tokens"] <= budget]
+            if not fitting:
+                break
+            best = max(fitting, key=lambda i: lam * candidates[i]["similarity"] - (1 - lam) * redundancy[i])
+            selected.append(candidates[best])
+            budget -= candidates[best]["tokens"]
+            remaining.remove(best)
+
+            # Update each remaining candidate's max similarity to the selected set
+            if vectors[best] is not None:
+                for i in remaining:
+                    if vectors[i] is not None:
+                        redundancy[i] = max(redundancy[i], float(vectors[i] @ vectors[best]))
+
+        return selected
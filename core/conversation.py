@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+from utils.token_utils import count_tokens
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MEMORY_HEADER = "\n\nThe conversation so far in this chat:\n"
+SUMMARY_LABEL = "Summary of earlier messages: "
+
+@dataclass
+class ConversationConfig:
+    """Configuration for per-chat rolling memory"""
+    # Verbatim turns beyond this many tokens are folded into the summary
+    token_threshold: int = int(os.getenv("CONVERSATION_TOKEN_THRESHOLD", 600))
+    max_turns: int = int(os.getenv("CONVERSATION_MAX_TURNS", 16))
+    keep_recent: int = int(os.getenv("CONVERSATION_KEEP_RECENT", 4))
+    summary_max_tokens: int = 200
+    max_chats: int = 2000
+
+class _Chat:
+    """Recent turns and rolling summary of one chat"""
+
+    def __init__(self, max_turns: int, summary: str = "", turns: List[Dict[str, Any]] = None):
+        self.summary = summary
+        self.turns: Deque[Dict[str, Any]] = deque(turns or [], maxlen=max_turns)
+        self.folding = False
+
+    def turn_tokens(self) -> int:
+        return sum(count_tokens(t["text"]) for t in self.turns)
+
+def _format_turns(turns) -> str:
+    return "\n".join(f"{t['speaker']}: {t['text']}" for t in turns)
+
+class ConversationMemory:
+    """
+    Per-chat ring buffer of recent turns with an incrementally updated summary.
+
+    Once the verbatim turns of a chat exceed `token_threshold` tokens (or the
+    ring is full), everything but the last `keep_recent` turns is folded into
+    the chat's rolling summary by `summarize_fn` in the background, so the
+    memory block in the prompt stays roughly constant in size however long
+    the conversation runs. Memory is persisted through the message store and
+    loaded lazily; at most `max_chats` chats are kept in process.
+    """
+
+    def __init__(
+        self,
+        message_store,
+        summarize_fn: Callable[[str, str, int], Awaitable[str]],
+        config: ConversationConfig = None
+    ):
+        self.message_store = message_store
+        self.summarize_fn = summarize_fn
+        self.config = config or ConversationConfig()
+        self._chats: "OrderedDict[Tuple[str, str], _Chat]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self._stats = {"turns": 0, "folds": 0, "fold_failures": 0, "loads": 0}
+
+    def _get_chat(self, source_interface: str, chat_id: str) -> _Chat:
+        """Cached chat memory, loaded from the store on first use. Blocking."""
+        key = (source_interface, str(chat_id))
+        with self._lock:
+            chat = self._chats.get(key)
+            if chat is not None:
+                self._chats.move_to_end(key)
+                return chat
+
+        stored = None
+        try:
+            stored = self.message_store.load_conversation(*key)
+        except Exception as e:
+            logger.warning(f"Failed to load conversation memory for {key}: {str(e)}")
+
+        with self._lock:
+            chat = self._chats.get(key)
+            if chat is None:
+                if stored:
+                    chat = _Chat(self.config.max_turns, stored.get("summary", ""), stored.get("turns", []))
+                    self._stats["loads"] += 1
+                else:
+                    chat = _Chat(self.config.max_turns)
+                self._chats[key] = chat
+                while len(self._chats) > self.config.max_chats:
+                    self._chats.popitem(last=False)
+            return chat
+
+    def has_history(self, source_interface: str, chat_id: str) -> bool:
+        """Whether anything is remembered for the chat. Blocking."""
+        chat = self._get_chat(source_interface, chat_id)
+        with self._lock:
+            return bool(chat.summary or chat.turns)
+
+    def get_context(self, source_interface: str, chat_id: str) -> str:
+        """
+        Prompt block with the chat's summary and recent turns. Blocking.
+
+        Returns:
+            str: Memory block, empty if nothing is remembered for the chat
+        """
+        chat = self._get_chat(source_interface, chat_id)
+        with self._lock:
+            summary = chat.summary
+            turns = list(chat.turns)
+        if not summary and not turns:
+            return ""
+        parts = []
+        if summary:
+            parts.append(SUMMARY_LABEL + summary)
+        if turns:
+            parts.append(_format_turns(turns))
+        return MEMORY_HEADER + "\n".join(parts) + "\n"
+
+    async def add_turns(self, source_interface: str, chat_id: str, turns: List[Tuple[str, str]], wait: bool = False):
+        """
+        Append turns to a chat, persist it and fold old turns if needed.
+
+        Args:
+            source_interface: Interface the chat belongs to
+            chat_id: Chat or thread identifier
+            turns: (speaker, text) pairs in chronological order
+            wait: Fold before returning instead of in the background, used
+                when seeding a chat from an existing thread
+        """
+        chat = await asyncio.to_thread(self._get_chat, source_interface, chat_id)
+        now = datetime.now().isoformat()
+        with self._lock:
+            for speaker, text in turns:
+                if text:
+                    chat.turns.append({"speaker": speaker, "text": text, "timestamp": now})
+                    self._stats["turns"] += 1
+            needs_fold = not chat.folding and len(chat.turns) > self.config.keep_recent and (
+                chat.turn_tokens() > self.config.token_threshold or len(chat.turns) == chat.turns.maxlen
+            )
+            if needs_fold:
+                chat.folding = True
+        await asyncio.to_thread(self._persist, source_interface, chat_id, chat)
+        if needs_fold and wait:
+            await self._fold(source_interface, chat_id, chat)
+        elif needs_fold:
+            task = asyncio.ensure_future(self._fold(source_interface, chat_id, chat))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, source_interface: str, chat_id: str, chat: _Chat):
+        """Summarize everything but the most recent turns into the rolling summary"""
+        try:
+            with self._lock:
+                folded = list(chat.turns)[:-self.config.keep_recent]
+                previous = chat.summary
+            summary = await self.summarize_fn(previous, _format_turns(folded), self.config.summary_max_tokens)
+            if not summary:
+                raise ValueError("empty summary")
+            with self._lock:
+                # Only drop turns that are still at the head of the ring
+                for turn in folded:
+                    if chat.turns and chat.turns[0] is turn:
+                        chat.turns.popleft()
+                chat.summary = summary.strip()
+                self._stats["folds"] += 1
+            await asyncio.to_thread(self._persist, source_interface, chat_id, chat)
+            logger.info(f"Folded {len(folded)} turns of {source_interface}/{chat_id} into the summary")
+        except Exception as e:
+            with self._lock:
+                self._stats["fold_failures"] += 1
+            logger.warning(f"Failed to summarize conversation {source_interface}/{chat_id}: {str(e)}")
+        finally:
+            with self._lock:
+                chat.folding = False
+
+    def _persist(self, source_interface: str, chat_id: str, chat: _Chat):
+        with self._lock:
+            summary = chat.summary
+            turns = list(chat.turns)
+        try:
+            self.message_store.save_conversation(source_interface, str(chat_id), summary, turns)
+        except Exception as e:
+            logger.warning(f"Failed to persist conversation memory: {str(e)}")
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, chats=len(self._chats))
@@ -0,0 +1,76 @@
+import logging
+import os
+import time
+from typing import Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds a user waits for a reply before the request is considered lost
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 30))
+API_REQUEST_DEADLINE_SECONDS = float(os.getenv("API_REQUEST_DEADLINE_SECONDS", 60))
+CHAT_SOURCES = ["telegram", "discord", "terminal"]
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has no time left for the next step"""
+    pass
+
+class Deadline:
+    """
+    Request-scoped time budget.
+
+    Created once by the interface that received the message and passed down
+    explicitly, so every stage can size its timeouts and retries to what is
+    left instead of applying its own fixed budget. A deadline without a time
+    limit never expires and leaves all defaults untouched.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> 'Deadline':
+        return cls(seconds)
+
+    @classmethod
+    def unbounded(cls) -> 'Deadline':
+        return cls(None)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a limit"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def allows(self, seconds: float) -> bool:
+        """Whether at least `seconds` are left"""
+        remaining = self.remaining()
+        return remaining is None or remaining >= seconds
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """Timeout for the next call: the default capped at what is left"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    def check(self, step: str):
+        """Raise DeadlineExceeded if the budget is used up before `step`"""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {step}")
+
+    def __repr__(self) -> str:
+        remaining = self.remaining()
+        return "Deadline(unbounded)" if remaining is None else f"Deadline({remaining:.1f}s left)"
+
+def request_deadline(source_interface: Optional[str]) -> Deadline:
+    """Default deadline for a message received by an interface"""
+    if source_interface in CHAT_SOURCES:
+        return Deadline.after(REQUEST_DEADLINE_SECONDS)
+    if source_interface == "api":
+        return Deadline.after(API_REQUEST_DEADLINE_SECONDS)
+    return Deadline.unbounded()
@@ -11,6 +11,9 @@ from psycopg2.extras import execute_values
 from dataclasses import dataclass
 import sqlite3
 import json
+import threading
+from core.tracing import span
+from core.metrics import EMBEDDING_SECONDS, VECTOR_SEARCH_SECONDS
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -78,10 +81,22 @@ class VectorStorageProvider(ABC):
         """Clean up resources"""
         pass
 
+    @abstractmethod
+    def load_conversation(self, source_interface: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        """Load the rolling summary and recent turns of a chat"""
+        pass
+
+    @abstractmethod
+    def save_conversation(self, source_interface: str, chat_id: str, summary: str, turns: List[Dict[str, Any]]) -> None:
+        """Replace the rolling summary and recent turns of a chat"""
+        pass
+
 class PostgresVectorStorage(VectorStorageProvider):
     def __init__(self, config: PostgresConfig):
         self.config = config
         self.conn = None
+        # Stages of handle_message query the store from worker threads
+        self._lock = threading.Lock()
         
     def initialize(self) -> None:
         """Initialize PostgreSQL connection and create necessary tables"""
@@ -94,7 +109,7 @@ class PostgresVectorStorage(VectorStorageProvider):
                 password=self.config.password
             )
             
-            with self.conn.cursor() as cur:
+            with self._lock, self.conn.cursor() as cur:
                 # Enable pgvector extension
                 cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
                 
@@ -125,6 +140,18 @@ class PostgresVectorStorage(VectorStorageProvider):
                     ON {self.config.table_name} 
                     USING ivfflat (embedding vector_cosine_ops)
                 """)
+
+                # Rolling conversation memory, one row per chat
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {self.config.table_name}_conversations (
+                        source_interface VARCHAR(50) NOT NULL,
+                        chat_id VARCHAR(100) NOT NULL,
+                        summary TEXT NOT NULL DEFAULT '',
+                        turns JSONB NOT NULL DEFAULT '[]',
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (source_interface, chat_id)
+                    )
+                """)
                 
             self.conn.commit()
         except Exception as e:
@@ -134,7 +161,7 @@ class PostgresVectorStorage(VectorStorageProvider):
     def store_embedding(self, message_data: MessageData) -> None:
         """Store a message and its embedding in PostgreSQL"""
         try:
-            with self.conn.cursor() as cur:
+            with self._lock, self.conn.cursor() as cur:
                 cur.execute(
                     f"""INSERT INTO {self.config.table_name} 
                     (message, embedding, timestamp, message_type, chat_id,
@@ -156,19 +183,20 @@ class PostgresVectorStorage(VectorStorageProvider):
     def find_similar(self, embedding: List[float], threshold: float = 0.8) -> List[Dict[str, Any]]:
         """Find similar messages using vector similarity search"""
         try:
-            with self.conn.cursor() as cur:
+            with self._lock, self.conn.cursor() as cur:
                 cur.execute(f"""
-                    SELECT message, 1 - (embedding <=> %s::vector) as similarity
+                    SELECT message, embedding::text, 1 - (embedding <=> %s::vector) as similarity
                     FROM {self.config.table_name}
                     WHERE 1 - (embedding <=> %s::vector) >= %s
                     ORDER BY similarity DESC
                 """, (embedding, embedding, threshold))
                 
                 results = []
-                for message, similarity in cur.fetchall():
+                for message, embedding_text, similarity in cur.fetchall():
                     results.append({
                         'message': message,
-                        'similarity': similarity
+                        'similarity': similarity,
+                        'embedding': json.loads(embedding_text) if embedding_text else None
                     })
                 return results
         except Exception as e:
@@ -183,38 +211,74 @@ class PostgresVectorStorage(VectorStorageProvider):
     def find_messages(self, message_type: str, original_query: str) -> List[Dict[str, Any]]:
         """Find messages matching the given type and original query"""
         try:
-            with self.conn.cursor() as cur:
+            with self._lock, self.conn.cursor() as cur:
                 cur.execute(f"""
-                    SELECT message, timestamp, source_interface, response_type, key_topics
+                    SELECT message, timestamp, source_interface, response_type, key_topics, tool_call
                     FROM {self.config.table_name}
                     WHERE message_type = %s AND original_query = %s
                     ORDER BY timestamp DESC
                 """, (message_type, original_query))
                 
                 results = []
-                for message, timestamp, source_interface, response_type, key_topics in cur.fetchall():
+                for message, timestamp, source_interface, response_type, key_topics, tool_call in cur.fetchall():
                     results.append({
                         'message': message,
                         'timestamp': timestamp,
                         'source_interface': source_interface,
                         'response_type': response_type,
-                        'key_topics': key_topics
+                        'key_topics': key_topics,
+                        'tool_call': tool_call
                     })
                 return results
         except Exception as e:
             logger.error(f"Failed to find messages: {str(e)}")
             raise
 
+    def load_conversation(self, source_interface: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        """Load the rolling summary and recent turns of a chat"""
+        try:
+            with self._lock, self.conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT summary, turns::text
+                    FROM {self.config.table_name}_conversations
+                    WHERE source_interface = %s AND chat_id = %s
+                """, (source_interface, chat_id))
+                row = cur.fetchone()
+            if row is None:
+                return None
+            return {'summary': row[0], 'turns': json.loads(row[1])}
+        except Exception as e:
+            logger.error(f"Failed to load conversation: {str(e)}")
+            raise
+
+    def save_conversation(self, source_interface: str, chat_id: str, summary: str, turns: List[Dict[str, Any]]) -> None:
+        """Replace the rolling summary and recent turns of a chat"""
+        try:
+            with self._lock, self.conn.cursor() as cur:
+                cur.execute(f"""
+                    INSERT INTO {self.config.table_name}_conversations
+                    (source_interface, chat_id, summary, turns, updated_at)
+                    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (source_interface, chat_id)
+                    DO UPDATE SET summary = EXCLUDED.summary, turns = EXCLUDED.turns, updated_at = CURRENT_TIMESTAMP
+                """, (source_interface, chat_id, summary, json.dumps(turns)))
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Failed to save conversation: {str(e)}")
+            raise
+
 class SQLiteVectorStorage(VectorStorageProvider):
     def __init__(self, config: SQLiteConfig):
         self.config = config
         self.conn = None
+        # Stages of handle_message query the store from worker threads
+        self._lock = threading.Lock()
         
     def initialize(self) -> None:
         """Initialize SQLite connection and create necessary tables"""
         try:
             self.conn = sqlite3.connect(self.config.db_path, check_same_thread=False)
-            with self.conn:
+            with self._lock, self.conn:
                 cur = self.conn.cursor()
                 cur.execute(f"""
                     CREATE TABLE IF NOT EXISTS {self.config.table_name} (
@@ -233,6 +297,17 @@ class SQLiteVectorStorage(VectorStorageProvider):
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 """)
+                # Rolling conversation memory, one row per chat
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {self.config.table_name}_conversations (
+                        source_interface TEXT NOT NULL,
+                        chat_id TEXT NOT NULL,
+                        summary TEXT NOT NULL DEFAULT '',
+                        turns TEXT NOT NULL DEFAULT '[]',
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (source_interface, chat_id)
+                    )
+                """)
             logger.info(f"Initialized SQLite storage at {self.config.db_path}")
         except Exception as e:
             logger.error(f"Failed to initialize SQLite storage: {str(e)}")
@@ -245,7 +320,7 @@ class SQLiteVectorStorage(VectorStorageProvider):
             original_embedding_json = json.dumps(message_data.original_embedding) if message_data.original_embedding else None
             key_topics_json = json.dumps(message_data.key_topics) if message_data.key_topics else None
             
-            with self.conn:
+            with self._lock, self.conn:
                 self.conn.execute(
                     f"""INSERT INTO {self.config.table_name}
                     (message, embedding, timestamp, message_type, chat_id,
@@ -264,7 +339,7 @@ class SQLiteVectorStorage(VectorStorageProvider):
     def find_similar(self, embedding: List[float], threshold: float = 0.8) -> List[Dict[str, Any]]:
         """Find similar messages using cosine similarity"""
         try:
-            with self.conn:
+            with self._lock, self.conn:
                 cur = self.conn.cursor()
                 cur.execute(f"SELECT message, embedding FROM {self.config.table_name}")
                 results = []
@@ -274,7 +349,8 @@ class SQLiteVectorStorage(VectorStorageProvider):
                     if similarity >= threshold:
                         results.append({
                             'message': message,
-                            'similarity': similarity
+                            'similarity': similarity,
+                            'embedding': stored_embedding
                         })
                 results.sort(key=lambda x: x['similarity'], reverse=True)
                 return results
@@ -290,37 +366,68 @@ class SQLiteVectorStorage(VectorStorageProvider):
     def find_messages(self, message_type: str, original_query: str) -> List[Dict[str, Any]]:
         """Find messages matching the given type and original query"""
         try:
-            with self.conn:
+            with self._lock, self.conn:
                 cur = self.conn.cursor()
                 cur.execute(f"""
-                    SELECT message, timestamp, source_interface, response_type, key_topics
+                    SELECT message, timestamp, source_interface, response_type, key_topics, tool_call
                     FROM {self.config.table_name}
                     WHERE message_type = ? AND original_query = ?
                     ORDER BY timestamp DESC
                 """, (message_type, original_query))
                 
                 results = []
-                for message, timestamp, source_interface, response_type, key_topics in cur.fetchall():
+                for message, timestamp, source_interface, response_type, key_topics, tool_call in cur.fetchall():
                     key_topics_list = json.loads(key_topics) if key_topics else None
                     results.append({
                         'message': message,
                         'timestamp': timestamp,
                         'source_interface': source_interface,
                         'response_type': response_type,
-                        'key_topics': key_topics_list
+                        'key_topics': key_topics_list,
+                        'tool_call': tool_call
                     })
                 return results
         except Exception as e:
             logger.error(f"Failed to find messages: {str(e)}")
             raise
 
-def get_embedding(text: str, model: str = "BAAI/bge-large-en-v1.5") -> list:
+    def load_conversation(self, source_interface: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        """Load the rolling summary and recent turns of a chat"""
+        try:
+            with self._lock, self.conn:
+                row = self.conn.execute(f"""
+                    SELECT summary, turns
+                    FROM {self.config.table_name}_conversations
+                    WHERE source_interface = ? AND chat_id = ?
+                """, (source_interface, chat_id)).fetchone()
+            if row is None:
+                return None
+            return {'summary': row[0], 'turns': json.loads(row[1])}
+        except Exception as e:
+            logger.error(f"Failed to load conversation: {str(e)}")
+            raise
+
+    def save_conversation(self, source_interface: str, chat_id: str, summary: str, turns: List[Dict[str, Any]]) -> None:
+        """Replace the rolling summary and recent turns of a chat"""
+        try:
+            with self._lock, self.conn:
+                self.conn.execute(f"""
+                    INSERT OR REPLACE INTO {self.config.table_name}_conversations
+                    (source_interface, chat_id, summary, turns, updated_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                """, (source_interface, chat_id, summary, json.dumps(turns)))
+        except Exception as e:
+            logger.error(f"Failed to save conversation: {str(e)}")
+            raise
+
+def get_embedding(text: str, model: str = "BAAI/bge-large-en-v1.5", timeout: Optional[float] = None) -> list:
     """
     Generate an embedding for the given text using Heurist's API.
     
     Args:
         text (str): The text to generate an embedding for
         model (str): The model to use for embedding generation (default is kept for compatibility)
+        timeout (float): Optional request timeout in seconds, e.g. the time left before a deadline
         
     Returns:
         list: The embedding vector
@@ -334,11 +441,13 @@ def get_embedding(text: str, model: str = "BAAI/bge-large-en-v1.5") -> list:
             base_url=os.environ.get("HEURIST_BASE_URL")
         )
 
-        response = client.embeddings.create(
-            model=model,
-            input=text,
-            encoding_format="float"
-        )
+        with span("embedding", model=model, chars=len(text)), EMBEDDING_SECONDS.time(model=model):
+            response = client.embeddings.create(
+                model=model,
+                input=text,
+                encoding_format="float",
+                timeout=timeout if timeout is not None else openai.NOT_GIVEN
+            )
         
         # Return the embedding vector for the input text
         return response.data[0].embedding
@@ -387,7 +496,10 @@ class MessageStore:
         Returns:
             list: List of dictionaries containing similar messages and their similarity scores
         """
-        return self.storage_provider.find_similar(embedding, threshold)
+        with span("vector_search", threshold=threshold) as search_span, VECTOR_SEARCH_SECONDS.time():
+            results = self.storage_provider.find_similar(embedding, threshold)
+            search_span.set("results", len(results))
+        return results
 
     def __del__(self):
         """Cleanup resources when the store is destroyed"""
@@ -405,3 +517,28 @@ class MessageStore:
             List[Dict]: List of matching messages with their metadata
         """
         return self.storage_provider.find_messages(message_type, original_query)
+
+    def load_conversation(self, source_interface: str, chat_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load the persisted memory of a chat.
+        
+        Args:
+            source_interface (str): Interface the chat belongs to
+            chat_id (str): Chat or thread identifier
+            
+        Returns:
+            Optional[Dict]: {'summary': str, 'turns': list} or None if unknown
+        """
+        return self.storage_provider.load_conversation(source_interface, chat_id)
+
+    def save_conversation(self, source_interface: str, chat_id: str, summary: str, turns: List[Dict[str, Any]]) -> None:
+        """
+        Persist the memory of a chat, replacing what was stored before.
+        
+        Args:
+            source_interface (str): Interface the chat belongs to
+            chat_id (str): Chat or thread identifier
+            summary (str): Rolling summary of older turns
+            turns (list): Recent verbatim turns
+        """
+        self.storage_provider.save_conversation(source_interface, chat_id, summary, turns)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+HEDGE_PERCENTILE = 0.9
+
+class LatencyTracker:
+    """Sliding window of observed call latencies per model"""
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_LATENCY_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(model_id, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model_id: str, q: float) -> Optional[float]:
+        """Latency at quantile q, or None until enough samples were observed"""
+        with self._lock:
+            samples = sorted(self._samples.get(model_id, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+class HedgePolicy:
+    """
+    Decides whether a duplicate request may be fired.
+
+    Duplicates are capped at `max_percent` of the hedge-eligible requests seen
+    so far, so hedging can never more than marginally inflate gateway traffic.
+    """
+
+    def __init__(self, max_percent: float = None, fallback_model_id: Optional[str] = None):
+        if max_percent is None:
+            max_percent = float(os.getenv("LLM_HEDGE_MAX_PERCENT", 5))
+        self.max_percent = max_percent
+        self.fallback_model_id = fallback_model_id or os.getenv("LLM_HEDGE_FALLBACK_MODEL") or None
+        self._lock = threading.Lock()
+        self._stats = {"eligible": 0, "hedged": 0, "hedge_wins": 0, "capped": 0}
+
+    def record_eligible(self):
+        with self._lock:
+            self._stats["eligible"] += 1
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if (self._stats["hedged"] + 1) * 100 > self.max_percent * self._stats["eligible"]:
+                self._stats["capped"] += 1
+                return False
+            self._stats["hedged"] += 1
+            return True
+
+    def record_hedge_win(self):
+        with self._lock:
+            self._stats["hedge_wins"] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+_tracker = LatencyTracker()
+_policy: Optional[HedgePolicy] = None
+_policy_lock = threading.Lock()
+
+def get_latency_tracker() -> LatencyTracker:
+    return _tracker
+
+def get_hedge_policy() -> HedgePolicy:
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = HedgePolicy()
+        return _policy
+
+async def _cancel(task: asyncio.Task):
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+async def run_hedged(
+    make_call: Callable[[str], Awaitable[Any]],
+    model_id: str,
+    fallback_model_id: Optional[str] = None
+) -> Any:
+    """
+    Run a call, firing a duplicate if it is slower than the model's p90.
+
+    Args:
+        make_call: Factory returning the awaitable for a given model id
+        model_id: Primary model
+        fallback_model_id: Model for the duplicate, defaults to the policy's
+            fallback or the primary model
+
+    Returns:
+        Result of whichever request succeeded first
+    """
+    policy = get_hedge_policy()
+    delay = _tracker.percentile(model_id, HEDGE_PERCENTILE)
+    primary = asyncio.ensure_future(make_call(model_id))
+    if delay is None:
+        return await primary
+
+    policy.record_eligible()
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+    except asyncio.CancelledError:
+        await _cancel(primary)
+        raise
+    if done or not policy.try_hedge():
+        return await primary
+
+    hedge_model_id = fallback_model_id or policy.fallback_model_id or model_id
+    logger.info(f"{model_id} slower than p90 ({delay:.2f}s), hedging with {hedge_model_id}")
+    hedge = asyncio.ensure_future(make_call(hedge_model_id))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for loser in pending:
+                        await _cancel(loser)
+                    if task is hedge:
+                        policy.record_hedge_win()
+                    return task.result()
+    except asyncio.CancelledError:
+        for task in (primary, hedge):
+            await _cancel(task)
+        raise
+    # Both requests failed, surface the primary's error
+    raise primary.exception()
@@ -7,7 +7,10 @@ import dotenv
 from .llm import call_llm
 from requests.exceptions import Timeout
 import random
+import asyncio
+from typing import Optional
 from core.heurist_image.SmartGen import SmartGen
+from core.deadline import Deadline
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -159,18 +162,30 @@ def generate_image_with_retry(prompt: str, max_retries: int = 3, delay: int = 2)
     logger.error(f"Image generation failed after {max_retries} attempts")
     return None
 
-async def generate_image_with_retry_smartgen(prompt: str, max_retries: int = 3, delay: int = 2) -> dict:
-    """Generate an image with retry mechanism"""
+# SmartGen jobs run with a 50s server-side deadline, attempts with much less time left rarely finish
+MIN_IMAGE_ATTEMPT_SECONDS = 15
+
+async def generate_image_with_retry_smartgen(prompt: str, max_retries: int = 3, delay: int = 2, deadline: Optional[Deadline] = None) -> dict:
+    """Generate an image with retry mechanism, bounded by an optional request deadline"""
     for attempt in range(max_retries):
+        if deadline is not None and not deadline.allows(MIN_IMAGE_ATTEMPT_SECONDS):
+            logger.warning(f"Skipping image generation attempt {attempt + 1}, only {deadline.remaining():.1f}s left")
+            return None
         try:
-            result = await generate_image_smartgen(prompt=prompt)
+            result = await asyncio.wait_for(
+                generate_image_smartgen(prompt=prompt),
+                timeout=deadline.timeout() if deadline else None
+            )
             if result:
                 return result
+        except asyncio.TimeoutError:
+            logger.warning(f"Image generation attempt {attempt + 1} ran out of time")
+            return None
         except Exception as e:
             logger.warning(f"Image generation attempt {attempt + 1} failed: {str(e)}")
 
         if attempt < max_retries - 1:
-            time.sleep(delay)
+            await asyncio.sleep(delay)
 
     logger.error(f"Image generation failed after {max_retries} attempts")
     return None
@@ -2,12 +2,20 @@ import requests
 import json
 import time
 import os
+import asyncio
 import logging
-from openai import OpenAI
-from typing import Dict, List, Union
+from functools import lru_cache
+from openai import OpenAI, AsyncOpenAI, RateLimitError, NOT_GIVEN
+from typing import Dict, List, Optional, Union
 import requests
 from types import SimpleNamespace
 import re
+from core.llm_scheduler import get_scheduler, retry_after_from_error, PRIORITY_DEFAULT
+from core.hedging import get_latency_tracker, run_hedged
+from core.deadline import Deadline
+from core.tracing import span
+from core.metrics import LLM_SECONDS, LLM_TOKENS
+from utils.token_utils import count_tokens
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,6 +24,49 @@ class LLMError(Exception):
     """Custom exception for LLM-related errors"""
     pass
 
+@lru_cache(maxsize=8)
+def _get_client(base_url: str, api_key: str) -> OpenAI:
+    # Retries are owned by the scheduler, so the SDK must not retry on its own
+    return OpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+
+@lru_cache(maxsize=8)
+def _get_async_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    return AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+
+def _build_messages(system_prompt: str, user_prompt: str) -> List[Dict]:
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_prompt}
+    ]
+
+def _estimate_tokens(system_prompt: str, user_prompt: str, max_tokens: int) -> int:
+    return count_tokens(system_prompt) + count_tokens(user_prompt) + (max_tokens or 0)
+
+def _usage_tokens(result) -> Union[int, None]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage else None
+
+# Don't start another attempt with less time than this left
+MIN_ATTEMPT_SECONDS = 2.0
+
+def _check_deadline(deadline: Optional[Deadline], wait: float = 0):
+    """Raise LLMError if the deadline leaves no room for an attempt after `wait` seconds"""
+    if deadline is not None and not deadline.allows(wait + MIN_ATTEMPT_SECONDS):
+        raise LLMError("Deadline exceeded, not retrying")
+
+def _request_timeout(deadline: Optional[Deadline]):
+    remaining = deadline.remaining() if deadline else None
+    return NOT_GIVEN if remaining is None else remaining
+
+async def _acquire_async(scheduler, model_id: str, tokens: int, priority: int, deadline: Optional[Deadline]):
+    try:
+        return await asyncio.wait_for(
+            scheduler.acquire_async(model_id, tokens, priority),
+            timeout=deadline.timeout() if deadline else None
+        )
+    except asyncio.TimeoutError:
+        raise LLMError("Deadline exceeded waiting for rate limit capacity")
+
 def call_llm(
     base_url: str,
     api_key: str,
@@ -25,7 +76,9 @@ def call_llm(
     temperature: float,
     max_tokens: int = 500,
     max_retries: int = 3,
-    initial_retry_delay: int = 1
+    initial_retry_delay: int = 1,
+    priority: int = PRIORITY_DEFAULT,
+    deadline: Optional[Deadline] = None
 ) -> str:
     """
     Call LLM with retry mechanism.
@@ -38,51 +91,178 @@ def call_llm(
         max_tokens (int): Maximum number of tokens to generate.
         max_retries (int): Number of retry attempts on failure.
         initial_retry_delay (int): Initial delay between retries, with exponential backoff.
+        priority (int): Scheduler lane, see core.llm_scheduler.
+        deadline (Deadline): Optional request deadline, caps each attempt's
+            timeout and stops retrying once too little time is left.
 
     Returns:
         str: Generated text from LLM.
-    
+
     Raises:
         LLMError: If all retry attempts fail.
     """
 
-    client = OpenAI(base_url=base_url, api_key=api_key)
-    
-    messages = [
-        {'role': 'system', 'content': system_prompt},
-        {'role': 'user', 'content': user_prompt}
-    ]
-    
+    client = _get_client(base_url, api_key)
+    scheduler = get_scheduler()
+    messages = _build_messages(system_prompt, user_prompt)
+    estimate = _estimate_tokens(system_prompt, user_prompt, max_tokens)
+
     retry_delay = initial_retry_delay
-    
+
     for attempt in range(max_retries):
+        _check_deadline(deadline)
+        reservation = scheduler.acquire(model_id, estimate, priority)
         try:
-            result = client.chat.completions.create(
-                model=model_id,
-                messages=messages,
-                stream=False,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+            started = time.monotonic()
+            with span("llm", model=model_id, attempt=attempt + 1, waited=reservation.waited) as llm_span, \
+                    LLM_SECONDS.time(model=model_id):
+                result = client.chat.completions.create(
+                    model=model_id,
+                    messages=messages,
+                    stream=False,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=_request_timeout(deadline)
+                )
+                llm_span.set("tokens", _usage_tokens(result))
+                LLM_TOKENS.inc(_usage_tokens(result) or 0, model=model_id)
+            get_latency_tracker().record(model_id, time.monotonic() - started)
+            scheduler.settle(reservation, _usage_tokens(result))
 
             return result.choices[0].message.content
-        
+
+        except RateLimitError as e:
+            # The scheduler holds every caller of this model until retry-after passes
+            scheduler.penalize(model_id, retry_after_from_error(e) or retry_delay)
+            logger.warning(f"Rate limited (attempt {attempt + 1}/{max_retries}): {str(e)}")
+            retry_delay *= 2
+            continue
         except requests.exceptions.RequestException as e:
             logger.warning(f"API request failed (attempt {attempt + 1}/{max_retries}): {str(e)}")
         except (KeyError, IndexError, json.JSONDecodeError) as e:
             logger.warning(f"Response parsing failed (attempt {attempt + 1}/{max_retries}): {str(e)}")
         except Exception as e:
             logger.warning(f"Unexpected error (attempt {attempt + 1}/{max_retries}): {str(e)}")
-        
+
         # Wait before next retry if there are attempts left
         if attempt < max_retries - 1:
+            _check_deadline(deadline, retry_delay)
             logger.info(f"Retrying in {retry_delay} seconds...")
             time.sleep(retry_delay)
             retry_delay *= 2  # Exponential backoff
-    
+
     # Raise error if all attempts fail
     raise LLMError("All retry attempts failed")
 
+async def call_llm_async(
+    base_url: str,
+    api_key: str,
+    model_id: str,
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int = 500,
+    max_retries: int = 3,
+    initial_retry_delay: int = 1,
+    priority: int = PRIORITY_DEFAULT,
+    hedge: bool = False,
+    hedge_model_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None
+) -> str:
+    """
+    Async variant of call_llm for use inside the event loop.
+
+    Same parameters and retry semantics as call_llm, but waiting for rate-limit
+    capacity and backoff never blocks the loop.
+
+    Parameters:
+        hedge (bool): Fire a duplicate request if this one is slower than the
+            model's observed p90 latency and keep whichever finishes first.
+            Meant for user-facing call sites only.
+        hedge_model_id (str): Optional model for the duplicate request.
+        deadline (Deadline): Optional request deadline, see call_llm.
+    """
+    if hedge:
+        return await run_hedged(
+            lambda hedged_model_id: call_llm_async(
+                base_url, api_key, hedged_model_id, system_prompt, user_prompt, temperature,
+                max_tokens=max_tokens, max_retries=max_retries,
+                initial_retry_delay=initial_retry_delay, priority=priority, deadline=deadline
+            ),
+            model_id,
+            hedge_model_id
+        )
+
+    client = _get_async_client(base_url, api_key)
+    scheduler = get_scheduler()
+    messages = _build_messages(system_prompt, user_prompt)
+    estimate = _estimate_tokens(system_prompt, user_prompt, max_tokens)
+
+    retry_delay = initial_retry_delay
+
+    for attempt in range(max_retries):
+        _check_deadline(deadline)
+        reservation = await _acquire_async(scheduler, model_id, estimate, priority, deadline)
+        try:
+            started = time.monotonic()
+            with span("llm", model=model_id, attempt=attempt + 1, waited=reservation.waited) as llm_span, \
+                    LLM_SECONDS.time(model=model_id):
+                result = await client.chat.completions.create(
+                    model=model_id,
+                    messages=messages,
+                    stream=False,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=_request_timeout(deadline)
+                )
+                llm_span.set("tokens", _usage_tokens(result))
+                LLM_TOKENS.inc(_usage_tokens(result) or 0, model=model_id)
+            get_latency_tracker().record(model_id, time.monotonic() - started)
+            scheduler.settle(reservation, _usage_tokens(result))
+
+            return result.choices[0].message.content
+
+        except RateLimitError as e:
+            scheduler.penalize(model_id, retry_after_from_error(e) or retry_delay)
+            logger.warning(f"Rate limited (attempt {attempt + 1}/{max_retries}): {str(e)}")
+            retry_delay *= 2
+            continue
+        except (KeyError, IndexError, json.JSONDecodeError) as e:
+            logger.warning(f"Response parsing failed (attempt {attempt + 1}/{max_retries}): {str(e)}")
+        except Exception as e:
+            logger.warning(f"Unexpected error (attempt {attempt + 1}/{max_retries}): {str(e)}")
+
+        if attempt < max_retries - 1:
+            _check_deadline(deadline, retry_delay)
+            logger.info(f"Retrying in {retry_delay} seconds...")
+            await asyncio.sleep(retry_delay)
+            retry_delay *= 2
+
+    raise LLMError("All retry attempts failed")
+
+def _parse_tool_response(message) -> Union[str, Dict]:
+    # If there are tool calls, return both tool calls and content
+    if hasattr(message, 'tool_calls') and message.tool_calls:
+        return {
+            'tool_calls': list(message.tool_calls),
+            'content': message.content
+        }
+    if hasattr(message, 'content') and message.content:
+        text_response = message.content
+        #text_response = '<function=handle_image_generation>{"prompt": "a cat", "agent_context": "None"} </function>'
+        tool_calls = extract_function_calls_to_tool_calls(text_response)
+        if tool_calls:
+            logger.info("found tool calls in response")
+            return {
+                'tool_calls': tool_calls,
+                'content': ""
+            }
+        else:
+            return {
+                'content': text_response
+            }
+    # Otherwise return just the content
+    return message
 
 def call_llm_with_tools(
     base_url: str,
@@ -93,74 +273,124 @@ def call_llm_with_tools(
     temperature: float,
     max_tokens: int = 500,
     max_retries: int = 3,
-    tools: List[Dict] = None
+    tools: List[Dict] = None,
+    priority: int = PRIORITY_DEFAULT,
+    deadline: Optional[Deadline] = None
 ) -> Union[str, Dict]:
-    client = OpenAI(base_url=base_url, api_key=api_key)
-    
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt}
-    ]
+    client = _get_client(base_url, api_key)
+    scheduler = get_scheduler()
+    messages = _build_messages(system_prompt, user_prompt)
+    estimate = _estimate_tokens(system_prompt, user_prompt, max_tokens) + count_tokens(json.dumps(tools or []))
 
-    try:
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=messages,
-            temperature=temperature,
-            tools=tools,
-            tool_choice="auto"# if tools else None
+    # Only rate limits are retried here, other failures surface immediately
+    for attempt in range(max_retries):
+        _check_deadline(deadline)
+        reservation = scheduler.acquire(model_id, estimate, priority)
+        try:
+            started = time.monotonic()
+            with span("llm", model=model_id, attempt=attempt + 1, waited=reservation.waited, tools=True) as llm_span, \
+                    LLM_SECONDS.time(model=model_id):
+                response = client.chat.completions.create(
+                    model=model_id,
+                    messages=messages,
+                    temperature=temperature,
+                    tools=tools,
+                    tool_choice="auto",# if tools else None
+                    timeout=_request_timeout(deadline)
+                )
+                llm_span.set("tokens", _usage_tokens(response))
+                LLM_TOKENS.inc(_usage_tokens(response) or 0, model=model_id)
+            get_latency_tracker().record(model_id, time.monotonic() - started)
+            scheduler.settle(reservation, _usage_tokens(response))
+            return _parse_tool_response(response.choices[0].message)
+
+        except RateLimitError as e:
+            scheduler.penalize(model_id, retry_after_from_error(e) or 2 ** attempt)
+            if attempt == max_retries - 1:
+                raise LLMError(f"LLM API call failed: {str(e)}")
+        except Exception as e:
+            raise LLMError(f"LLM API call failed: {str(e)}")
+
+async def call_llm_with_tools_async(
+    base_url: str,
+    api_key: str,
+    model_id: str,
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int = 500,
+    max_retries: int = 3,
+    tools: List[Dict] = None,
+    priority: int = PRIORITY_DEFAULT,
+    hedge: bool = False,
+    hedge_model_id: Optional[str] = None,
+    deadline: Optional[Deadline] = None
+) -> Union[str, Dict]:
+    """Async variant of call_llm_with_tools, with optional hedging and deadline (see call_llm_async)"""
+    if hedge:
+        return await run_hedged(
+            lambda hedged_model_id: call_llm_with_tools_async(
+                base_url, api_key, hedged_model_id, system_prompt, user_prompt, temperature,
+                max_tokens=max_tokens, max_retries=max_retries, tools=tools, priority=priority,
+                deadline=deadline
+            ),
+            model_id,
+            hedge_model_id
         )
 
-        message = response.choices[0].message
+    client = _get_async_client(base_url, api_key)
+    scheduler = get_scheduler()
+    messages = _build_messages(system_prompt, user_prompt)
+    estimate = _estimate_tokens(system_prompt, user_prompt, max_tokens) + count_tokens(json.dumps(tools or []))
+
+    for attempt in range(max_retries):
+        _check_deadline(deadline)
+        reservation = await _acquire_async(scheduler, model_id, estimate, priority, deadline)
+        try:
+            started = time.monotonic()
+            with span("llm", model=model_id, attempt=attempt + 1, waited=reservation.waited, tools=True) as llm_span, \
+                    LLM_SECONDS.time(model=model_id):
+                response = await client.chat.completions.create(
+                    model=model_id,
+                    messages=messages,
+                    temperature=temperature,
+                    tools=tools,
+                    tool_choice="auto",
+                    timeout=_request_timeout(deadline)
+                )
+                llm_span.set("tokens", _usage_tokens(response))
+                LLM_TOKENS.inc(_usage_tokens(response) or 0, model=model_id)
+            get_latency_tracker().record(model_id, time.monotonic() - started)
+            scheduler.settle(reservation, _usage_tokens(response))
+            return _parse_tool_response(response.choices[0].message)
+
+        except RateLimitError as e:
+            scheduler.penalize(model_id, retry_after_from_error(e) or 2 ** attempt)
+            if attempt == max_retries - 1:
+                raise LLMError(f"LLM API call failed: {str(e)}")
+        except Exception as e:
+            raise LLMError(f"LLM API call failed: {str(e)}")
+
+def extract_function_calls_to_tool_calls(llm_text: str) -> Optional[List[SimpleNamespace]]:
 
-        # If there are tool calls, return both tool calls and content
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            return {
-                'tool_calls': message.tool_calls[0],
-                'content': message.content
-            }
-        if hasattr(message, 'content') and message.content:
-            text_response = message.content
-            #text_response = '<function=handle_image_generation>{"prompt": "a cat", "agent_context": "None"} </function>'
-            tool_calls = extract_function_calls_to_tool_calls(text_response)
-            if tool_calls:
-                logger.info("found tool calls in response")
-                return {
-                    'tool_calls': tool_calls,
-                    'content': ""
-                }
-            else:
-                return {
-                    'content': text_response
-                }
-        # Otherwise return just the content
-        return message
-
-    except Exception as e:
-        raise LLMError(f"LLM API call failed: {str(e)}")
-    
-def extract_function_calls_to_tool_calls(llm_text: str) -> SimpleNamespace:
-    
     """
-    Scan the LLM's text output for a <function=NAME>{...}</function> pattern,
-    and convert to appropriate format for tool calls
+    Scan the LLM's text output for <function=NAME>{...}</function> patterns,
+    and convert each to the tool call format
     """
     pattern = r"<function=([^>]+)>(.*?})(?:</?\s*function>)?"
     matches = re.findall(pattern, llm_text)
-    
-    # If we find at least one match
-    if matches:
-        function_name, args_json_str = matches[0]  # Just take the first match
+
+    tool_calls = []
+    for function_name, args_json_str in matches:
         # Parse the JSON to ensure it's valid
         parsed_args = json.loads(args_json_str.strip())
-        
 
         function_obj = SimpleNamespace(
             name=function_name,
             arguments=json.dumps(parsed_args)
         )
         # Build the structure that your existing code expects
-        return SimpleNamespace(function=function_obj)
-    
-    # If no matches, return an empty dict or whatever fallback you need
-    return None
\ No newline at end of file
+        tool_calls.append(SimpleNamespace(function=function_obj))
+
+    # If no matches, return None
+    return tool_calls or None
@@ -0,0 +1,258 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKGROUND = 2
+
+MAX_WAIT_SLICE = 0.25
+
+@dataclass
+class RateLimit:
+    """Per-model request and token budgets"""
+    requests_per_minute: int
+    tokens_per_minute: int
+
+@dataclass
+class Reservation:
+    """Capacity granted to a single LLM call"""
+    model_id: str
+    tokens: int
+    priority: int
+    waited: float
+
+class TokenBucket:
+    """Continuously refilling token bucket. Not thread-safe on its own."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.level = min(self.capacity, self.level + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be consumed (0 if available now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_per_second
+
+    def consume(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+class _ModelLimiter:
+    def __init__(self, limit: RateLimit):
+        self.requests = TokenBucket(limit.requests_per_minute, limit.requests_per_minute / 60.0)
+        self.tokens = TokenBucket(limit.tokens_per_minute, limit.tokens_per_minute / 60.0)
+        self.blocked_until = 0.0
+        self.waiters = []
+        self.granted = 0
+        self.throttled = 0
+
+class LLMScheduler:
+    """
+    Process-wide scheduler for outbound LLM traffic.
+
+    Every call reserves one request and its estimated tokens from the model's
+    buckets before hitting the gateway. Waiters are served strictly by
+    priority lane, then arrival order, so user-facing replies overtake queued
+    background enrichment. A 429 with retry-after blocks the whole model until
+    the gateway says it is ready again. Works from both threads and event loops.
+    """
+
+    def __init__(self, default_limit: RateLimit, limits: Dict[str, RateLimit] = None):
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self._limiters: Dict[str, _ModelLimiter] = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def _limiter(self, model_id: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model_id)
+        if limiter is None:
+            limiter = _ModelLimiter(self.limits.get(model_id, self.default_limit))
+            self._limiters[model_id] = limiter
+        return limiter
+
+    def _try_acquire(self, limiter: _ModelLimiter, ticket: tuple, tokens: int) -> float:
+        """Grant the ticket if it is first in line and capacity exists. Call with the lock held."""
+        now = time.monotonic()
+        if now < limiter.blocked_until:
+            return limiter.blocked_until - now
+        if min(limiter.waiters) != ticket:
+            return MAX_WAIT_SLICE
+        wait = max(limiter.requests.wait_time(1, now), limiter.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+        limiter.requests.consume(1)
+        limiter.tokens.consume(tokens)
+        limiter.waiters.remove(ticket)
+        limiter.granted += 1
+        return 0.0
+
+    def acquire(self, model_id: str, tokens: int, priority: int = PRIORITY_DEFAULT) -> Reservation:
+        """Block the calling thread until the model has capacity for this call"""
+        start = time.monotonic()
+        with self._cond:
+            limiter = self._limiter(model_id)
+            ticket = (priority, next(self._seq))
+            limiter.waiters.append(ticket)
+            try:
+                while True:
+                    wait = self._try_acquire(limiter, ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._cond.wait(min(wait, MAX_WAIT_SLICE))
+            except BaseException:
+                if ticket in limiter.waiters:
+                    limiter.waiters.remove(ticket)
+                raise
+            finally:
+                self._cond.notify_all()
+        return self._granted(model_id, tokens, priority, start)
+
+    async def acquire_async(self, model_id: str, tokens: int, priority: int = PRIORITY_DEFAULT) -> Reservation:
+        """Wait on the event loop until the model has capacity for this call"""
+        start = time.monotonic()
+        with self._cond:
+            limiter = self._limiter(model_id)
+            ticket = (priority, next(self._seq))
+            limiter.waiters.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(limiter, ticket, tokens)
+                    if wait == 0:
+                        self._cond.notify_all()
+                        break
+                await asyncio.sleep(min(wait, MAX_WAIT_SLICE))
+        except BaseException:
+            with self._cond:
+                if ticket in limiter.waiters:
+                    limiter.waiters.remove(ticket)
+                self._cond.notify_all()
+            raise
+        return self._granted(model_id, tokens, priority, start)
+
+    def _granted(self, model_id: str, tokens: int, priority: int, start: float) -> Reservation:
+        waited = time.monotonic() - start
+        if waited > 1:
+            logger.info(f"LLM call to {model_id} (priority {priority}) waited {waited:.1f}s for rate limit")
+        return Reservation(model_id=model_id, tokens=tokens, priority=priority, waited=waited)
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int]):
+        """Correct the token bucket once the real usage is known"""
+        if actual_tokens is None:
+            return
+        with self._cond:
+            limiter = self._limiter(reservation.model_id)
+            delta = reservation.tokens - actual_tokens
+            if delta > 0:
+                limiter.tokens.refund(delta)
+            else:
+                limiter.tokens.consume(-delta)
+            self._cond.notify_all()
+
+    def penalize(self, model_id: str, retry_after: float):
+        """Stop all calls to a model for `retry_after` seconds (e.g. after a 429)"""
+        with self._cond:
+            limiter = self._limiter(model_id)
+            limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + retry_after)
+            limiter.throttled += 1
+        logger.warning(f"Rate limited on {model_id}, pausing calls for {retry_after:.1f}s")
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Queue depth and counters per model"""
+        with self._cond:
+            now = time.monotonic()
+            return {
+                model_id: {
+                    "waiting": len(limiter.waiters),
+                    "granted": limiter.granted,
+                    "throttled": limiter.throttled,
+                    "blocked_for": max(0.0, limiter.blocked_until - now)
+                }
+                for model_id, limiter in self._limiters.items()
+            }
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """
+    Read the retry delay from an HTTP error's headers, if present.
+
+    Args:
+        error: Exception carrying a `response` with headers (openai, requests, tweepy)
+
+    Returns:
+        Seconds to wait, or None if the server did not say
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                retry_at = parsedate_to_datetime(value)
+                return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError) as e:
+        logger.debug(f"Could not parse retry-after header: {e}")
+    return None
+
+def _load_limits() -> Dict[str, RateLimit]:
+    raw = os.getenv("LLM_RATE_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return {
+            model_id: RateLimit(int(limit["rpm"]), int(limit["tpm"]))
+            for model_id, limit in json.loads(raw).items()
+        }
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"Invalid LLM_RATE_LIMITS, using defaults: {str(e)}")
+        return {}
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide LLM scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                default_limit=RateLimit(
+                    requests_per_minute=int(os.getenv("LLM_DEFAULT_RPM", 60)),
+                    tokens_per_minute=int(os.getenv("LLM_DEFAULT_TPM", 100000))
+                ),
+                limits=_load_limits()
+            )
+        return _scheduler
@@ -0,0 +1,347 @@
+import bisect
+import functools
+import inspect
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram buckets grow by 2^(1/SUB_BUCKETS): ~9% relative error from 1ms to 5 minutes
+HISTOGRAM_MIN = 0.001
+HISTOGRAM_MAX = 300.0
+SUB_BUCKETS = 4
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values]
+
+class Gauge(_Metric):
+    """
+    Current value per label set. A label set may be bound to a callback with
+    set_function, which is evaluated at scrape time (queue depths and such).
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self._functions: Dict[LabelKey, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels):
+        with self._lock:
+            self._functions[_label_key(labels)] = fn
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                values[key] = float(fn())
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} callback failed: {str(e)}")
+        return self.header() + [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values.items()]
+
+class _HistogramSeries:
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+class Histogram(_Metric):
+    """
+    Log-linear (HDR-style) histogram: bucket bounds grow geometrically, so
+    relative precision is the same for 5ms and 50s observations and the
+    bucket count stays small. Values outside the range land in the first
+    or the +Inf bucket.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, min_value: float = HISTOGRAM_MIN,
+                 max_value: float = HISTOGRAM_MAX, sub_buckets: int = SUB_BUCKETS):
+        super().__init__(name, documentation)
+        steps = math.ceil(math.log2(max_value / min_value) * sub_buckets)
+        self.bounds = [min_value * 2 ** (i / sub_buckets) for i in range(steps + 1)]
+        self._series: Dict[LabelKey, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels):
+        index = bisect.bisect_left(self.bounds, value)
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.bounds) + 1)
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+
+    def time(self, **labels) -> '_Timer':
+        """Context manager observing the duration of its block, with status="ok"/"error" added"""
+        return _Timer(self, labels)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile, None without data"""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if series is None or series.count == 0:
+                return None
+            counts = list(series.counts)
+            total = series.count
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else math.inf
+        return math.inf
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(k, list(s.counts), s.sum, s.count) for k, s in self._series.items()]
+        lines = self.header()
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip(self.bounds, counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', f'{bound:.6g}')])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, object]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> '_Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        status = "ok" if exc_type is None else "error"
+        self.histogram.observe(time.perf_counter() - self.started, status=status, **self.labels)
+        return False
+
+class MetricsRegistry:
+    """Named metrics of one process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(self, name: str, documentation: str, **kwargs) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, **kwargs)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> MetricsRegistry:
+    """Return the process-wide metrics registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+def counter(name: str, documentation: str) -> Counter:
+    return get_registry().counter(name, documentation)
+
+def gauge(name: str, documentation: str) -> Gauge:
+    return get_registry().gauge(name, documentation)
+
+def histogram(name: str, documentation: str, **kwargs) -> Histogram:
+    return get_registry().histogram(name, documentation, **kwargs)
+
+# Metrics shared by several modules
+STAGE_SECONDS = histogram("radiant_stage_seconds", "Duration of pipeline stages")
+LLM_SECONDS = histogram("radiant_llm_request_seconds", "Duration of LLM API attempts by model")
+LLM_TOKENS = counter("radiant_llm_tokens_total", "Tokens used by LLM calls by model")
+EMBEDDING_SECONDS = histogram("radiant_embedding_seconds", "Duration of embedding API calls")
+VECTOR_SEARCH_SECONDS = histogram("radiant_vector_search_seconds", "Duration of similar message lookups")
+PLATFORM_SECONDS = histogram("radiant_platform_request_seconds", "Duration of platform API calls")
+PLATFORM_REQUESTS = counter("radiant_platform_requests_total", "Platform API calls by endpoint and status code")
+QUEUE_DEPTH = gauge("radiant_queue_depth", "Items waiting in work queues")
+
+def _status_code(error: BaseException) -> str:
+    response = getattr(error, "response", None)
+    code = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return str(code) if code else "error"
+
+class platform_call:
+    """
+    Time a platform API call and count it by status code. Usable as a
+    context manager (set `.status` to the HTTP code when known) or as a
+    decorator for sync and async functions.
+    """
+
+    def __init__(self, platform: str, endpoint: str):
+        self.platform = platform
+        self.endpoint = endpoint
+        self.status: Optional[str] = None
+        self.started = 0.0
+
+    def __enter__(self) -> 'platform_call':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            status = _status_code(exc)
+        else:
+            status = str(self.status) if self.status is not None else "ok"
+        PLATFORM_SECONDS.observe(time.perf_counter() - self.started, platform=self.platform, endpoint=self.endpoint)
+        PLATFORM_REQUESTS.inc(platform=self.platform, endpoint=self.endpoint, status=status)
+        return False
+
+    def __call__(self, fn: Callable) -> Callable:
+        platform, endpoint = self.platform, self.endpoint
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with platform_call(platform, endpoint):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with platform_call(platform, endpoint):
+                return fn(*args, **kwargs)
+        return wrapper
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_registry().render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the log
+        pass
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics from a daemon thread, for processes without a web server.
+
+    Args:
+        port: Port to listen on, defaults to METRICS_PORT (0 disables the exporter)
+        host: Interface to bind, defaults to METRICS_HOST (localhost)
+
+    Returns:
+        The running server, or None if disabled or the port is taken
+    """
+    port = int(os.getenv("METRICS_PORT", 9108)) if port is None else port
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics exporter not started on {host}:{port}: {str(e)}")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True)
+    thread.start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
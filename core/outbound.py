@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Overflow policies when an interface queue is full
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+@dataclass
+class OutboundConfig:
+    """Configuration for the outbound message bus"""
+    max_queue_size: int = int(os.getenv("OUTBOUND_QUEUE_SIZE", 100))
+    overflow_policy: str = os.getenv("OUTBOUND_OVERFLOW_POLICY", DROP_OLDEST)
+    block_timeout: float = float(os.getenv("OUTBOUND_BLOCK_TIMEOUT", 5))
+    max_retries: int = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+    retry_delay: float = 1.0
+
+class _Channel:
+    """Queue, sender task and counters for one target interface on one event loop"""
+    def __init__(self, name: str, interface: Any, max_queue_size: int, loop: asyncio.AbstractEventLoop):
+        self.name = name
+        self.interface = interface
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.sender = None
+        self.stats = {"sent": 0, "dropped": 0, "failed": 0, "retried": 0}
+
+class OutboundBus:
+    """
+    Bounded, per-interface outbound queues drained by dedicated sender tasks.
+
+    Messages published from a coroutine are queued and sent on the caller's
+    event loop, where the platform clients (Telegram, Discord, aiohttp) were
+    created, as direct sends were before; each loop gets its own channel per
+    interface. The publisher never waits on the target platform, each
+    message is delivered with one `send_message` call.
+    """
+
+    def __init__(self, config: OutboundConfig = None):
+        self.config = config or OutboundConfig()
+        self._channels: Dict[tuple, _Channel] = {}
+        self._lock = threading.Lock()
+
+    async def publish(self, target: str, interface: Any, message: Dict[str, Any]) -> bool:
+        """
+        Queue a message for an interface.
+
+        Args:
+            target: Interface name
+            interface: Interface instance that will send the message
+            message: Message dict with at least 'type' and 'content'
+
+        Returns:
+            bool: True if queued, False if dropped by the overflow policy
+        """
+        return await self._put(target, interface, message)
+
+    def _channel(self, target: str, interface: Any) -> _Channel:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            channel = self._channels.get((target, loop))
+            if channel is None:
+                # Channels of loops that have shut down can never send again
+                for key in [k for k, c in self._channels.items() if c.loop.is_closed()]:
+                    del self._channels[key]
+                channel = _Channel(target, interface, self.config.max_queue_size, loop)
+                channel.sender = loop.create_task(self._sender(channel))
+                self._channels[(target, loop)] = channel
+        channel.interface = interface
+        return channel
+
+    async def _put(self, target: str, interface: Any, message: Dict[str, Any]) -> bool:
+        channel = self._channel(target, interface)
+        if channel.queue.full():
+            policy = self.config.overflow_policy
+            if policy == BLOCK:
+                try:
+                    await asyncio.wait_for(channel.queue.put(message), timeout=self.config.block_timeout)
+                    return True
+                except asyncio.TimeoutError:
+                    channel.stats["dropped"] += 1
+                    logger.warning(f"Outbound queue for {target} still full after {self.config.block_timeout}s, dropping message")
+                    return False
+            if policy == DROP_NEWEST:
+                channel.stats["dropped"] += 1
+                logger.warning(f"Outbound queue for {target} full, dropping new message")
+                return False
+            channel.queue.get_nowait()
+            channel.queue.task_done()
+            channel.stats["dropped"] += 1
+            logger.warning(f"Outbound queue for {target} full, dropped oldest message")
+        channel.queue.put_nowait(message)
+        return True
+
+    async def _sender(self, channel: _Channel):
+        while True:
+            message = await channel.queue.get()
+            try:
+                await self._deliver(channel, message)
+            except Exception as e:
+                logger.error(f"Outbound sender for {channel.name} failed: {str(e)}")
+            finally:
+                channel.queue.task_done()
+
+    async def _deliver(self, channel: _Channel, message: Dict[str, Any]):
+        if message.get('type') != 'message':
+            logger.info(f"Skipping unsupported message type {message.get('type')} for {channel.name}")
+            return
+        if not hasattr(channel.interface, "send_message"):
+            logger.error(f"Interface {channel.name} cannot send messages")
+            channel.stats["dropped"] += 1
+            return
+
+        delay = self.config.retry_delay
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                await channel.interface.send_message(
+                    chat_id=message['chat_id'],
+                    message=message['content'],
+                    image_url=message.get('image_url')
+                )
+                channel.stats["sent"] += 1
+                return
+            except Exception as e:
+                if attempt == self.config.max_retries:
+                    break
+                channel.stats["retried"] += 1
+                logger.warning(f"Send via {channel.name} failed (attempt {attempt + 1}), retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        channel.stats["failed"] += 1
+        logger.error(f"Giving up on message for {channel.name}")
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Queue depth and delivery counters per interface, summed over loops"""
+        with self._lock:
+            channels = list(self._channels.values())
+        stats: Dict[str, Dict[str, int]] = {}
+        for channel in channels:
+            totals = stats.setdefault(channel.name, {"sent": 0, "dropped": 0, "failed": 0, "retried": 0, "queued": 0})
+            for key, value in channel.stats.items():
+                totals[key] += value
+            totals["queued"] += channel.queue.qsize()
+        return stats
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+from core.tracing import span
+from core.metrics import STAGE_SECONDS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class PipelineAbort(Exception):
+    """Raised by a stage to stop the pipeline early with a final result"""
+    def __init__(self, result: Any = None):
+        super().__init__("pipeline aborted")
+        self.result = result
+
+@dataclass
+class StageTiming:
+    """When a stage started (relative to the pipeline start) and how long it ran"""
+    name: str
+    start: float = 0.0
+    duration: float = 0.0
+    status: str = "pending"
+
+@dataclass
+class _Stage:
+    name: str
+    fn: Callable[[Dict[str, Any]], Awaitable[Any]]
+    after: Sequence[str]
+
+class StagePipeline:
+    """
+    Small dependency graph of async stages.
+
+    Each stage is an async function taking the shared context dict; its return
+    value is stored in the context under the stage name. A stage starts as
+    soon as all stages it runs `after` have finished, so independent stages
+    run concurrently. The first failing stage cancels everything still
+    running and its exception is re-raised from run(). Each stage runs in
+    its own tracing span.
+    """
+
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self._stages: List[_Stage] = []
+        self.timings: Dict[str, StageTiming] = {}
+
+    def stage(self, name: str, fn: Callable[[Dict[str, Any]], Awaitable[Any]], after: Sequence[str] = ()) -> 'StagePipeline':
+        """Register a stage. Dependencies must be registered before their dependents."""
+        known = {s.name for s in self._stages}
+        missing = [dep for dep in after if dep not in known]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {missing}")
+        self._stages.append(_Stage(name, fn, tuple(after)))
+        self.timings[name] = StageTiming(name)
+        return self
+
+    async def run(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run all stages.
+
+        Args:
+            ctx: Shared context, stage results are added to it
+
+        Returns:
+            The context with every stage's result
+        """
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: _Stage):
+            if stage.after:
+                await asyncio.gather(*(tasks[dep] for dep in stage.after))
+            timing = self.timings[stage.name]
+            timing.start = time.perf_counter() - started
+            timing.status = "running"
+            try:
+                with span(f"{self.name}.{stage.name}"):
+                    ctx[stage.name] = await stage.fn(ctx)
+                timing.status = "ok"
+            except PipelineAbort:
+                timing.status = "aborted"
+                raise
+            except asyncio.CancelledError:
+                timing.status = "cancelled"
+                raise
+            except Exception:
+                timing.status = "error"
+                raise
+            finally:
+                timing.duration = time.perf_counter() - started - timing.start
+
+        for stage in self._stages:
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+
+        try:
+            done, pending = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+            failed = [t for t in done if not t.cancelled() and t.exception() is not None]
+            if failed:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                # Prefer an explicit abort over errors it caused in dependents
+                aborts = [t.exception() for t in failed if isinstance(t.exception(), PipelineAbort)]
+                raise aborts[0] if aborts else failed[0].exception()
+        except asyncio.CancelledError:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            for timing in self.timings.values():
+                if timing.status == "pending":
+                    timing.status = "skipped"
+                else:
+                    STAGE_SECONDS.observe(timing.duration, pipeline=self.name, stage=timing.name, status=timing.status)
+            logger.info(f"{self.name} stage timings: {self.format_timings()}")
+        return ctx
+
+    def format_timings(self) -> str:
+        return ", ".join(
+            f"{t.name}={t.duration * 1000:.0f}ms@{t.start * 1000:.0f}ms"
+            if t.status == "ok" else f"{t.name}={t.status}"
+            for t in self.timings.values()
+        )
@@ -0,0 +1,50 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PollConfig:
+    """Bounds and targets for adaptive polling"""
+    min_interval: float = float(os.getenv("SEARCH_MIN_INTERVAL", 60))
+    max_interval: float = float(os.getenv("SEARCH_MAX_INTERVAL", 1800))
+    # New items one poll should find on average
+    target_per_poll: float = float(os.getenv("SEARCH_TARGET_PER_POLL", 5))
+    # Weight of the latest poll in the rate average
+    alpha: float = 0.3
+
+class AdaptivePollInterval:
+    """
+    Poll interval driven by the observed arrival rate of new items.
+
+    Keeps an exponentially weighted moving average of items per second and
+    waits long enough for about `target_per_poll` new items to arrive, within
+    [min_interval, max_interval]. Busy periods are polled quickly, quiet ones
+    back off to the maximum.
+    """
+
+    def __init__(self, config: PollConfig = None):
+        self.config = config or PollConfig()
+        self.rate: Optional[float] = None
+
+    def observe(self, new_items: int, elapsed: float) -> float:
+        """
+        Record a poll and return the interval until the next one.
+
+        Args:
+            new_items: Items the poll found that were not seen before
+            elapsed: Seconds since the previous poll
+        """
+        if elapsed > 0:
+            rate = new_items / elapsed
+            self.rate = rate if self.rate is None else self.rate + self.config.alpha * (rate - self.rate)
+        return self.interval()
+
+    def interval(self) -> float:
+        if not self.rate:
+            return self.config.max_interval
+        return min(self.config.max_interval, max(self.config.min_interval, self.config.target_per_poll / self.rate))
@@ -0,0 +1,201 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from core.metrics import counter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Topics the agent engages with, shared with the LLM filter prompt
+FILTER_TOPICS = ["The Wired", "Consciousness", "Reality", "Existence", "Self", "Philosophy", "Technology", "Crypto", "AI", "Machines"]
+
+# Seed phrases per topic, averaged into one embedding centroid each
+TOPIC_SEEDS = {
+    "The Wired": ["the wired", "cyberspace and the network", "living inside the internet"],
+    "Consciousness": ["consciousness", "being aware and sentient", "what is the mind"],
+    "Reality": ["the nature of reality", "is this world real", "simulation theory"],
+    "Existence": ["the meaning of existence", "why do we exist", "life and death"],
+    "Self": ["the self and identity", "who am I really", "the ego and the soul"],
+    "Philosophy": ["philosophy", "philosophical questions and ethics", "what would a philosopher say"],
+    "Technology": ["technology", "new tech and gadgets", "software and computers"],
+    "Crypto": ["crypto", "bitcoin, XRP and tokens", "blockchain and defi"],
+    "AI": ["artificial intelligence", "AI agents and language models", "machine learning"],
+    "Machines": ["machines and robots", "automation and robotics", "humans merging with machines"],
+}
+
+IMAGE_REQUEST_PATTERN = r"\b(?:draw|paint|sketch|(?:make|create|generate|show)(?: me)? (?:an? )?(?:image|picture|pic|drawing|art))\b"
+
+TIER_KEYWORD = "keyword"
+TIER_EMBEDDING = "embedding"
+TIER_LLM = "llm"
+
+# Backoff between centroid builds while the embedding API fails, doubling up to the max
+CENTROID_RETRY_SECONDS = 30
+CENTROID_RETRY_MAX_SECONDS = 900
+
+PREFILTER_DECISIONS = counter("radiant_prefilter_decisions_total", "Pre-validation decisions by tier and outcome")
+
+def _unit(vector) -> Optional[np.ndarray]:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+class MessagePrefilter:
+    """
+    Cheap tiers in front of the LLM pre-validation call.
+
+    Tier 1 applies compiled keyword rules (persona name, 'start raid', image
+    requests without the name, noise). A topic word alone does not show that
+    a message clearly discusses the topic, so those are left to the later
+    tiers. Tier 2 compares the message embedding with a centroid per topic
+    and decides confident cases; the centroids are built in the background
+    (`warm_up`) and the tier stays undecided until they are ready. Anything left undecided is for the LLM
+    filter. Each decision is counted per tier so hit rates can be inspected.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        embed_fn: Callable[[str], List[float]],
+        topics: List[str] = None,
+        accept_threshold: float = None,
+        reject_threshold: float = None
+    ):
+        self.name = name
+        self.embed_fn = embed_fn
+        self.topics = topics or FILTER_TOPICS
+        self.accept_threshold = accept_threshold if accept_threshold is not None else float(os.getenv("PREFILTER_ACCEPT_THRESHOLD", 0.75))
+        self.reject_threshold = reject_threshold if reject_threshold is not None else float(os.getenv("PREFILTER_REJECT_THRESHOLD", 0.55))
+        self.use_embeddings = os.getenv("PREFILTER_EMBEDDINGS", "true").lower() == "true"
+
+        self._name_pattern = re.compile(rf"\b{re.escape(name)}\b", re.IGNORECASE)
+        self._raid_pattern = re.compile(r"\bstart\s+raid\b", re.IGNORECASE)
+        self._image_pattern = re.compile(IMAGE_REQUEST_PATTERN, re.IGNORECASE)
+        self._word_pattern = re.compile(r"[A-Za-z0-9]{2,}")
+
+        self._centroids = None
+        self._centroid_lock = threading.Lock()
+        self._building = False
+        self._retry_at = 0.0
+        self._retry_delay = CENTROID_RETRY_SECONDS
+        self._lock = threading.Lock()
+        self._stats = {
+            "keyword_process": 0, "keyword_ignore": 0,
+            "embedding_process": 0, "embedding_ignore": 0,
+            "llm": 0, "total": 0
+        }
+
+    def keyword_decision(self, message: str) -> Optional[bool]:
+        """Tier 1. Returns True to process, False to ignore, None if undecided."""
+        if not self._word_pattern.search(message):
+            return False
+        if self._name_pattern.search(message) or self._raid_pattern.search(message):
+            return True
+        if self._image_pattern.search(message):
+            # Image requests are only served when the persona is addressed
+            return False
+        return None
+
+    def addressed(self, message: str) -> bool:
+        """Whether the message speaks to the persona directly (its name or 'start raid')"""
+        return bool(self._name_pattern.search(message) or self._raid_pattern.search(message))
+
+    def embedding_decision(self, message_embedding: List[float]) -> Optional[bool]:
+        """Tier 2. Nearest topic centroid by cosine similarity."""
+        centroids = self._get_centroids()
+        query = _unit(message_embedding) if message_embedding is not None else None
+        if centroids is None or query is None:
+            return None
+        best = float(np.max(centroids @ query))
+        if best >= self.accept_threshold:
+            return True
+        if best <= self.reject_threshold:
+            return False
+        return None
+
+    def embedding_tier(self, message: str, message_embedding: Optional[List[float]] = None) -> Optional[bool]:
+        """Tier 2 with its decision counted, embeds the message if no embedding is given"""
+        if self._get_centroids() is None:
+            return None
+        if message_embedding is None:
+            message_embedding = self._safe_embed(message)
+        decision = self.embedding_decision(message_embedding)
+        if decision is not None:
+            self.record(TIER_EMBEDDING, decision)
+        return decision
+
+    def keyword_tier(self, message: str) -> Optional[bool]:
+        """Tier 1 with its decision counted, cheap enough to run before admission"""
+        decision = self.keyword_decision(message)
+        if decision is not None:
+            self.record(TIER_KEYWORD, decision)
+        return decision
+
+    def record(self, tier: str, decision: Optional[bool] = None):
+        outcome = "deferred" if tier == TIER_LLM else ("process" if decision else "ignore")
+        PREFILTER_DECISIONS.inc(tier=tier, outcome=outcome)
+        with self._lock:
+            self._stats["total"] += 1
+            if tier == TIER_LLM:
+                self._stats["llm"] += 1
+            else:
+                self._stats[f"{tier}_{outcome}"] += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Decision counts and hit rate per tier"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["total"] or 1
+        stats["keyword_hit_rate"] = (stats["keyword_process"] + stats["keyword_ignore"]) / total
+        stats["embedding_hit_rate"] = (stats["embedding_process"] + stats["embedding_ignore"]) / total
+        stats["llm_rate"] = stats["llm"] / total
+        return stats
+
+    def _safe_embed(self, text: str) -> Optional[List[float]]:
+        try:
+            return self.embed_fn(text)
+        except Exception as e:
+            logger.warning(f"Prefilter embedding failed: {str(e)}")
+            return None
+
+    def warm_up(self):
+        """Build the topic centroids in a background thread, unless built, building or backing off"""
+        with self._centroid_lock:
+            if self._centroids is not None or self._building or time.time() < self._retry_at:
+                return
+            self._building = True
+        threading.Thread(target=self._build_centroids, name="prefilter-centroids", daemon=True).start()
+
+    def _build_centroids(self):
+        """Embed the topic seeds and cache one unit centroid per topic, back off on failure"""
+        try:
+            rows = []
+            for topic in self.topics:
+                vectors = np.asarray([self.embed_fn(seed) for seed in TOPIC_SEEDS.get(topic, [topic])], dtype=np.float32)
+                centroid = _unit(np.mean(vectors, axis=0))
+                if centroid is None:
+                    raise ValueError(f"empty centroid for topic {topic}")
+                rows.append(centroid)
+        except Exception as e:
+            with self._centroid_lock:
+                self._building = False
+                self._retry_at = time.time() + self._retry_delay
+                logger.warning(f"Building prefilter centroids failed, retrying in {self._retry_delay}s: {str(e)}")
+                self._retry_delay = min(self._retry_delay * 2, CENTROID_RETRY_MAX_SECONDS)
+            return
+        with self._centroid_lock:
+            self._centroids = np.vstack(rows)
+            self._building = False
+            self._retry_delay = CENTROID_RETRY_SECONDS
+        logger.info(f"Built prefilter centroids for {len(rows)} topics")
+
+    def _get_centroids(self) -> Optional[np.ndarray]:
+        """Cached centroids, None while they are not built yet (a build is started if due)"""
+        if self._centroids is None:
+            self.warm_up()
+        return self._centroids
@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from core.config import PromptConfig
+from core.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+PERSONA_INSTRUCTION = "Use the following settings as part of your personality and voice if applicable in the conversation context: "
+MAX_TRACKED_PREFIXES = 32
+
+PROMPT_PREFIXES = counter("radiant_prompt_prefix_total", "Assembled system prompts by whether their static prefix was sent before")
+
+class PromptAssembler:
+    """
+    Assembles system prompts as a byte-stable prefix followed by a per-call tail.
+
+    The prefix holds everything that does not change between calls (persona
+    base and, optionally, basic knowledge) so that provider-side prefix/KV
+    caches can hit. Randomly sampled persona settings and dynamic context are
+    always appended after it. The full trait catalogue can be added to the
+    prefix as well, but it changes what the model sees and costs tokens on
+    every call, so it is off by default.
+    """
+
+    def __init__(self, prompt_config: PromptConfig = None, include_catalogue: bool = None, include_knowledge: bool = None):
+        self.prompt_config = prompt_config or PromptConfig()
+        if include_catalogue is None:
+            include_catalogue = os.getenv("PROMPT_STATIC_CATALOGUE", "false").lower() == "true"
+        if include_knowledge is None:
+            include_knowledge = os.getenv("PROMPT_STATIC_KNOWLEDGE", "false").lower() == "true"
+        self.include_catalogue = include_catalogue
+        self.include_knowledge = include_knowledge
+        self._lock = threading.Lock()
+        self._prefix = None
+        self._prefix_hash = None
+        self._seen_prefixes = OrderedDict()
+        self._stats = {"calls": 0, "prefix_hits": 0, "prefix_misses": 0}
+
+    def static_prefix(self) -> str:
+        """
+        Build the static prefix from the current config. Rebuilt on every
+        call so a reloaded or edited config shows up as a new prefix.
+        """
+        sections = [self.prompt_config.get_system_prompt().rstrip()]
+        if self.include_catalogue:
+            sections.append(
+                "Personality traits you may draw on:\n- " + "\n- ".join(s.strip() for s in self.prompt_config.get_basic_settings())
+            )
+            sections.append(
+                "Interaction styles you may draw on:\n- " + "\n- ".join(s.strip() for s in self.prompt_config.get_interaction_styles())
+            )
+        if self.include_knowledge:
+            sections.append(self.prompt_config.get_basic_knowledge().rstrip())
+        return "\n\n".join(sections) + "\n\n"
+
+    def sample_persona(self) -> str:
+        """Randomly sample the per-call persona settings (goes in the tail)"""
+        basic_options = random.sample(self.prompt_config.get_basic_settings(), 2)
+        style_options = random.sample(self.prompt_config.get_interaction_styles(), 2)
+        return PERSONA_INSTRUCTION + ' '.join(basic_options) + ' ' + ' '.join(style_options)
+
+    def assemble(self, persona: Optional[str] = None, context: str = "") -> str:
+        """
+        Build a full system prompt.
+
+        Args:
+            persona: Per-call persona/instruction text, sampled if None
+            context: Dynamic context (similar conversations, memory, etc.)
+
+        Returns:
+            str: Static prefix followed by the dynamic tail
+        """
+        if persona is None:
+            persona = self.sample_persona()
+        prefix = self.static_prefix()
+        self._record(prefix)
+        return prefix + persona + (context or "")
+
+    def _record(self, prefix: str):
+        # Hash of the prefix this call actually sends, hits mean the provider cache can reuse it
+        prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            self._prefix = prefix
+            self._prefix_hash = prefix_hash
+            self._stats["calls"] += 1
+            hit = prefix_hash in self._seen_prefixes
+            if hit:
+                self._stats["prefix_hits"] += 1
+                self._seen_prefixes.move_to_end(prefix_hash)
+            else:
+                self._stats["prefix_misses"] += 1
+                self._seen_prefixes[prefix_hash] = True
+                if len(self._seen_prefixes) > MAX_TRACKED_PREFIXES:
+                    self._seen_prefixes.popitem(last=False)
+                logger.info(f"New system prompt prefix {prefix_hash} ({len(prefix)} chars)")
+        PROMPT_PREFIXES.inc(outcome="hit" if hit else "miss")
+
+    def get_stats(self) -> Dict[str, float]:
+        """Prefix-hash hit statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["prefix_hit_rate"] = stats["prefix_hits"] / stats["calls"] if stats["calls"] else 0.0
+        stats["prefix_hash"] = self._prefix_hash
+        return stats
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Mapping, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Budget headers as (remaining, reset) pairs; Twitter sends a 24h window on top of the 15 min one for posts
+BUDGET_HEADERS = (
+    ("x-rate-limit-remaining", "x-rate-limit-reset"),
+    ("x-user-limit-24hour-remaining", "x-user-limit-24hour-reset"),
+    ("x-app-limit-24hour-remaining", "x-app-limit-24hour-reset"),
+)
+
+class _EndpointBudget:
+    def __init__(self):
+        # Most restrictive known window: requests left and when it resets (epoch seconds)
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+        self.granted = 0
+        self.throttled = 0
+
+class RatePacer:
+    """
+    Paces calls to rate-limited HTTP endpoints from their rate-limit headers.
+
+    Responses report the remaining budget and reset time of each endpoint
+    (`update`). Callers reserve a slot before a call (`wait`/`wait_async`),
+    and slots are spread evenly over what is left of the window, so the
+    budget is used at the rate the account is allowed without bursting into
+    a 429. When the budget is gone or the server answers 429 (`penalize`),
+    the endpoint is blocked exactly until the window resets. Endpoints never
+    seen before are not paced. Works from both threads and event loops.
+    """
+
+    def __init__(self, default_backoff: float = None):
+        # Used on a 429 that carries no reset time
+        self.default_backoff = default_backoff if default_backoff is not None else float(os.getenv("RATE_LIMIT_BACKOFF", 900))
+        self._budgets: Dict[str, _EndpointBudget] = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, endpoint: str) -> _EndpointBudget:
+        budget = self._budgets.get(endpoint)
+        if budget is None:
+            budget = _EndpointBudget()
+            self._budgets[endpoint] = budget
+        return budget
+
+    def update(self, endpoint: str, headers: Mapping[str, str]):
+        """Record the budget reported by a response's rate-limit headers"""
+        now = time.time()
+        windows = []
+        for remaining_header, reset_header in BUDGET_HEADERS:
+            try:
+                windows.append((int(headers[remaining_header]), float(headers[reset_header])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        windows = [(remaining, reset_at) for remaining, reset_at in windows if reset_at > now]
+        if not windows:
+            return
+        # The window allowing the fewest requests per second decides the pace
+        remaining, reset_at = min(windows, key=lambda w: w[0] / (w[1] - now))
+        with self._lock:
+            budget = self._budget(endpoint)
+            budget.remaining = remaining
+            budget.reset_at = reset_at
+            if remaining <= 0:
+                budget.blocked_until = max(budget.blocked_until, reset_at)
+
+    def penalize(self, endpoint: str, headers: Optional[Mapping[str, str]] = None):
+        """Block an endpoint until its exhausted windows reset, after a 429"""
+        now = time.time()
+        exhausted = []
+        resets = []
+        for remaining_header, reset_header in BUDGET_HEADERS if headers else ():
+            try:
+                reset = float(headers[reset_header])
+            except (KeyError, TypeError, ValueError):
+                continue
+            resets.append(reset)
+            try:
+                if int(headers[remaining_header]) <= 0:
+                    exhausted.append(reset)
+            except (KeyError, TypeError, ValueError):
+                pass
+        # The call is allowed again once every exhausted window has reset (e.g. the 24h one,
+        # not just the 15 min one); without a remaining count, trust the latest reset given
+        if exhausted or resets:
+            reset_at = max(exhausted or resets)
+        else:
+            reset_at = now + self.default_backoff
+        with self._lock:
+            budget = self._budget(endpoint)
+            budget.remaining = 0
+            budget.reset_at = budget.blocked_until = max(budget.blocked_until, reset_at)
+            budget.throttled += 1
+        logger.warning(f"Rate limited on {endpoint}, pausing calls for {max(0.0, reset_at - now):.0f}s")
+
+    def blocked_for(self, endpoint: str) -> float:
+        """Seconds until the endpoint's window resets, 0 unless it is exhausted"""
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            return max(0.0, budget.blocked_until - time.time()) if budget else 0.0
+
+    def reserve(self, endpoint: str) -> float:
+        """Take the next slot of an endpoint, return the seconds to wait for it"""
+        with self._lock:
+            now = time.time()
+            budget = self._budget(endpoint)
+            start = max(now, budget.next_slot, budget.blocked_until)
+            if budget.remaining is None or start >= budget.reset_at:
+                # Unknown or fresh window, the next response tells the real budget
+                spacing = 0.0
+            elif budget.remaining > 0:
+                spacing = (budget.reset_at - start) / budget.remaining
+                budget.remaining -= 1
+            else:
+                start = max(start, budget.reset_at)
+                spacing = 0.0
+            budget.next_slot = start + spacing
+            budget.granted += 1
+            return start - now
+
+    def wait(self, endpoint: str) -> float:
+        """Block the calling thread until the endpoint's next slot"""
+        delay = self.reserve(endpoint)
+        if delay > 0:
+            logger.info(f"Pacing {endpoint}: waiting {delay:.1f}s")
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self, endpoint: str) -> float:
+        """Wait on the event loop until the endpoint's next slot"""
+        delay = self.reserve(endpoint)
+        if delay > 0:
+            logger.info(f"Pacing {endpoint}: waiting {delay:.1f}s")
+            await asyncio.sleep(delay)
+        return delay
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Known budget and counters per endpoint"""
+        with self._lock:
+            now = time.time()
+            return {
+                endpoint: {
+                    "remaining": budget.remaining,
+                    "resets_in": max(0.0, budget.reset_at - now),
+                    "blocked_for": max(0.0, budget.blocked_until - now),
+                    "granted": budget.granted,
+                    "throttled": budget.throttled
+                }
+                for endpoint, budget in self._budgets.items()
+            }
+
+_pacer: Optional[RatePacer] = None
+_pacer_lock = threading.Lock()
+
+def get_pacer() -> RatePacer:
+    """Return the process-wide rate pacer"""
+    global _pacer
+    with _pacer_lock:
+        if _pacer is None:
+            _pacer = RatePacer()
+        return _pacer
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Iterable, List
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SeenIndexConfig:
+    """Configuration for the persistent seen-ID index"""
+    # Keep a Bloom filter instead of the full id set in memory
+    use_bloom: bool = os.getenv("SEEN_INDEX_BLOOM", "false").lower() == "true"
+    capacity: int = int(os.getenv("SEEN_INDEX_CAPACITY", 1000000))
+    false_positive_rate: float = float(os.getenv("SEEN_INDEX_FP_RATE", 0.001))
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for `capacity` items at `false_positive_rate`"""
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+class SeenIdIndex:
+    """
+    Every id a queue has ever seen, persisted in a `seen_ids` table and
+    mirrored in memory so membership checks cost O(1).
+
+    The in-memory side is an exact set, or with `use_bloom` a Bloom filter
+    whose positive answers are confirmed with one indexed lookup, which
+    keeps memory flat for very large histories. Ids added by other processes
+    sharing the database are picked up incrementally (rows past the last
+    seen rowid) on each check, so monitor and workers share one view.
+    """
+
+    def __init__(self, name: str, db_path: str, config: SeenIndexConfig = None):
+        self.name = name
+        self.config = config or SeenIndexConfig()
+        self.conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._ids = BloomFilter(self.config.capacity, self.config.false_positive_rate) if self.config.use_bloom else set()
+        self._last_rowid = 0
+        self._count = 0
+        with self._lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS seen_ids (
+                    queue TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    PRIMARY KEY (queue, item_id)
+                )
+            """)
+        self._refresh()
+        logger.info(f"Loaded {self._count} seen ids for {name} ({'bloom filter' if self.config.use_bloom else 'set'})")
+
+    def _refresh(self):
+        """Load ids added since the last refresh, by this or another process"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT rowid, item_id FROM seen_ids WHERE queue = ? AND rowid > ? ORDER BY rowid",
+                (self.name, self._last_rowid)
+            ).fetchall()
+            for rowid, item_id in rows:
+                self._ids.add(item_id)
+            if rows:
+                self._last_rowid = rows[-1][0]
+                self._count += len(rows)
+
+    def add(self, item_id: str):
+        self.add_many([item_id])
+
+    def add_many(self, item_ids: Iterable[str]):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_ids (queue, item_id) VALUES (?, ?)",
+                ((self.name, str(item_id)) for item_id in item_ids)
+            )
+        # New rows reach memory through the same path as other processes' ids
+        self._refresh()
+
+    def _contains(self, item_id: str) -> bool:
+        if item_id not in self._ids:
+            return False
+        if not self.config.use_bloom:
+            return True
+        # Bloom filter hit, rule out a false positive
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM seen_ids WHERE queue = ? AND item_id = ?", (self.name, item_id)
+            ).fetchone() is not None
+
+    def __contains__(self, item_id: str) -> bool:
+        self._refresh()
+        return self._contains(str(item_id))
+
+    def unseen(self, item_ids: Iterable[str]) -> List[str]:
+        """Ids from `item_ids` that were never seen, in order, with one refresh for the batch"""
+        self._refresh()
+        return [item_id for item_id in item_ids if not self._contains(str(item_id))]
+
+    def __len__(self) -> int:
+        return self._count
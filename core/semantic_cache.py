@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from core.metrics import counter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_OFF = "off"
+CACHE_EXACT = "exact"
+CACHE_PARAPHRASE = "paraphrase"
+
+# Response type of replies that depended on conversation memory, never served to other conversations
+CONTEXTUAL_RESPONSE = "CONTEXTUAL"
+
+# Weight of the latest observation in the per-interface generation time average
+MISS_LATENCY_ALPHA = 0.2
+
+@dataclass
+class SemanticCacheConfig:
+    """Configuration for serving past responses to near-identical questions"""
+    mode: str = os.getenv("SEMANTIC_CACHE_MODE", CACHE_OFF).lower()
+    threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.97))
+    ttl_seconds: float = float(os.getenv("SEMANTIC_CACHE_TTL", 86400))
+
+@dataclass
+class CacheHit:
+    """A stored response that may be served instead of calling the LLM"""
+    question: str
+    response: str
+    similarity: float
+    age_seconds: float
+
+CACHE_LOOKUPS = counter("radiant_semantic_cache_lookups_total", "Cacheable requests by source interface and result")
+CACHE_SECONDS_SAVED = counter("radiant_semantic_cache_seconds_saved_total", "Generation time saved by cache hits")
+
+def _age_seconds(timestamp) -> Optional[float]:
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            return None
+    if not isinstance(timestamp, datetime):
+        return None
+    now = datetime.now(timezone.utc) if timestamp.tzinfo else datetime.now()
+    return (now - timestamp).total_seconds()
+
+class SemanticResponseCache:
+    """
+    Looks up a fresh past response to a near-duplicate question.
+
+    Uses the similar messages handle_message already found, so a lookup costs
+    one indexed query per candidate above the threshold. Responses that came
+    with a tool call (images, price lookups) or that depended on conversation
+    memory are never served from cache. Hit rates and the generation time
+    saved are tracked per interface and exported as metrics.
+    """
+
+    def __init__(self, message_store, config: SemanticCacheConfig = None):
+        self.message_store = message_store
+        self.config = config or SemanticCacheConfig()
+        if self.config.mode not in (CACHE_OFF, CACHE_EXACT, CACHE_PARAPHRASE):
+            logger.warning(f"Unknown SEMANTIC_CACHE_MODE {self.config.mode}, cache disabled")
+            self.config.mode = CACHE_OFF
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.mode != CACHE_OFF
+
+    @property
+    def paraphrase(self) -> bool:
+        return self.config.mode == CACHE_PARAPHRASE
+
+    def lookup(self, similar_messages: List[Dict[str, Any]]) -> Optional[CacheHit]:
+        """
+        Find a cacheable response. Blocking, run it off the event loop.
+
+        Args:
+            similar_messages: Results of MessageStore.find_similar_messages,
+                sorted by similarity
+
+        Returns:
+            CacheHit or None
+        """
+        if not self.enabled:
+            return None
+        for similar in similar_messages:
+            similarity = float(similar.get('similarity', 0))
+            if similarity < self.config.threshold:
+                break
+            responses = self.message_store.find_messages(
+                message_type='agent_response',
+                original_query=similar['message']
+            )
+            for response in responses:
+                if not response['message'] or response.get('tool_call') or response.get('response_type') == CONTEXTUAL_RESPONSE:
+                    continue
+                age = _age_seconds(response['timestamp'])
+                if age is None or age > self.config.ttl_seconds:
+                    # Newest first, older ones are stale too
+                    break
+                return CacheHit(similar['message'], response['message'], similarity, age)
+        return None
+
+    def record(self, source_interface: Optional[str], hit: bool, seconds: float):
+        """
+        Account for one cacheable request.
+
+        Args:
+            source_interface: Interface the request came from
+            hit: Whether it was served from cache
+            seconds: Time spent producing the response
+        """
+        source = source_interface or "unknown"
+        CACHE_LOOKUPS.inc(source=source, result="hit" if hit else "miss")
+        with self._lock:
+            stats = self._stats.setdefault(source, {
+                "lookups": 0, "hits": 0, "avg_miss_seconds": 0.0, "seconds_saved": 0.0
+            })
+            stats["lookups"] += 1
+            if hit:
+                stats["hits"] += 1
+                saved = max(0.0, stats["avg_miss_seconds"] - seconds)
+                stats["seconds_saved"] += saved
+                CACHE_SECONDS_SAVED.inc(saved, source=source)
+            elif stats["avg_miss_seconds"]:
+                stats["avg_miss_seconds"] += MISS_LATENCY_ALPHA * (seconds - stats["avg_miss_seconds"])
+            else:
+                stats["avg_miss_seconds"] = seconds
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Lookups, hits, hit rate and latency saved per interface"""
+        with self._lock:
+            return {
+                source: dict(stats, hit_rate=stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0)
+                for source, stats in self._stats.items()
+            }
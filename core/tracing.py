@@ -0,0 +1,282 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXPORTER_NONE = "none"
+EXPORTER_JSONL = "jsonl"
+EXPORTER_COLLECTOR = "collector"
+
+@dataclass
+class TracingConfig:
+    """Configuration for hot-path tracing"""
+    enabled: bool = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    # Fraction of root spans (requests, worker iterations) that are recorded
+    sample_rate: float = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+    exporter: str = os.getenv("TRACE_EXPORTER", EXPORTER_JSONL).lower()
+    file_path: str = os.getenv("TRACE_FILE", "traces.jsonl")
+    collector_url: str = os.getenv("TRACE_COLLECTOR_URL", "http://localhost:4318/spans")
+    buffer_size: int = int(os.getenv("TRACE_BUFFER_SIZE", 1000))
+    export_queue_size: int = 10000
+    export_batch_size: int = 200
+    export_interval: float = 2.0
+
+@dataclass
+class Span:
+    """One timed operation. Finished spans are exported as flat dicts."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time: float = 0.0
+    duration_ms: float = 0.0
+    status: str = "ok"
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    _started: float = 0.0
+
+    def set(self, key: str, value: Any) -> 'Span':
+        self.attributes[key] = value
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+class _NoopSpan:
+    """Stand-in when tracing is off or the trace was not sampled"""
+    sampled = False
+
+    def set(self, key: str, value: Any) -> '_NoopSpan':
+        return self
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+# Innermost open span of the current task/thread; _NOOP marks an unsampled trace.
+# asyncio tasks and asyncio.to_thread copy it, so child spans find their parent.
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+class _SpanScope:
+    """Context manager that opens a span and restores the parent on exit"""
+
+    def __init__(self, tracer: 'Tracer', span: Span):
+        self.tracer = tracer
+        self.span = span
+        self.token = None
+
+    def __enter__(self) -> Span:
+        self.span.start_time = time.time()
+        self.span._started = time.perf_counter()
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration_ms = (time.perf_counter() - self.span._started) * 1000
+        if exc_type is not None:
+            # Cancellation is how hedging and pipelines stop losing work, not a failure
+            self.span.status = "cancelled" if exc_type.__name__ == "CancelledError" else "error"
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        self.tracer._finish(self.span)
+        return False
+
+class _UnsampledScope:
+    """Marks the rest of a trace as unsampled so children stay no-ops"""
+
+    def __init__(self):
+        self.token = None
+
+    def __enter__(self) -> _NoopSpan:
+        self.token = _current_span.set(_NOOP)
+        return _NOOP
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.token)
+        return False
+
+class Tracer:
+    """
+    Records spans for the hot paths (message stages, LLM, embedding, search,
+    tools, platform APIs).
+
+    A span opened without an active parent starts a new trace, sampled with
+    `sample_rate`; spans opened inside it become children. When tracing is
+    disabled or the trace is not sampled, span() returns a shared no-op, so
+    instrumentation costs one context variable lookup. Finished spans go to
+    an in-process ring buffer and, through a background thread, to the
+    configured exporter: a JSONL file or an HTTP collector that accepts JSON
+    arrays of spans.
+    """
+
+    def __init__(self, config: TracingConfig = None):
+        self.config = config or TracingConfig()
+        self._buffer = deque(maxlen=self.config.buffer_size)
+        self._buffer_lock = threading.Lock()
+        self._export_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=self.config.export_queue_size)
+        self._exporter_thread: Optional[threading.Thread] = None
+        self._stats = {"spans": 0, "exported": 0, "dropped": 0, "export_failures": 0}
+        if self.config.enabled and self.config.exporter not in (EXPORTER_NONE, EXPORTER_JSONL, EXPORTER_COLLECTOR):
+            logger.warning(f"Unknown TRACE_EXPORTER {self.config.exporter}, keeping spans in memory only")
+            self.config.exporter = EXPORTER_NONE
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def span(self, name: str, **attributes):
+        """
+        Open a span as a context manager, e.g. `with tracer.span("llm", model=m) as s:`.
+
+        Returns:
+            A context manager yielding the Span (or a no-op with the same
+            `set` method)
+        """
+        if not self.config.enabled:
+            return _NOOP
+        parent = _current_span.get()
+        if parent is _NOOP:
+            return _NOOP
+        if parent is None:
+            if random.random() >= self.config.sample_rate:
+                return _UnsampledScope()
+            span = Span(name, trace_id=uuid.uuid4().hex, span_id=uuid.uuid4().hex[:16], attributes=attributes)
+        else:
+            span = Span(name, trace_id=parent.trace_id, span_id=uuid.uuid4().hex[:16],
+                        parent_id=parent.span_id, attributes=attributes)
+        return _SpanScope(self, span)
+
+    def current(self):
+        """Innermost open span, or a no-op outside a sampled trace"""
+        span = _current_span.get()
+        return span if isinstance(span, Span) else _NOOP
+
+    def verbose(self) -> bool:
+        """Whether the current request is being traced, gates full prompt dumps"""
+        return isinstance(_current_span.get(), Span)
+
+    def _finish(self, span: Span):
+        record = span.to_dict()
+        with self._buffer_lock:
+            self._buffer.append(record)
+            self._stats["spans"] += 1
+        if self.config.exporter == EXPORTER_NONE:
+            return
+        self._ensure_exporter()
+        try:
+            self._export_queue.put_nowait(record)
+        except queue.Full:
+            with self._buffer_lock:
+                self._stats["dropped"] += 1
+
+    def _ensure_exporter(self):
+        if self._exporter_thread is None:
+            with self._buffer_lock:
+                if self._exporter_thread is None:
+                    self._exporter_thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                    self._exporter_thread.start()
+
+    def _export_loop(self):
+        while True:
+            batch = [self._export_queue.get()]
+            deadline = time.monotonic() + self.config.export_interval
+            while len(batch) < self.config.export_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._export_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._export(batch)
+                with self._buffer_lock:
+                    self._stats["exported"] += len(batch)
+            except Exception as e:
+                with self._buffer_lock:
+                    self._stats["export_failures"] += 1
+                logger.warning(f"Failed to export {len(batch)} spans: {str(e)}")
+
+    def _export(self, batch: List[Dict[str, Any]]):
+        if self.config.exporter == EXPORTER_JSONL:
+            with open(self.config.file_path, "a") as f:
+                for record in batch:
+                    f.write(json.dumps(record, default=str) + "\n")
+        elif self.config.exporter == EXPORTER_COLLECTOR:
+            response = requests.post(self.config.collector_url, json=batch, timeout=5)
+            response.raise_for_status()
+
+    def recent(self, limit: int = 100, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent finished spans from the ring buffer, optionally of one trace"""
+        with self._buffer_lock:
+            spans = list(self._buffer)
+        if trace_id is not None:
+            spans = [s for s in spans if s["trace_id"] == trace_id]
+        return spans[-limit:]
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._buffer_lock:
+            return dict(self._stats, queued=self._export_queue.qsize())
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+def span(name: str, **attributes):
+    """Open a span on the process-wide tracer, see Tracer.span"""
+    return get_tracer().span(name, **attributes)
+
+def traced(name: Optional[str] = None):
+    """Decorator wrapping every call of a sync or async function in a span"""
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
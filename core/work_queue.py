@@ -0,0 +1,467 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+from core.seen_index import SeenIdIndex
+from core.archive import ReplyArchive
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Item states
+PENDING = "pending"
+PROCESSING = "processing"
+PROCESSED = "processed"
+# Gave up after max_attempts, kept for inspection and manual requeue
+DEAD = "dead"
+
+REPLY_QUEUE_DB = os.getenv("REPLY_QUEUE_DB", "reply_queue.db")
+
+@dataclass
+class WorkQueueConfig:
+    """Lease and retry settings of a work queue"""
+    # A claimed item is handed out again if its lease is not renewed in time
+    lease_seconds: float = float(os.getenv("REPLY_LEASE_SECONDS", 300))
+    max_attempts: int = int(os.getenv("REPLY_MAX_ATTEMPTS", 3))
+    retry_delay: float = float(os.getenv("REPLY_RETRY_DELAY", 60))
+    # Processed items older than this move to the compressed archive
+    archive_after: float = float(os.getenv("REPLY_ARCHIVE_AFTER_DAYS", 7)) * 86400
+    archive_interval: float = 3600
+    archive_batch_size: int = 1000
+    busy_timeout: float = 5.0
+
+@dataclass
+class WorkItem:
+    """A claimed queue item and the lease it is held under"""
+    item_id: str
+    payload: Dict[str, Any]
+    enqueued_at: float
+    owner: str
+    attempts: int
+    lease_expires: float
+
+def new_owner_id() -> str:
+    """Unique lease owner id for one worker"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Columns added after the first schema version, with their definitions
+_LEASE_COLUMNS = {
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "available_at": "REAL NOT NULL DEFAULT 0",
+    "lease_owner": "TEXT",
+    "lease_expires": "REAL",
+    "last_error": "TEXT",
+}
+
+class SQLiteWorkQueue:
+    """
+    Durable FIFO work queue in SQLite (WAL mode).
+
+    Items move pending -> processing -> processed. Every operation touches
+    one row through an index, so cost no longer depends on how much history
+    the queue holds. Several named queues can share one database file;
+    claims run in BEGIN IMMEDIATE transactions, so concurrent workers (also
+    in other processes) never claim the same item.
+
+    A claim is a lease: the worker must complete, fail or heartbeat the item
+    before `lease_seconds` pass, otherwise the next claim hands it out again.
+    Failed and expired items are retried after `retry_delay` until
+    `max_attempts` claims were made, then they move to the dead state.
+    Completing requires the lease, so a worker that lost its lease cannot
+    overwrite the outcome of the worker that took over.
+
+    `seen` indexes every id the queue ever accepted, including ids whose
+    items were later archived, for O(1) deduplication before enqueueing.
+    Processed items are moved to a ReplyArchive after `archive_after`, so
+    the live table only holds a recent window.
+    """
+
+    def __init__(self, name: str, db_path: str = None, config: WorkQueueConfig = None):
+        self.name = name
+        self.db_path = db_path or REPLY_QUEUE_DB
+        self.config = config or WorkQueueConfig()
+        # Transactions are managed explicitly, see _transaction
+        self.conn = sqlite3.connect(self.db_path, timeout=self.config.busy_timeout, isolation_level=None, check_same_thread=False)
+        # Monitor thread and worker loop share the connection
+        self._lock = threading.Lock()
+        self._last_archive = 0.0
+        self._initialize()
+        self.seen = SeenIdIndex(name, self.db_path)
+        if not len(self.seen):
+            # First start with the index, record the ids already queued
+            self.seen.add_many(self.ids())
+
+    def _initialize(self):
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS work_items (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    item_id TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    enqueued_at REAL NOT NULL,
+                    claimed_at REAL,
+                    completed_at REAL,
+                    UNIQUE (queue, item_id)
+                )
+            """)
+            existing = {row[1] for row in self.conn.execute("PRAGMA table_info(work_items)")}
+            for column, definition in _LEASE_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE work_items ADD COLUMN {column} {definition}")
+            # Claims scan pending items in enqueue order
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_work_items_state ON work_items (queue, state, seq)")
+            # Small per-queue state of producers, e.g. ingestion cursors
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS work_queue_meta (
+                    queue TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    PRIMARY KEY (queue, key)
+                )
+            """)
+        logger.info(f"Initialized work queue {self.name} at {self.db_path}")
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database write lock up front"""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self.conn.execute("COMMIT")
+
+    def enqueue(self, item_id: str, payload: Dict[str, Any]) -> bool:
+        """
+        Add an item unless the queue has already seen its id.
+
+        Returns:
+            bool: True if the item was added
+        """
+        if item_id in self.seen:
+            return False
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO work_items (queue, item_id, state, payload, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (self.name, str(item_id), PENDING, json.dumps(payload), time.time())
+            )
+        self.seen.add(item_id)
+        return cur.rowcount == 1
+
+    def claim(self, owner: str) -> Optional[WorkItem]:
+        """
+        Lease the oldest available pending item, re-delivering expired leases first.
+
+        Args:
+            owner: Lease owner id of the calling worker, see new_owner_id
+
+        Returns:
+            WorkItem, None if nothing is available
+        """
+        now = time.time()
+        lease_expires = now + self.config.lease_seconds
+        with self._transaction() as conn:
+            self._expire_leases(conn, now)
+            row = conn.execute(
+                "SELECT seq, item_id, payload, enqueued_at, attempts FROM work_items "
+                "WHERE queue = ? AND state = ? AND available_at <= ? ORDER BY seq LIMIT 1",
+                (self.name, PENDING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            seq, item_id, payload, enqueued_at, attempts = row
+            conn.execute(
+                "UPDATE work_items SET state = ?, claimed_at = ?, attempts = ?, lease_owner = ?, lease_expires = ? WHERE seq = ?",
+                (PROCESSING, now, attempts + 1, owner, lease_expires, seq)
+            )
+        return WorkItem(item_id, json.loads(payload), enqueued_at, owner, attempts + 1, lease_expires)
+
+    def _expire_leases(self, conn, now: float):
+        """Return items whose lease ran out to pending, or dead after max_attempts"""
+        # Items claimed before leases existed have no expiry and are reclaimed too
+        expired = conn.execute(
+            "SELECT seq, item_id, attempts FROM work_items "
+            "WHERE queue = ? AND state = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+            (self.name, PROCESSING, now)
+        ).fetchall()
+        for seq, item_id, attempts in expired:
+            state = DEAD if attempts >= self.config.max_attempts else PENDING
+            conn.execute(
+                "UPDATE work_items SET state = ?, lease_owner = NULL, lease_expires = NULL, "
+                "available_at = ?, last_error = ? WHERE seq = ?",
+                (state, now, "lease expired", seq)
+            )
+            logger.warning(f"Lease on {self.name} item {item_id} expired after attempt {attempts}, moved to {state}")
+
+    def heartbeat(self, item: WorkItem) -> bool:
+        """
+        Extend the lease on a claimed item.
+
+        Returns:
+            bool: False if the lease was lost, the worker should stop and not complete the item
+        """
+        lease_expires = time.time() + self.config.lease_seconds
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE work_items SET lease_expires = ? WHERE queue = ? AND item_id = ? AND state = ? AND lease_owner = ?",
+                (lease_expires, self.name, str(item.item_id), PROCESSING, item.owner)
+            )
+        if cur.rowcount == 1:
+            item.lease_expires = lease_expires
+            return True
+        return False
+
+    def complete(self, item: WorkItem, result: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Mark a leased item as processed and store its result.
+
+        Returns:
+            bool: False if the lease was lost in the meantime
+        """
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE work_items SET state = ?, result = ?, completed_at = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE queue = ? AND item_id = ? AND state = ? AND lease_owner = ?",
+                (PROCESSED, json.dumps(result) if result is not None else None, time.time(),
+                 self.name, str(item.item_id), PROCESSING, item.owner)
+            )
+        if cur.rowcount != 1:
+            logger.warning(f"Lease on {self.name} item {item.item_id} was lost, result not recorded")
+            return False
+        return True
+
+    def fail(self, item: WorkItem, error: str) -> str:
+        """
+        Give a leased item back after a failed attempt.
+
+        Returns:
+            str: New state, pending (retried after retry_delay) or dead
+        """
+        state = DEAD if item.attempts >= self.config.max_attempts else PENDING
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE work_items SET state = ?, available_at = ?, last_error = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE queue = ? AND item_id = ? AND state = ? AND lease_owner = ?",
+                (state, time.time() + self.config.retry_delay, error,
+                 self.name, str(item.item_id), PROCESSING, item.owner)
+            )
+        if cur.rowcount != 1:
+            logger.warning(f"Lease on {self.name} item {item.item_id} was lost, failure not recorded")
+            return PROCESSING
+        if state == DEAD:
+            logger.error(f"{self.name} item {item.item_id} failed {item.attempts} times, moved to dead letters: {error}")
+        return state
+
+    def release(self, item: WorkItem, delay: Optional[float] = None) -> bool:
+        """
+        Give a leased item back without counting the attempt, e.g. when the request was shed.
+
+        Returns:
+            bool: False if the lease was lost in the meantime
+        """
+        delay = self.config.retry_delay if delay is None else delay
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE work_items SET state = ?, attempts = MAX(attempts - 1, 0), available_at = ?, "
+                "lease_owner = NULL, lease_expires = NULL "
+                "WHERE queue = ? AND item_id = ? AND state = ? AND lease_owner = ?",
+                (PENDING, time.time() + delay, self.name, str(item.item_id), PROCESSING, item.owner)
+            )
+        if cur.rowcount != 1:
+            logger.warning(f"Lease on {self.name} item {item.item_id} was lost, release not recorded")
+            return False
+        return True
+
+    def requeue_dead(self, item_id: str) -> bool:
+        """Give a dead item a fresh set of attempts"""
+        with self._lock:
+            cur = self.conn.execute(
+                "UPDATE work_items SET state = ?, attempts = 0, available_at = 0 WHERE queue = ? AND item_id = ? AND state = ?",
+                (PENDING, self.name, str(item_id), DEAD)
+            )
+            return cur.rowcount == 1
+
+    def contains(self, item_id: str) -> bool:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM work_items WHERE queue = ? AND item_id = ?", (self.name, str(item_id))
+            ).fetchone() is not None
+
+    def ids(self, *states: str) -> Set[str]:
+        """Ids of items in the given states, all items without states"""
+        query = "SELECT item_id FROM work_items WHERE queue = ?"
+        params = [self.name]
+        if states:
+            query += f" AND state IN ({', '.join('?' for _ in states)})"
+            params.extend(states)
+        with self._lock:
+            return {row[0] for row in self.conn.execute(query, params)}
+
+    def count(self, *states: str) -> int:
+        """Number of items in the given states, all items without states"""
+        query = "SELECT COUNT(*) FROM work_items WHERE queue = ?"
+        params = [self.name]
+        if states:
+            query += f" AND state IN ({', '.join('?' for _ in states)})"
+            params.extend(states)
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    def archive_processed(self, archive: ReplyArchive = None, older_than: float = None) -> int:
+        """
+        Move processed items completed more than `older_than` seconds ago to
+        the archive. Each batch is written and deleted in one transaction, so
+        concurrent processes never archive the same item twice.
+
+        Returns:
+            int: Number of archived items
+        """
+        archive = archive or ReplyArchive()
+        cutoff = time.time() - (self.config.archive_after if older_than is None else older_than)
+        total = 0
+        while True:
+            with self._transaction() as conn:
+                rows = conn.execute(
+                    "SELECT seq, item_id, payload, result, enqueued_at, completed_at, attempts FROM work_items "
+                    "WHERE queue = ? AND state = ? AND completed_at < ? ORDER BY seq LIMIT ?",
+                    (self.name, PROCESSED, cutoff, self.config.archive_batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                archive.append(self.name, [
+                    {
+                        "item_id": item_id,
+                        "payload": json.loads(payload),
+                        "result": json.loads(result) if result else None,
+                        "enqueued_at": enqueued_at,
+                        "completed_at": completed_at,
+                        "attempts": attempts
+                    }
+                    for _, item_id, payload, result, enqueued_at, completed_at, attempts in rows
+                ])
+                conn.executemany("DELETE FROM work_items WHERE seq = ?", [(row[0],) for row in rows])
+            total += len(rows)
+        if total:
+            logger.info(f"Archived {total} processed {self.name} items to {archive.archive_dir}")
+        return total
+
+    def maybe_archive(self, archive: ReplyArchive = None) -> int:
+        """Run archive_processed at most once per `archive_interval`, for periodic loops"""
+        if time.time() - self._last_archive < self.config.archive_interval:
+            return 0
+        self._last_archive = time.time()
+        try:
+            return self.archive_processed(archive)
+        except Exception as e:
+            logger.error(f"Archiving {self.name} failed: {str(e)}")
+            return 0
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM work_queue_meta WHERE queue = ? AND key = ?", (self.name, key)
+            ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO work_queue_meta (queue, key, value) VALUES (?, ?, ?)",
+                (self.name, key, value)
+            )
+
+    def get_stats(self) -> Dict[str, int]:
+        """Item count per state"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM work_items WHERE queue = ? GROUP BY state", (self.name,)
+            ).fetchall()
+        return {state: 0 for state in (PENDING, PROCESSING, PROCESSED, DEAD)} | dict(rows)
+
+    def import_items(self, items: Iterable[Tuple[str, str, Dict[str, Any], Optional[Dict[str, Any]]]]) -> int:
+        """
+        Bulk load (item_id, state, payload, result) tuples in one transaction,
+        keeping their order. Items already in the queue are skipped.
+
+        Returns:
+            int: Number of items added
+        """
+        now = time.time()
+        added = 0
+        items = list(items)
+        with self._transaction() as conn:
+            for item_id, state, payload, result in items:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO work_items (queue, item_id, state, payload, result, enqueued_at, completed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.name, str(item_id), state, json.dumps(payload),
+                     json.dumps(result) if result is not None else None, now,
+                     now if state == PROCESSED else None)
+                )
+                added += cur.rowcount
+        self.seen.add_many(item_id for item_id, _, _, _ in items)
+        return added
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+class LeaseKeeper:
+    """
+    Async context manager that heartbeats a claimed item while its work runs.
+
+    `lost` turns True if a heartbeat finds the lease gone (it expired and the
+    item was handed to another worker); the caller should then not act on
+    the item any further.
+    """
+
+    def __init__(self, queue: SQLiteWorkQueue, item: WorkItem, interval: Optional[float] = None):
+        self.queue = queue
+        self.item = item
+        self.interval = interval or queue.config.lease_seconds / 3
+        self.lost = False
+        self._task = None
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not await asyncio.to_thread(self.queue.heartbeat, self.item):
+                self.lost = True
+                logger.warning(f"Lost lease on {self.queue.name} item {self.item.item_id}")
+                return
+
+    async def confirm(self) -> bool:
+        """Renew the lease right now, call before a side effect that must not happen twice"""
+        if not self.lost and not await asyncio.to_thread(self.queue.heartbeat, self.item):
+            self.lost = True
+            logger.warning(f"Lost lease on {self.queue.name} item {self.item.item_id}")
+        return not self.lost
+
+    async def __aenter__(self) -> 'LeaseKeeper':
+        self._task = asyncio.ensure_future(self._beat())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return False
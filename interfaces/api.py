@@ -1,8 +1,10 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 import logging
 import os
 from pathlib import Path
 from agents.core_agent import CoreAgent
+from core.deadline import request_deadline
+from core.metrics import CONTENT_TYPE, get_registry
 import dotenv
 from functools import wraps
 
@@ -84,7 +86,10 @@ class FlaskAgent(CoreAgent):
                     data['message'],
                     source_interface='api',
                     chat_id=chat_id,
-                    external_tools=external_tools
+                    external_tools=external_tools,
+                    deadline=request_deadline('api'),
+                    # Callers share one API key, queue anonymous ones by address
+                    client_id=request.remote_addr
                 )
                 print(tool_calls)
                 if self._parent != self:
@@ -104,6 +109,11 @@ class FlaskAgent(CoreAgent):
                 logger.error(f"Message handling failed: {str(e)}")
                 return jsonify({'error': 'Internal server error'}), 500
 
+        # Prometheus scrape endpoint, e.g. curl http://localhost:5005/metrics
+        @self._app.route('/metrics', methods=['GET'])
+        def metrics():
+            return Response(get_registry().render(), mimetype=CONTENT_TYPE)
+
 def main():
     agent = FlaskAgent()
     agent.run()
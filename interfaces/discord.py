@@ -11,6 +11,7 @@ from typing import Dict, Any, List, Optional
 import dotenv
 import yaml
 from agents.core_agent import CoreAgent
+from core.deadline import request_deadline
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -63,9 +64,13 @@ class DiscordAgent(CoreAgent):
                 # Get user message
                 user_message = message.content.strip().lower()
 
-                text_response, image_url, extra_data = await self.handle_message(user_message)
+                text_response, image_url, extra_data = await self.handle_message(
+                    user_message,
+                    source_interface='discord',
+                    conversation_id=str(message.channel.id),
+                    deadline=request_deadline('discord')
+                )
                 logger.debug(f"Extra data returned from handle_message: {extra_data}")
-                text_response, image_url, _ = await self.handle_message(user_message)
 
                 if image_url:
                     embed = discord.Embed(title="Here you go!", color=discord.Color.blue())
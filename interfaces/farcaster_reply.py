@@ -8,6 +8,7 @@ import json
 import logging
 import asyncio
 import threading
+import sqlite3
 import yaml
 from typing import Dict, Optional, List
 from urllib.request import urlopen
@@ -19,6 +20,8 @@ from functools import lru_cache
 from core.config import PromptConfig
 from core.imgen import generate_image_convo_prompt, generate_image_with_retry
 from agents.core_agent import CoreAgent
+from core.metrics import QUEUE_DEPTH, platform_call
+from core.work_queue import SQLiteWorkQueue, WorkItem, LeaseKeeper, new_owner_id, PENDING, PROCESSED
 from utils.text_utils import strip_tweet_text
 from utils.llm_utils import should_ignore_message
 
@@ -45,77 +48,113 @@ IMAGE_GENERATION_PROBABILITY = 1
 print(f"{'DRYRUN' if DRYRUN else 'LIVE'} MODE: {'Not posting' if DRYRUN else 'Will post'} real casts")
 
 class QueueManager:
-    def __init__(self, file_path="farcaster_reply_history.json"):
-        self.file_path = Path(file_path)
-        self._ensure_file_exists()
-    
-    def _ensure_file_exists(self):
-        if not self.file_path.exists():
-            self.write_data({
-                "processed_replies": {},
-                "pending_replies": {},
-                "conversation_threads": {}
-            })
-    
-    def read_data(self) -> Dict:
+    """
+    Reply queue and conversation threads of FarcasterReplyAgent in SQLite.
+    Replies go through core.work_queue.SQLiteWorkQueue (leases, retries,
+    dead letters); an existing farcaster_reply_history.json is imported once.
+    """
+    def __init__(self, file_path="farcaster_reply_history.json", db_path=None):
+        self.queue = SQLiteWorkQueue("farcaster_reply", db_path)
+        self.conn = sqlite3.connect(self.queue.db_path, timeout=5, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS farcaster_threads (
+                    root_hash TEXT NOT NULL,
+                    cast_hash TEXT NOT NULL,
+                    timestamp TEXT,
+                    text TEXT NOT NULL DEFAULT '',
+                    author TEXT,
+                    parent_hash TEXT,
+                    PRIMARY KEY (root_hash, cast_hash)
+                )
+            """)
+        self._migrate_json(Path(file_path))
+
+    def _migrate_json(self, file_path: Path):
+        """Import the JSON history once and rename the file"""
+        if not file_path.exists():
+            return
         try:
-            with self.file_path.open('r') as f:
+            with file_path.open('r') as f:
                 data = json.load(f)
-                data.setdefault("conversation_threads", {})
-                return data
-        except json.JSONDecodeError:
-            return {"processed_replies": {}, "pending_replies": {}, "conversation_threads": {}}
-    
-    def write_data(self, data: Dict):
-        try:
-            with self.file_path.open('w') as f:
-                json.dump(data, f, indent=2)
         except Exception as e:
-            logger.error(f"Database write error: {str(e)}")
+            logger.error(f"Error reading reply history for migration: {str(e)}")
+            return
+        items = [
+            (cast_hash, PROCESSED, reply, reply)
+            for cast_hash, reply in data.get("processed_replies", {}).items()
+        ] + [
+            (cast_hash, PENDING, reply, None)
+            for cast_hash, reply in data.get("pending_replies", {}).items()
+        ]
+        added = self.queue.import_items(items)
+        for root_hash, thread in data.get("conversation_threads", {}).items():
+            for cast in thread:
+                self._store_thread_cast(root_hash, cast)
+        file_path.rename(file_path.with_name(file_path.name + ".migrated"))
+        logger.info(f"Migrated {added} casts from {file_path} to {self.queue.db_path}")
+
+    def _store_thread_cast(self, root_hash: str, cast: Dict):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO farcaster_threads (root_hash, cast_hash, timestamp, text, author, parent_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (root_hash, cast["cast_hash"], cast.get("timestamp"), cast.get("text", ""),
+                 cast.get("author"), cast.get("parent_hash"))
+            )
 
     def add_to_conversation_thread(self, root_hash: str, cast_hash: str, cast_data: Dict):
-        data = self.read_data()
-        thread = data["conversation_threads"].setdefault(root_hash, [])
-        
         cast = cast_data.get("cast", {})
-        thread.append({
+        self._store_thread_cast(root_hash, {
             "cast_hash": cast_hash,
             "timestamp": cast.get("timestamp"),
             "text": cast.get("text", ""),
             "author": cast.get("author", {}).get("username", "anonymous"),
             "parent_hash": cast.get("parent_hash")
         })
-        
-        thread.sort(key=lambda x: parse_timestamp(x["timestamp"]) or datetime.min.replace(tzinfo=timezone.utc))
-        self.write_data(data)
 
     def get_conversation_thread(self, root_hash: str) -> List[Dict]:
-        return self.read_data()["conversation_threads"].get(root_hash, [])
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT cast_hash, timestamp, text, author, parent_hash FROM farcaster_threads WHERE root_hash = ?",
+                (root_hash,)
+            ).fetchall()
+        thread = [
+            {"cast_hash": h, "timestamp": ts, "text": text, "author": author, "parent_hash": parent}
+            for h, ts, text, author, parent in rows
+        ]
+        thread.sort(key=lambda x: parse_timestamp(x["timestamp"]) or datetime.min.replace(tzinfo=timezone.utc))
+        return thread
+
+    def claim_pending_reply(self, owner: str) -> Optional[WorkItem]:
+        """Lease the next pending cast to a worker, see SQLiteWorkQueue.claim"""
+        return self.queue.claim(owner)
 
-    def mark_as_processed(self, cast_hash: str, response_data: Dict):
-        data = self.read_data()
-        if cast_hash in data["pending_replies"]:
-            reply_data = data["pending_replies"].pop(cast_hash)
-            reply_data.update(response_data)
-            data["processed_replies"][cast_hash] = reply_data
-            self.write_data(data)
-            logger.info(f"Marked cast as processed: {cast_hash}")
+    def mark_as_processed(self, item: WorkItem, response_data: Dict) -> bool:
+        reply_data = dict(item.payload, **response_data)
+        if self.queue.complete(item, reply_data):
+            logger.info(f"Marked cast as processed: {item.item_id}")
+            return True
+        return False
+
+    def mark_as_failed(self, item: WorkItem, error: str) -> str:
+        return self.queue.fail(item, error)
+
+    def release(self, item: WorkItem) -> bool:
+        """Give the cast back for a later retry without counting the attempt"""
+        return self.queue.release(item)
 
     def add_pending_reply(self, cast_hash: str, cast_data: Dict):
-        data = self.read_data()
-        if cast_hash not in data["processed_replies"] and cast_hash not in data["pending_replies"]:
-            data["pending_replies"][cast_hash] = cast_data
-            self.write_data(data)
+        if self.queue.enqueue(cast_hash, cast_data):
             logger.info(f"Added pending cast: {cast_hash}")
 
-    def is_processed(self, cast_hash: str) -> bool:
-        return cast_hash in self.read_data()["processed_replies"]
-
-    def get_processed_cast_ids(self) -> set:
-        return set(self.read_data()["processed_replies"].keys())
+    def unseen_cast_ids(self, cast_hashes: List[str]) -> set:
+        """Casts that were never queued, O(1) per hash"""
+        return set(self.queue.seen.unseen(cast_hashes))
 
-    def get_pending_cast_ids(self) -> set:
-        return set(self.read_data()["pending_replies"].keys())
+    def pending_count(self) -> int:
+        return self.queue.count(PENDING)
 
 class FarcasterAPI:
     def __init__(self, api_key: str, signer_uuid: str):
@@ -130,12 +169,14 @@ class FarcasterAPI:
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict]:
         try:
-            response = requests.request(
-                method,
-                f"{self.base_url}/{endpoint}",
-                headers=self.headers,
-                **kwargs
-            )
+            with platform_call("neynar", f"{method} {endpoint}") as call:
+                response = requests.request(
+                    method,
+                    f"{self.base_url}/{endpoint}",
+                    headers=self.headers,
+                    **kwargs
+                )
+                call.status = response.status_code
             return response.json() if response.status_code == 200 else None
         except Exception as e:
             logger.error(f"API request error: {str(e)}")
@@ -169,15 +210,16 @@ class FarcasterReplyMonitor:
         self.queue_manager = queue_manager
         
     def filter_mentions(self, mentions: List[Dict]) -> List[Dict]:
-        processed_ids = self.queue_manager.get_processed_cast_ids()
-        pending_ids = self.queue_manager.get_pending_cast_ids()
+        unseen_ids = self.queue_manager.unseen_cast_ids(
+            [m.get('cast', {}).get('hash') for m in mentions if m.get('cast', {}).get('hash')]
+        )
         
         filtered_mentions = []
         for mention in mentions:
             cast = mention.get('cast', {})
             cast_hash = cast.get('hash')
             
-            if cast_hash in processed_ids or cast_hash in pending_ids:
+            if cast_hash not in unseen_ids:
                 continue
                 
             # Additional filtering logic can be added here
@@ -238,17 +280,23 @@ class FarcasterReplyAgent(CoreAgent):
             queue_manager=self.queue_manager
         )
         self.register_interface('farcaster_reply', self)
+        QUEUE_DEPTH.set_function(self.queue_manager.pending_count, queue="farcaster_reply")
         
-    async def send_message(self, chat_id: str, message: str, image_url: str = None):
-        """Interface method called by CoreAgent's send_to_interface"""
+    async def send_message(self, chat_id: str, message: str, image_url: str = None, keeper: LeaseKeeper = None) -> bool:
+        """Interface method called by CoreAgent's send_to_interface, False if the lease was lost before casting"""
         logger.debug(f"send_message {chat_id} {message} {image_url}")
         if not DRYRUN:
+            # Another worker owns the cast once the lease is lost, casting now would reply twice
+            if keeper is not None and not await keeper.confirm():
+                logger.warning(f"Lease on reply to {chat_id} lost, not casting")
+                return False
             api = FarcasterAPI(FARCASTER_API_KEY, FARCASTER_SIGNER_UUID)
             api.send_cast(message, parent_hash=chat_id, image_url=image_url)
         else:
             print(f"DRYRUN MODE: Would have replied to {chat_id} with {message} and image {image_url}")
+        return True
 
-    async def process_reply(self, notification: Dict):
+    async def process_reply(self, notification: Dict, keeper: LeaseKeeper = None):
         cast = notification.get('cast', {})
         cast_hash = cast.get('hash')
         
@@ -256,34 +304,30 @@ class FarcasterReplyAgent(CoreAgent):
             logger.debug(f"Processing reply for cast {cast_hash}")
             
             parent_hash = cast.get('parent_hash')
-            conversation_context = None
+            thread_id = cast_hash
             
             if parent_hash:
                 logger.debug(f"Found parent hash {parent_hash}, retrieving conversation context")
                 conversation_tree = build_conversation_tree(notification, self.monitor.api)
                 if conversation_tree:
-                    root_hash = conversation_tree[0]['hash']
-                    conversation_context = self.queue_manager.get_conversation_thread(root_hash)
-                    logger.info(f"Retrieved conversation context with {len(conversation_context)} messages")
+                    thread_id = conversation_tree[0]['hash']
+                    # Seed the rolling memory from the stored thread once, later turns are
+                    # added by handle_message so the thread is never re-sent verbatim
+                    if not await asyncio.to_thread(self.conversation_memory.has_history, "farcaster_reply", thread_id):
+                        seen = set()
+                        earlier = []
+                        for msg in self.queue_manager.get_conversation_thread(thread_id):
+                            if msg['cast_hash'] != cast_hash and msg['cast_hash'] not in seen:
+                                seen.add(msg['cast_hash'])
+                                earlier.append((f"@{msg['author']}", msg['text']))
+                        await self.conversation_memory.add_turns("farcaster_reply", thread_id, earlier, wait=True)
+                        logger.info(f"Seeded conversation memory with {len(earlier)} messages")
             
             prompt_config = PromptConfig()
-            if conversation_context:
-                context_str = "\n".join([
-                    f"@{msg['author']}: {msg['text']}"
-                    for msg in conversation_context
-                ])
-                message = f"""This is a conversation thread:
-
-{context_str}
-
-The latest reply is from @{cast['author']['username']}: "{cast['text']}"
-
-Please generate a contextually relevant reply that takes into account the entire conversation history."""
-            else:
-                message = prompt_config.get_farcaster_reply_template().format(
-                    author_name=cast['author']['username'],
-                    message=cast['text']
-                )
+            message = prompt_config.get_farcaster_reply_template().format(
+                author_name=cast['author']['username'],
+                message=cast['text']
+            )
             
             # Generate response using CoreAgent's handle_message
             response, image_url, _ = await self.handle_message(
@@ -291,42 +335,66 @@ Please generate a contextually relevant reply that takes into account the entire
                 source_interface="farcaster_reply",
                 chat_id=cast_hash,
                 skip_embedding=True,
-                skip_tools=True
+                skip_tools=True,
+                conversation_id=thread_id,
+                memory_text=cast['text'],
+                memory_speaker=f"@{cast['author']['username']}"
             )
+            if not response:
+                logger.warning("No response generated (request shed or rejected), skipping reply")
+                return None, None
             
             # Send the response
-            await self.send_message(cast_hash, response, image_url)
+            if not await self.send_message(cast_hash, response, image_url, keeper):
+                return None, None
             
-            # Update queue with response data
-            response_data = {
-                "response": response,
-                "processed_timestamp": datetime.now().isoformat()
-            }
-            if image_url:
-                response_data["image_url"] = image_url
-                
-            self.queue_manager.mark_as_processed(cast_hash, response_data)
             logger.info(f"Successfully processed and responded to cast {cast_hash}")
             
             return response, image_url
             
         except Exception as e:
             logger.error(f"Error processing reply: {str(e)}")
-            return None, None
+            raise
 
 
 
     async def run_workers(self, num_workers: int = 3):
         """Run multiple reply workers"""
+        # Mentions are queued by the monitor thread, workers lease them from the queue
         async def worker():
+            owner = new_owner_id()
             while True:
                 try:
-                    mentions = self.monitor.process_mentions()
-                    for mention in mentions:
-                        await self.process_reply(mention)
+                    item = await asyncio.to_thread(self.queue_manager.claim_pending_reply, owner)
+                    if not item:
+                        await asyncio.sleep(REPLY_CHECK_INTERVAL)
+                        continue
+
+                    keeper = LeaseKeeper(self.queue_manager.queue, item)
+                    try:
+                        async with keeper:
+                            response, image_url = await self.process_reply(item.payload, keeper)
+                    except Exception as e:
+                        if not keeper.lost:
+                            await asyncio.to_thread(self.queue_manager.mark_as_failed, item, str(e))
                         await asyncio.sleep(RATE_LIMIT_SLEEP)
-                    
-                    await asyncio.sleep(REPLY_CHECK_INTERVAL)
+                        continue
+
+                    if keeper.lost:
+                        # The cast belongs to another worker now, leave its state alone
+                        logger.warning(f"Abandoning cast {item.item_id}, lease lost")
+                    elif response is None:
+                        # Shed or rejected, not a failure of the cast itself
+                        await asyncio.to_thread(self.queue_manager.release, item)
+                    else:
+                        response_data = {
+                            "response": response,
+                            "processed_timestamp": datetime.now().isoformat()
+                        }
+                        if image_url:
+                            response_data["image_url"] = image_url
+                        await asyncio.to_thread(self.queue_manager.mark_as_processed, item, response_data)
+                    await asyncio.sleep(RATE_LIMIT_SLEEP)
 
                 except Exception as e:
                     logger.error(f"Worker error: {str(e)}")
@@ -340,6 +408,7 @@ Please generate a contextually relevant reply that takes into account the entire
         def monitor_mentions():
             while True:
                 self.monitor.process_mentions()
+                self.queue_manager.queue.maybe_archive()
                 time.sleep(REPLY_CHECK_INTERVAL)
 
         monitor_thread = threading.Thread(target=monitor_mentions, daemon=True)
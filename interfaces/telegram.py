@@ -6,6 +6,7 @@ import dotenv
 from telegram.ext import Updater, CommandHandler, CallbackContext, MessageHandler, filters, Application
 from telegram import Update
 from agents.core_agent import CoreAgent
+from core.deadline import request_deadline
 from xrpl.clients import JsonRpcClient
 from xrpl.wallet import Wallet
 from xrpl.account import get_balance
@@ -174,7 +175,9 @@ async def image(self, update: Update, context: CallbackContext) -> None:
         """Handle incoming messages."""
         text_response, image_url, _ = await self.handle_message(
             update.message.text,
-            source_interface='telegram'
+            source_interface='telegram',
+            conversation_id=str(update.effective_chat.id),
+            deadline=request_deadline('telegram')
         )
         logger.info(f"Telegram message: {update.message.text}")
         if self._parent != self:
@@ -244,7 +247,12 @@ async def image(self, update: Update, context: CallbackContext) -> None:
             # Notify the user
             await update.message.reply_text("Voice note received. Processing...")
             user_message = await self.transcribe_audio(file_path)
-            text_response, image_url,_ = await self.handle_message(user_message)
+            text_response, image_url,_ = await self.handle_message(
+                user_message,
+                source_interface='telegram',
+                conversation_id=str(update.effective_chat.id),
+                deadline=request_deadline('telegram')
+            )
         
             if image_url:
                 await update.message.reply_photo(photo=image_url)
@@ -9,7 +9,8 @@ from typing import Dict, Any
 import dotenv
 import yaml
 from agents.core_agent import CoreAgent
-from platforms.twitter_api import tweet_with_image, tweet_text_only
+from platforms.twitter_api import tweet_with_image, tweet_text_only, CREATE_TWEET_ENDPOINT, RateLimited
+from core.rate_pacer import get_pacer
 import asyncio
 
 # Set up logging
@@ -188,6 +189,9 @@ class TwitterAgent(CoreAgent):
     async def _run(self):
         while True:
             try:
+                if not DRYRUN:
+                    # Wait out an exhausted posting budget on the loop, other interfaces keep running
+                    await get_pacer().wait_async(CREATE_TWEET_ENDPOINT)
                 # Generate tweet returns (tweet, image_url, tweet_data)
                 tweet_result = await self.generate_tweet()
                 logger.info("Tweet result: %s", tweet_result)
@@ -199,11 +203,11 @@ class TwitterAgent(CoreAgent):
                     if not DRYRUN:
                         token_id = None
                         if image_url:
-                            tweet_id, username = tweet_with_image(tweet, image_url)
+                            tweet_id, username = await asyncio.to_thread(tweet_with_image, tweet, image_url)
                             logger.info("Successfully posted tweet with image: %s", tweet)
                             tweet_url = f"https://x.com/{username}/status/{tweet_id}"
                         else:
-                            tweet_id, username = tweet_text_only(tweet)
+                            tweet_id, username = await asyncio.to_thread(tweet_text_only, tweet)
                             logger.info("Successfully posted tweet: %s", tweet)
                         
                         tweet_data['metadata']['tweet_id'] = tweet_id
@@ -235,6 +239,10 @@ class TwitterAgent(CoreAgent):
                 logger.info("Next tweet will be posted at: %s", next_time.strftime('%H:%M:%S'))
                 await asyncio.sleep(wait_time)
                 
+            except RateLimited as e:
+                # The pacer holds the next attempt until the window resets
+                logger.warning("Tweet not posted: %s", str(e))
+                continue
             except Exception as e:
                 logger.error("Error occurred: %s", str(e))
                 await asyncio.sleep(10)
@@ -1,7 +1,7 @@
 '''
 Agent flow:
 1. Monitor finds tweets
-2. Tweets go into JSON file
+2. Tweets go into the SQLite reply queue
 3. Workers pull from queue
 4. CoreAgent processes messages
 5. Results automatically route back through send_message
@@ -15,8 +15,7 @@ import logging
 import os
 import random
 import time
-import requests
-from datetime import datetime
+import aiohttp
 from pathlib import Path
 from typing import Dict, List
 import dotenv
@@ -25,8 +24,13 @@ import platforms.twitter_api as twitter_api
 from core.imgen import generate_image_convo_prompt, generate_image_with_retry
 from core.config import PromptConfig
 from agents.core_agent import CoreAgent
+from core.tracing import span, traced
+from core.metrics import QUEUE_DEPTH, platform_call
+from core.polling import AdaptivePollInterval
+from core.rate_pacer import get_pacer
+from core.work_queue import SQLiteWorkQueue, LeaseKeeper, new_owner_id, PENDING, PROCESSED
 from utils.text_utils import strip_tweet_text
-from utils.llm_utils import should_ignore_message
+from utils.llm_utils import should_ignore_messages
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -43,8 +47,21 @@ SMALL_MODEL_ID = os.getenv("SMALL_MODEL_ID")
 SELF_TWITTER_NAME = os.getenv("SELF_TWITTER_NAME")
 DRYRUN = os.getenv("DRYRUN")
 
-RATE_LIMIT_SLEEP = 120
-TAGGING_CHECK_INTERVAL = 1800
+# Pause of idle workers before checking the queue again; posting is paced by the API's rate-limit headers
+QUEUE_POLL_INTERVAL = float(os.getenv("REPLY_QUEUE_POLL_INTERVAL", 30))
+# Search ingestion: per-request timeout, pause between result pages and pages per poll
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", 15))
+SEARCH_PAGE_DELAY = float(os.getenv("SEARCH_PAGE_DELAY", 5))
+SEARCH_MAX_PAGES = int(os.getenv("SEARCH_MAX_PAGES", 5))
+# Newest tweet id already ingested, kept in the queue database across restarts
+NEWEST_TWEET_KEY = "search_newest_tweet_id"
+# Where a poll that hit SEARCH_MAX_PAGES before reaching NEWEST_TWEET_KEY stopped, and the newest id it saw
+RESUME_CURSOR_KEY = "search_resume_cursor"
+RESUME_NEWEST_KEY = "search_resume_newest_tweet_id"
+LAST_POLL_KEY = "search_last_poll"
+# Relevance filter: "batch" packs a page of tweets into one LLM call, "concurrent" runs one call per tweet in parallel
+RELEVANCE_FILTER_MODE = os.getenv("RELEVANCE_FILTER_MODE", "batch")
+RELEVANCE_FILTER_CONCURRENCY = int(os.getenv("RELEVANCE_FILTER_CONCURRENCY", 4))
 
 if DRYRUN:
     print("DRYRUN MODE: Not posting real tweets")
@@ -54,113 +71,125 @@ else:
 prompt_config = PromptConfig()
 
 class QueueManager:
-    def __init__(self, file_path="reply_history.json"):
-        self.file_path = Path(file_path)
-        self._ensure_file_exists()
-    
-    def _ensure_file_exists(self):
-        """Create file with initial structure if it doesn't exist"""
-        if not self.file_path.exists():
-            self.write_data({
-                "processed_replies": [], 
-                "pending_replies": [],
-                "processing_replies": {}
-            })
-    
-    def read_data(self) -> Dict:
-        """Read current data from file"""
-        try:
-            with self.file_path.open('r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error reading reply history: {str(e)}")
-            return {"processed_replies": [], "pending_replies": []}
-    
-    def write_data(self, data: Dict):
-        """Write data to file"""
+    """
+    Reply queue of TwitterReplyAgent, backed by core.work_queue.SQLiteWorkQueue.
+    An existing reply_history.json is imported once on startup and renamed.
+    """
+    def __init__(self, file_path="reply_history.json", db_path=None):
+        self.queue = SQLiteWorkQueue("twitter_reply", db_path)
+        self._migrate_json(Path(file_path))
+
+    def _migrate_json(self, file_path: Path):
+        """Import the JSON history once, items that were mid-processing are queued again"""
+        if not file_path.exists():
+            return
         try:
-            with self.file_path.open('w') as f:
-                json.dump(data, f, indent=2)
+            with file_path.open('r') as f:
+                data = json.load(f)
         except Exception as e:
-            logger.error(f"Error writing reply history: {str(e)}")
+            logger.error(f"Error reading reply history for migration: {str(e)}")
+            return
+        items = [
+            (reply["tweet_id"], PROCESSED, reply, reply)
+            for reply in data.get("processed_replies", [])
+        ] + [
+            (reply["tweet_id"], PENDING, reply, None)
+            for reply in data.get("pending_replies", [])
+        ]
+        added = self.queue.import_items(items)
+        file_path.rename(file_path.with_name(file_path.name + ".migrated"))
+        logger.info(f"Migrated {added} replies from {file_path} to {self.queue.db_path}")
     
     def add_reply(self, reply_data: dict):
         """Add new reply to queue"""
         logger.debug(f"Adding new reply to queue: {reply_data['tweet_id']}")
-        data = self.read_data()
         # Use tweet_id from the API response
         reply_data["message_id"] = reply_data["tweet_id"]  # Store tweet_id as message_id
-        data["pending_replies"].append(reply_data)  # Append to maintain order
-        self.write_data(data)
+        self.queue.enqueue(reply_data["tweet_id"], reply_data)
     
-    def pop_pending_reply(self):
-        """Get next pending reply and mark as processing"""
-        data = self.read_data()
-        
-        # Find first pending reply that's not being processed
-        for reply in data["pending_replies"]:
-            tweet_id = reply["tweet_id"]
-            if tweet_id not in data.get("processing_replies", {}):
-                logger.debug(f"Found unprocessed reply {tweet_id}, marking as processing")
-                data["processing_replies"][tweet_id] = {
-                    "data": reply,
-                    "started_at": datetime.now().isoformat()
-                }
-                self.write_data(data)
-                
-                return {
-                    'message_id': tweet_id,
-                    'data': json.dumps(reply)
-                }
-        
-        logger.debug("No pending replies found")
-        return None
+    def pop_pending_reply(self, owner: str = None):
+        """
+        Lease the next pending reply to a worker. The lease must be renewed
+        (LeaseKeeper) until mark_as_done/mark_as_failed, or the reply is
+        handed to another worker.
+        """
+        item = self.queue.claim(owner or new_owner_id())
+        if item is None:
+            logger.debug("No pending replies found")
+            return None
+        logger.debug(f"Found unprocessed reply {item.item_id}, marking as processing (attempt {item.attempts})")
+        return {
+            'message_id': item.item_id,
+            'data': json.dumps(item.payload),
+            'lease': item
+        }
     
-    def mark_as_done(self, message_id, response_data: dict):
-        """Move from processing to processed"""
-        logger.debug(f"Marking reply {message_id} as done")
-        data = self.read_data()
-        
-        # Remove from pending and processing
-        data["pending_replies"] = [r for r in data["pending_replies"] 
-                                 if r["tweet_id"] != message_id]
-        data["processing_replies"].pop(message_id, None)
-        
-        # Add to processed
-        data["processed_replies"].append(response_data)
-        self.write_data(data)
-
-    def get_all_tweet_ids(self) -> set:
-        """Get set of all tweet IDs from both pending and processed replies"""
-        data = self.read_data()
-        processed_ids = {reply["tweet_id"] for reply in data["processed_replies"]}
-        pending_ids = {reply["tweet_id"] for reply in data["pending_replies"]}
-        return processed_ids | pending_ids
-
-    def get_pending_tweet_ids(self) -> set:
-        """Get set of all tweet IDs from pending replies"""
-        data = self.read_data()
-        pending_ids = {reply["tweet_id"] for reply in data["pending_replies"]}
-        return pending_ids
-
-    def get_processed_tweet_ids(self) -> set:
-        """Get set of all tweet IDs from processed replies"""
-        data = self.read_data()
-        processed_ids = {reply["tweet_id"] for reply in data["processed_replies"]}
-        return processed_ids
+    def mark_as_done(self, message: dict, response_data: dict) -> bool:
+        """Move from processing to processed, False if the lease was lost"""
+        logger.debug(f"Marking reply {message['message_id']} as done")
+        return self.queue.complete(message['lease'], response_data)
+
+    def mark_as_failed(self, message: dict, error: str) -> str:
+        """Give the reply back for a retry, or to the dead letters after too many attempts"""
+        logger.debug(f"Marking reply {message['message_id']} as failed: {error}")
+        return self.queue.fail(message['lease'], error)
+
+    def release_reply(self, message: dict) -> bool:
+        """Give the reply back for a later retry without counting the attempt"""
+        logger.debug(f"Releasing reply {message['message_id']}")
+        return self.queue.release(message['lease'])
+
+    def unseen_tweet_ids(self, tweet_ids: list) -> set:
+        """Tweet IDs that were never queued or marked seen, O(1) per id"""
+        return set(self.queue.seen.unseen(tweet_ids))
+
+    def mark_seen(self, tweet_ids: list):
+        """Remember tweets that were looked at but not queued, so they are not judged again"""
+        self.queue.seen.add_many(tweet_ids)
+
+    def pending_count(self) -> int:
+        """Number of replies waiting for a worker"""
+        return self.queue.count(PENDING)
 
 class TwitterSearchMonitor:
+    """
+    Incremental ingestion of search results into the reply queue.
+
+    Requests share one pooled aiohttp session with a timeout. Each poll only
+    pulls tweets newer than the newest id ingested so far; a poll that runs
+    out of pages before reaching it leaves a resume cursor, and the next
+    poll continues from there. The pause between polls follows the observed
+    mention rate (see AdaptivePollInterval).
+    """
+
     def __init__(self, api_key: str, queue_manager: QueueManager):
         self.api_key = api_key
         self.queue_manager = queue_manager
         self.base_url = "https://api.apidance.pro/sapi/Search"
         self.search_terms = []  # Initialize empty list
+        self.poll_interval = AdaptivePollInterval()
+        self.last_new_count = 0
+        self._session = None
 
     def set_search_terms(self, terms: list):
         """Set the search terms to monitor"""
         self.search_terms = terms
 
-    def fetch_tweets(self, cursor: str = "") -> Dict:
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"apikey": self.api_key},
+                timeout=aiohttp.ClientTimeout(total=SEARCH_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        """Close the HTTP session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch_tweets(self, cursor: str = "") -> Dict:
         """Fetch tweets matching configured search terms"""
         # Join terms with OR for the search query
         query = " OR ".join(self.search_terms)
@@ -168,16 +197,17 @@ class TwitterSearchMonitor:
             "q": query,
             "cursor": cursor
         }
-        headers = {
-            "apikey": self.api_key
-        }
         
         try:
-            response = requests.get(self.base_url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request failed: {e}")
+            with span("twitter_search.fetch", cursor=bool(cursor)) as fetch_span, \
+                    platform_call("apidance", "search") as call:
+                async with self._get_session().get(self.base_url, params=params) as response:
+                    fetch_span.set("status_code", response.status)
+                    call.status = response.status
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Request failed: {e!r}")
             return {"tweets": [], "next_cursor_str": None}
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response: {e}")
@@ -185,10 +215,11 @@ class TwitterSearchMonitor:
 
     def filter_tweets(self, tweets: List[Dict]) -> List[Dict]:
         """Filter tweets based on criteria. Return the tweets that are selected for processing"""
-        # Get all processed tweet IDs from queues
-        processed_tweets = self.queue_manager.get_all_tweet_ids()
+        # Only tweets never queued or judged before, one index lookup per tweet
+        unseen_tweets = self.queue_manager.unseen_tweet_ids([tweet['tweet_id'] for tweet in tweets])
 
-        filtered_tweets = []
+        # Cheap checks first, only the survivors reach the LLM relevance filter
+        candidates = []
         for tweet in tweets:
             if SELF_TWITTER_NAME == tweet['user']['name']:
                 continue
@@ -198,7 +229,7 @@ class TwitterSearchMonitor:
                 continue
                 
             # Skip if we've already processed this tweet
-            if tweet['tweet_id'] in processed_tweets:
+            if tweet['tweet_id'] not in unseen_tweets:
                 continue
                 
             # Check if tweet contains any of the search terms
@@ -222,74 +253,167 @@ class TwitterSearchMonitor:
             if len(cleaned_text) < 10:
                 continue
 
-            # check if the tweet should be ignored
-            if should_ignore_message(
-                base_url=HEURIST_BASE_URL,
-                api_key=HEURIST_API_KEY,
-                model_id=SMALL_MODEL_ID,
-                criteria=prompt_config.get_social_reply_filter(),
-                message=cleaned_text,
-                temperature=0.0
-            ):
+            candidates.append((tweet, cleaned_text))
+
+        # check which tweets should be ignored, all candidates of the page at once
+        ignore_flags = should_ignore_messages(
+            base_url=HEURIST_BASE_URL,
+            api_key=HEURIST_API_KEY,
+            model_id=SMALL_MODEL_ID,
+            criteria=prompt_config.get_social_reply_filter(),
+            messages=[cleaned_text for _, cleaned_text in candidates],
+            temperature=0.0,
+            mode=RELEVANCE_FILTER_MODE,
+            max_concurrency=RELEVANCE_FILTER_CONCURRENCY
+        )
+
+        filtered_tweets = []
+        ignored_ids = []
+        for (tweet, cleaned_text), ignore in zip(candidates, ignore_flags):
+            if ignore:
                 logger.info(f"Ignoring tweet {cleaned_text} because it matches the ignore criteria")
+                ignored_ids.append(tweet['tweet_id'])
                 continue
-     
             filtered_tweets.append(tweet)
+        if ignored_ids:
+            self.queue_manager.mark_seen(ignored_ids)
             
         return filtered_tweets
 
-    def process_mentions(self) -> List[Dict]:
-        """Main function to process mentions and queue new tweets"""
+    def queue_tweets(self, tweets: List[Dict]):
+        """
+        Queue selected tweets for reply, with the text of the tweet they relate
+        to and the root of their thread
+        """
+        # Context of the whole page in one batch lookup
+        related_ids = [tweet["related_tweet_id"] for tweet in tweets if tweet.get("related_tweet_id")]
+        related_tweets = twitter_api.get_tweets(related_ids) if related_ids else {}
+        for tweet in tweets:
+            related_tweet_id = tweet.get("related_tweet_id", None)
+            related_tweet = None    
+            # A standalone mention starts its own thread
+            conversation_id = tweet["tweet_id"]
+            if related_tweet_id:
+                related_data = related_tweets.get(str(related_tweet_id))
+                if related_data:
+                    related_tweet = related_data["text"]
+                # The tweet replied to belongs to the same thread as the reply
+                conversation_id = (related_data or {}).get("conversation_id") or related_tweet_id
+            self.queue_manager.add_reply({
+                "tweet_id": tweet["tweet_id"],
+                "content": tweet["text"],
+                "author_name": tweet["user"]["name"],
+                "related_tweet_id": related_tweet_id,
+                "related_tweet_text": related_tweet,
+                "conversation_id": str(conversation_id)
+            })
+
+    @traced("twitter_reply.process_mentions")
+    async def poll_mentions(self) -> List[Dict]:
+        """Fetch tweets newer than the last poll and queue new candidates"""
         logger.info("Fetching tweets...")
+        queue = self.queue_manager.queue
+        since_id = int(await asyncio.to_thread(queue.get_meta, NEWEST_TWEET_KEY, "0"))
+        # An unfinished earlier poll is continued below the last page it fetched first
+        cursor = await asyncio.to_thread(queue.get_meta, RESUME_CURSOR_KEY, "")
+        if cursor:
+            logger.info("Resuming the previous poll")
+        newest_id = max(since_id, int(await asyncio.to_thread(queue.get_meta, RESUME_NEWEST_KEY, "0") or 0))
+        new_count = 0
         
-        cursor = ""
         api_calls = 0
         all_candidates = []
+        caught_up = False
         
-        while api_calls < 5:
+        while api_calls < SEARCH_MAX_PAGES:
             api_calls += 1
-            response_data = self.fetch_tweets(cursor)
+            response_data = await self.fetch_tweets(cursor)
             
             if not response_data.get('tweets'):
                 logger.info("No tweets found in response")
+                # Nothing newer on the first page; further down it may be a failed request, resume later
+                caught_up = not cursor
                 break
 
-            logger.debug(f"Fetched {len(response_data['tweets'])} tweets")
+            tweets = response_data['tweets']
+            logger.debug(f"Fetched {len(tweets)} tweets")
             logger.debug(f"Response data: {response_data}")
+
+            # Results are newest first, anything at or below since_id came in an earlier poll
+            new_tweets = [tweet for tweet in tweets if int(tweet['tweet_id']) > since_id]
+            new_count += len(new_tweets)
+            newest_id = max([newest_id] + [int(tweet['tweet_id']) for tweet in new_tweets])
             
-            candidate_tweets = self.filter_tweets(response_data['tweets'])
-            
-            # Queue new candidates
-            for tweet in candidate_tweets:
-                related_tweet_id = tweet.get("related_tweet_id", None)
-                related_tweet = None    
-                if related_tweet_id:
-                    related_tweet = twitter_api.get_tweet_text(related_tweet_id)
-                self.queue_manager.add_reply({
-                    "tweet_id": tweet["tweet_id"],
-                    "content": tweet["text"],
-                    "author_name": tweet["user"]["name"],
-                    "related_tweet_id": related_tweet_id,
-                    "related_tweet_text": related_tweet
-                })
-            
+            candidate_tweets = await asyncio.to_thread(self.filter_tweets, new_tweets) if new_tweets else []
+            await asyncio.to_thread(self.queue_tweets, candidate_tweets)
             all_candidates.extend(candidate_tweets)
+
+            if len(new_tweets) < len(tweets):
+                logger.info("Caught up with the previous poll")
+                caught_up = True
+                break
             
-            # Stop if we found at least one candidate
-            if candidate_tweets:
+            # Without a cursor (first run), stop at the first page with candidates
+            if not since_id and candidate_tweets:
+                caught_up = True
                 break
             
             # Get next cursor for pagination
             cursor = response_data.get('next_cursor_str')
             if not cursor:
                 logger.info("No more pages to fetch")
+                caught_up = True
                 break
             
-            # sleep for 5 seconds to avoid rate limiting
-            time.sleep(5)
-
+            if api_calls < SEARCH_MAX_PAGES:
+                # pause between pages to avoid rate limiting
+                await asyncio.sleep(SEARCH_PAGE_DELAY)
+
+        # Advance the cursor only once every tweet above it is queued or judged,
+        # otherwise the next poll resumes where this one stopped
+        if caught_up:
+            if newest_id > since_id:
+                await asyncio.to_thread(queue.set_meta, NEWEST_TWEET_KEY, str(newest_id))
+            await asyncio.to_thread(queue.set_meta, RESUME_CURSOR_KEY, "")
+            await asyncio.to_thread(queue.set_meta, RESUME_NEWEST_KEY, "0")
+        else:
+            logger.info("Poll stopped before reaching the previous one, resuming there next time")
+            await asyncio.to_thread(queue.set_meta, RESUME_CURSOR_KEY, cursor)
+            await asyncio.to_thread(queue.set_meta, RESUME_NEWEST_KEY, str(newest_id))
+        self.last_new_count = new_count
         return all_candidates
 
+    def process_mentions(self) -> List[Dict]:
+        """Main function to process mentions and queue new tweets, one poll from synchronous code"""
+        async def poll_once():
+            try:
+                return await self.poll_mentions()
+            finally:
+                await self.close()
+        return asyncio.run(poll_once())
+
+    async def run(self):
+        """Poll forever, waiting between polls according to the mention rate"""
+        queue = self.queue_manager.queue
+        try:
+            while True:
+                try:
+                    await self.poll_mentions()  # this handles queueing
+                    # Keep the live queue small, old processed replies go to the archive
+                    await asyncio.to_thread(queue.maybe_archive)
+                except Exception as e:
+                    logger.error(f"Search poll failed: {str(e)}")
+                    self.last_new_count = 0
+
+                now = time.time()
+                last_poll = float(await asyncio.to_thread(queue.get_meta, LAST_POLL_KEY, "0"))
+                await asyncio.to_thread(queue.set_meta, LAST_POLL_KEY, str(now))
+                interval = self.poll_interval.observe(self.last_new_count, now - last_poll if last_poll else 0)
+                logger.info(f"Found {self.last_new_count} new tweets, next search in {interval:.0f}s")
+                await asyncio.sleep(interval)
+        finally:
+            await self.close()
+
 class TwitterReplyAgent(CoreAgent):
     def __init__(self, core_agent=None):
         if core_agent:
@@ -304,22 +428,40 @@ class TwitterReplyAgent(CoreAgent):
             queue_manager=self.queue_manager
         )
         self.register_interface('twitter_reply', self)
+        QUEUE_DEPTH.set_function(self.queue_manager.pending_count, queue="twitter_reply")
         self.set_search_terms(["@heurist_ai"])  # Set default search term
 
-    async def send_message(self, chat_id: str, message: str, image_url: str = None):
-        """Interface method called by CoreAgent's send_to_interface. chat_id is the tweet_id"""
+    async def send_message(self, chat_id: str, message: str, image_url: str = None, keeper: LeaseKeeper = None) -> bool:
+        """
+        Interface method called by CoreAgent's send_to_interface. chat_id is the tweet_id
+
+        Returns:
+            bool: False if the queue lease (keeper) was lost before posting, nothing was sent
+        """
         logger.debug(f"send_message {chat_id} {message} {image_url}")
         if not DRYRUN:
+            # Wait for a slot in the posting budget, the lease is kept alive meanwhile
+            await get_pacer().wait_async(twitter_api.CREATE_TWEET_ENDPOINT)
+            # Another worker owns the reply once the lease is lost, posting now would reply twice
+            if keeper is not None and not await keeper.confirm():
+                logger.warning(f"Lease on reply to {chat_id} lost, not posting")
+                return False
             if image_url:
-                twitter_api.reply_with_image(message, image_url, chat_id)
+                await asyncio.to_thread(twitter_api.reply_with_image, message, image_url, chat_id)
             else:
-                twitter_api.reply(message, chat_id)
+                await asyncio.to_thread(twitter_api.reply, message, chat_id)
         else:
             print(f"DRYRUN MODE: Would have replied to {chat_id} with {message} and image {image_url}")
-            return
+        return True
+
+    @traced("twitter_reply.process_reply")
+    async def process_reply(self, message_data, keeper: LeaseKeeper = None):
+        """
+        Process single reply using CoreAgent's handle_message
 
-    async def process_reply(self, message_data):
-        """Process single reply using CoreAgent's handle_message"""
+        Returns:
+            tuple: (response, image_url), (None, None) if no reply was generated or the lease was lost
+        """
         logger.debug(f"Processing reply for tweet {message_data['tweet_id']}")
         try:
             social_reply_template = prompt_config.get_social_reply_template()
@@ -337,43 +479,72 @@ class TwitterReplyAgent(CoreAgent):
                 source_interface="twitter_reply",
                 chat_id=message_data["tweet_id"],
                 skip_embedding=True,
-                skip_tools=True
+                skip_tools=True,
+                # Memory is kept per thread root, like farcaster_reply, so replies
+                # to the bot's own replies continue the same conversation
+                conversation_id=message_data.get("conversation_id") or message_data["tweet_id"],
+                memory_text=message_data["content"],
+                memory_speaker=f"@{message_data['author_name']}"
             )
+            if not response:
+                logger.warning("No response generated (request shed or rejected), skipping reply")
+                return None, None
             
             # send the response to the original tweet
-            await self.send_message(message_data["tweet_id"], response, image_url)
+            if not await self.send_message(message_data["tweet_id"], response, image_url, keeper):
+                return None, None
 
             # CoreAgent will automatically call send_to_interface to other registered interfaces
             return response, image_url
             
         except Exception as e:
             logger.error(f"Error processing reply: {str(e)}")
-            return None, None
+            raise
 
     async def run_workers(self, num_workers: int = 3):
         """Run multiple reply workers"""
         async def worker():
+            owner = new_owner_id()
             while True:
                 try:
-                    message = self.queue_manager.pop_pending_reply()
+                    message = await asyncio.to_thread(self.queue_manager.pop_pending_reply, owner)
                     if not message:
-                        await asyncio.sleep(RATE_LIMIT_SLEEP)
+                        await asyncio.sleep(QUEUE_POLL_INTERVAL)
                         continue
 
                     reply_data = json.loads(message["data"])
-                    response, image_url = await self.process_reply(reply_data)
-                    
-                    response_data = reply_data.copy()
-                    response_data["response"] = response
-                    if image_url:
-                        response_data["image_url"] = image_url
-                            
-                    self.queue_manager.mark_as_done(message["message_id"], response_data)
-                    await asyncio.sleep(RATE_LIMIT_SLEEP)
+                    # Keep the lease alive while generating, other workers may take over expired ones
+                    keeper = LeaseKeeper(self.queue_manager.queue, message["lease"])
+                    try:
+                        async with keeper:
+                            response, image_url = await self.process_reply(reply_data, keeper)
+                    except twitter_api.RateLimited as e:
+                        # Not the reply's fault, retry it without counting the attempt
+                        logger.warning(f"Reply {message['message_id']} not posted: {str(e)}")
+                        if not keeper.lost:
+                            await asyncio.to_thread(self.queue_manager.release_reply, message)
+                        continue
+                    except Exception as e:
+                        if not keeper.lost:
+                            await asyncio.to_thread(self.queue_manager.mark_as_failed, message, str(e))
+                        continue
+
+                    if keeper.lost:
+                        # The reply belongs to another worker now, leave its state alone
+                        logger.warning(f"Abandoning reply {message['message_id']}, lease lost")
+                    elif response is None:
+                        # Shed or rejected, not a failure of the reply itself
+                        await asyncio.to_thread(self.queue_manager.release_reply, message)
+                    else:
+                        response_data = reply_data.copy()
+                        response_data["response"] = response
+                        if image_url:
+                            response_data["image_url"] = image_url
+                        await asyncio.to_thread(self.queue_manager.mark_as_done, message, response_data)
 
                 except Exception as e:
                     logger.error(f"Worker error: {str(e)}")
-                    await asyncio.sleep(RATE_LIMIT_SLEEP)
+                    await asyncio.sleep(QUEUE_POLL_INTERVAL)
                         
         workers = [worker() for _ in range(num_workers)]
         await asyncio.gather(*workers)
@@ -381,9 +552,8 @@ class TwitterReplyAgent(CoreAgent):
     def start_monitoring(self):
         """Start tag monitoring in background thread"""
         def process_new_tags():
-            while True:
-                self.monitor.process_mentions()  # this handles queueing
-                time.sleep(TAGGING_CHECK_INTERVAL)
+            # The monitor gets its own event loop, separate from the workers'
+            asyncio.run(self.monitor.run())
 
         monitor_thread = threading.Thread(target=process_new_tags, daemon=True)
         monitor_thread.start()
@@ -1,5 +1,6 @@
 import asyncio
 from agents.core_agent import CoreAgent
+from core.deadline import request_deadline
 
 async def main():
     # Initialize the core agent
@@ -22,7 +23,8 @@ async def main():
             response = await agent.handle_message(
                 message=user_message,
                 source_interface="terminal",
-                skip_embedding=False  # Skip embedding for simple console interaction
+                skip_embedding=False,  # Skip embedding for simple console interaction
+                deadline=request_deadline("terminal")
             )
             
             # Print the response
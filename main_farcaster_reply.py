@@ -1,6 +1,7 @@
 import logging
 import asyncio
 from interfaces.farcaster_reply  import FarcasterReplyAgent
+from core.metrics import start_metrics_server
 
 # Set up logging
 logging.basicConfig(
@@ -18,6 +19,8 @@ async def main():
         # Initialize and run Farcaster agent
         logger.info("Starting Farcaster agent...")
         agent = FarcasterReplyAgent()
+        # No web server in this process, expose /metrics on METRICS_PORT
+        start_metrics_server()
         await agent.start()
     except KeyboardInterrupt:
         logger.info("Application stopped by user")
@@ -5,6 +5,7 @@ import logging
 from traceback import format_exc
 from dotenv import load_dotenv
 from interfaces.twitter_reply import TwitterReplyAgent
+from core.metrics import start_metrics_server
 
 async def main():
     """
@@ -24,6 +25,8 @@ async def main():
     
     # Initialize agent
     agent = TwitterReplyAgent()
+    # No web server in this process, expose /metrics on METRICS_PORT
+    start_metrics_server()
     
     try:
         logging.info("Initializing the Twitter Reply Agent...")
@@ -1,9 +1,21 @@
+import hashlib
+import logging
+import re
 import tweepy
 import requests
 import os
+import threading
+from io import BytesIO
+import time
+from collections import OrderedDict
 from urllib.parse import urlparse
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Dict, Iterable, Optional
+from core.tracing import traced
+from core.metrics import platform_call
+from core.rate_pacer import get_pacer
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,8 +27,45 @@ access_token = os.getenv("TWITTER_ACCESS_TOKEN")
 access_token_secret = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
 bearer_token = os.getenv("TWITTER_BEARER_TOKEN")
 
+# Rate limits are per endpoint, ids in the path don't matter
+CREATE_TWEET_ENDPOINT = "POST /2/tweets"
+
+def _endpoint(method: str, route: str) -> str:
+    return f"{method} {re.sub(r'/[0-9]{3,}(?=/|$)', '/:id', route)}"
+
+class RateLimited(Exception):
+    """Raised instead of calling an endpoint whose rate limit is exhausted"""
+    def __init__(self, endpoint: str, blocked_for: float):
+        super().__init__(f"Rate limit of {endpoint} exhausted, resets in {blocked_for:.0f}s")
+        self.endpoint = endpoint
+        self.blocked_for = blocked_for
+
+class PacedClient(tweepy.Client):
+    """
+    tweepy Client that reports each response's rate-limit headers to the
+    process-wide pacer and refuses requests to an exhausted endpoint with
+    RateLimited until its window resets, instead of running into 429s.
+    The window can be a day long, so callers wait for it themselves
+    (get_pacer().wait_async) rather than blocking here.
+    """
+
+    def request(self, method, route, params=None, json=None, user_auth=False):
+        endpoint = _endpoint(method, route)
+        pacer = get_pacer()
+        blocked_for = pacer.blocked_for(endpoint)
+        if blocked_for > 0:
+            logger.warning(f"Rate limit of {endpoint} exhausted, not calling it for {blocked_for:.0f}s")
+            raise RateLimited(endpoint, blocked_for)
+        try:
+            response = super().request(method, route, params=params, json=json, user_auth=user_auth)
+        except tweepy.TooManyRequests as e:
+            pacer.penalize(endpoint, e.response.headers)
+            raise
+        pacer.update(endpoint, response.headers)
+        return response
+
 # Create Client object
-client = tweepy.Client(
+client = PacedClient(
     bearer_token=bearer_token,
     consumer_key=consumer_key,
     consumer_secret=consumer_secret,
@@ -29,89 +78,141 @@ auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
 auth.set_access_token(access_token, access_token_secret)
 api = tweepy.API(auth)
 
-def tweet_with_image(text, image_source):
-    # Check if image_source is a URL
-    if image_source.startswith(('http://', 'https://')):
+# Maximum ids per batch tweet lookup
+TWEET_LOOKUP_BATCH = 100
+TWEET_CACHE_TTL = float(os.getenv("TWEET_CACHE_TTL", 3600))
+TWEET_CACHE_SIZE = int(os.getenv("TWEET_CACHE_SIZE", 10000))
+# Uploaded media ids stay valid for about a day, reuse them a bit less than that
+MEDIA_CACHE_TTL = float(os.getenv("MEDIA_CACHE_TTL", 82800))
+MEDIA_EXPIRY_MARGIN = 600
+
+class TTLCache:
+    """Bounded LRU, entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return (found, value), so cached None values can be told from misses"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: str, value, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+# Looked-up tweets by id, None for tweets that don't exist
+tweet_cache = TTLCache(TWEET_CACHE_TTL, TWEET_CACHE_SIZE)
+# (media id, expiry) of uploads by image URL and by "sha256:<digest>" of the image bytes
+media_cache = TTLCache(MEDIA_CACHE_TTL, 1000)
+
+# Username of the authenticated account, resolved on first use
+_username: Optional[str] = None
+_username_lock = threading.Lock()
+
+def get_username() -> str:
+    """Username of the authenticated account, fetched once per process"""
+    global _username
+    with _username_lock:
+        if _username is None:
+            _username = client.get_me().data.username
+        return _username
+
+def _upload_media(image_source: str):
+    """
+    Upload an image from a URL (kept in memory) or a local path, return the
+    media id. An image uploaded before, under the same URL or with the same
+    bytes, reuses its media id while it is still valid.
+    """
+    is_url = image_source.startswith(('http://', 'https://'))
+    if is_url:
+        found, media = media_cache.get(image_source)
+        if found:
+            return media[0]
+
         # Download the image
-        response = requests.get(image_source)
+        response = requests.get(image_source, timeout=30)
         if response.status_code != 200:
             raise Exception("Failed to download image")
-        
-        # Get the filename from the URL
-        filename = os.path.basename(urlparse(image_source).path)
-        if not filename:
-            filename = 'temp_image.jpg'
-        
-        # Save the image temporarily
-        with open(filename, 'wb') as f:
-            f.write(response.content)
+        content = response.content
+        filename = os.path.basename(urlparse(image_source).path) or 'image.jpg'
     else:
         # Assume image_source is a local file path
-        filename = image_source
+        with open(image_source, 'rb') as f:
+            content = f.read()
+        filename = os.path.basename(image_source)
 
+    content_key = "sha256:" + hashlib.sha256(content).hexdigest()
+    found, media = media_cache.get(content_key)
+    if not found:
+        # The filename only tells the upload the image type
+        uploaded = api.media_upload(filename=filename, file=BytesIO(content))
+        expires_after = getattr(uploaded, 'expires_after_secs', None) or MEDIA_CACHE_TTL
+        ttl = min(MEDIA_CACHE_TTL, expires_after - MEDIA_EXPIRY_MARGIN)
+        media = (uploaded.media_id, time.monotonic() + ttl)
+        media_cache.put(content_key, media, ttl)
+    if is_url:
+        # The URL entry expires together with the upload it points to
+        media_cache.put(image_source, media, media[1] - time.monotonic())
+    return media[0]
+
+@traced("twitter_api.tweet_with_image")
+@platform_call("twitter", "tweet_with_image")
+def tweet_with_image(text, image_source):
     # Upload the image using v1.1 API
-    media = api.media_upload(filename)
+    media_id = _upload_media(image_source)
     
     # Post the tweet with the uploaded media using v2 API
-    response = client.create_tweet(text=text, media_ids=[media.media_id])
-    
-    # Get authenticated user info
-    me = client.get_me()
-    author_username = me.data.username
-    
-    # If the image was downloaded, delete the temporary file
-    if image_source.startswith(('http://', 'https://')):
-        os.remove(filename)
+    response = client.create_tweet(text=text, media_ids=[media_id])
+    author_username = get_username()
     
     print(f"Tweet posted successfully! Tweet ID: {response.data['id']}")
     return response.data['id'], author_username
 
+@traced("twitter_api.tweet_text_only")
+@platform_call("twitter", "tweet_text_only")
 def tweet_text_only(text):
     # Post tweet with text only using v2 API
     print("Posting tweet with text only using v2 API")
     response = client.create_tweet(text=text)
-    
-    # Get authenticated user info
-    me = client.get_me()
-    author_username = me.data.username
+    author_username = get_username()
     
     print(f"Tweet posted successfully! Tweet ID: {response.data['id']}")
     return response.data['id'], author_username
 
+@traced("twitter_api.reply")
+@platform_call("twitter", "reply")
 def reply(text, in_reply_to_tweet_id):
     print("Posting tweet in reply")
     response = client.create_tweet(text=text, in_reply_to_tweet_id=in_reply_to_tweet_id)
     print(f"Tweet posted successfully! Tweet ID: {response.data['id']}")
     return response.data['id']
 
+@traced("twitter_api.reply_with_image")
+@platform_call("twitter", "reply_with_image")
 def reply_with_image(text, image_source, in_reply_to_tweet_id):
-    if image_source.startswith(('http://', 'https://')):
-        response = requests.get(image_source)
-        if response.status_code != 200:
-            raise Exception("Failed to download image")
-        
-        # Get the filename from the URL
-        filename = os.path.basename(urlparse(image_source).path)
-        if not filename:
-            filename = 'temp_image.jpg'
-        
-        # Save the image temporarily
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-    else:
-        # Assume image_source is a local file path
-        filename = image_source
-
-    media = api.media_upload(filename)
-    response = client.create_tweet(text=text, media_ids=[media.media_id], in_reply_to_tweet_id=in_reply_to_tweet_id)
-    
-    # If the image was downloaded, delete the temporary file
-    if image_source.startswith(('http://', 'https://')):
-        os.remove(filename)
+    media_id = _upload_media(image_source)
+    response = client.create_tweet(text=text, media_ids=[media_id], in_reply_to_tweet_id=in_reply_to_tweet_id)
     
     print(f"Tweet posted successfully! Tweet ID: {response.data['id']}")
     return response.data['id']
 
+@traced("twitter_api.get_user_id")
+@platform_call("twitter", "get_user_id")
 def get_user_id(username):
     """Get Twitter user ID from username"""
     try:
@@ -129,77 +230,94 @@ def get_user_id(username):
         print(f"Error getting user ID for {username}: {str(e)}")
         return None
 
+def _tweet_data(tweet) -> dict:
+    tweet_data = {
+        'id': tweet.id,
+        'text': tweet.text,
+        'author_id': tweet.author_id,
+        'created_at': tweet.created_at,
+        # Id of the tweet that started the thread
+        'conversation_id': tweet.conversation_id
+    }
+    # Add referenced tweet data if available
+    if tweet.referenced_tweets:
+        tweet_data['referenced_tweets'] = [
+            {
+                'type': ref.type,
+                'id': ref.id
+            }
+            for ref in tweet.referenced_tweets
+        ]
+    return tweet_data
+
+@traced("twitter_api.lookup_tweets")
+@platform_call("twitter", "get_tweets")
+def _lookup_tweets(tweet_ids: list) -> Dict[str, Optional[dict]]:
+    """One batch lookup of up to TWEET_LOOKUP_BATCH ids, missing tweets map to None"""
+    response = client.get_tweets(
+        ids=tweet_ids,
+        tweet_fields=['author_id', 'conversation_id', 'created_at', 'text', 'referenced_tweets']
+    )
+    found = {str(tweet.id): _tweet_data(tweet) for tweet in response.data or []}
+    return {tweet_id: found.get(tweet_id) for tweet_id in tweet_ids}
+
+@traced("twitter_api.get_tweets")
+def get_tweets(tweet_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """
+    Get content and metadata of many tweets, from the cache or in batches of
+    up to 100 ids per API call.
+
+    Returns:
+        Dict[str, Optional[dict]]: Tweet data by id, None for tweets that
+        don't exist or could not be fetched
+    """
+    results = {}
+    missing = []
+    for tweet_id in dict.fromkeys(str(tweet_id) for tweet_id in tweet_ids):
+        found, tweet_data = tweet_cache.get(tweet_id)
+        if found:
+            results[tweet_id] = tweet_data
+        else:
+            missing.append(tweet_id)
+
+    for i in range(0, len(missing), TWEET_LOOKUP_BATCH):
+        batch = missing[i:i + TWEET_LOOKUP_BATCH]
+        try:
+            fetched = _lookup_tweets(batch)
+        except Exception as e:
+            # Not cached, the next lookup retries
+            print(f"Error fetching tweets {batch}: {str(e)}")
+            fetched = dict.fromkeys(batch)
+        else:
+            for tweet_id, tweet_data in fetched.items():
+                tweet_cache.put(tweet_id, tweet_data)
+        results.update(fetched)
+    return results
+
+@traced("twitter_api.get_tweet")
 def get_tweet(tweet_id: str):
     """Get tweet content and metadata"""
-    try:
-        tweet = client.get_tweet(
-            tweet_id,
-            expansions=['author_id', 'referenced_tweets.id'],
-            tweet_fields=['created_at', 'text', 'referenced_tweets']
-        )
-        
-        if not tweet.data:
-            return None
-            
-        # Extract basic tweet data
-        tweet_data = {
-            'id': tweet.data.id,
-            'text': tweet.data.text,
-            'author_id': tweet.data.author_id,
-            'created_at': tweet.data.created_at
-        }
-        
-        # Add referenced tweet data if available
-        if hasattr(tweet.data, 'referenced_tweets') and tweet.data.referenced_tweets:
-            tweet_data['referenced_tweets'] = [
-                {
-                    'type': ref.type,
-                    'id': ref.id
-                }
-                for ref in tweet.data.referenced_tweets
-            ]
-            
-        return tweet_data
-        
-    except Exception as e:
-        print(f"Error fetching tweet {tweet_id}: {str(e)}")
-        return None
+    return get_tweets([tweet_id])[str(tweet_id)]
 
+@traced("twitter_api.get_tweet_text")
 def get_tweet_text(tweet_id: str) -> Optional[str]:
     """Get just the text content of a tweet"""
-    try:
-        tweet = client.get_tweet(tweet_id, tweet_fields=['text'])
-        if tweet.data:
-            return tweet.data.text
-        return None
-    except Exception as e:
-        print(f"Error fetching tweet text {tweet_id}: {str(e)}")
-        return None
+    tweet_data = get_tweet(tweet_id)
+    return tweet_data['text'] if tweet_data else None
 
+@traced("twitter_api.get_referenced_tweet_id")
 def get_referenced_tweet_id(tweet_id: str, ref_type: str = 'replied_to') -> Optional[str]:
     """
     Get ID of referenced tweet (reply to, quote, etc)
     ref_type can be 'replied_to' or 'quoted'
     """
-    try:
-        tweet = client.get_tweet(
-            tweet_id,
-            expansions=['referenced_tweets']
-        )
-        
-        if not tweet.data or not tweet.data.referenced_tweets:
-            return None
-            
-        for ref in tweet.data.referenced_tweets:
-            if (ref_type == 'replied_to' and ref.type == 'replied_to') or \
-               (ref_type == 'quoted' and ref.type == 'quoted'):
-                return ref.id
-                
-        return None
-        
-    except Exception as e:
-        print(f"Error getting referenced tweet for {tweet_id}: {str(e)}")
+    tweet_data = get_tweet(tweet_id)
+    if not tweet_data:
         return None
+    for ref in tweet_data.get('referenced_tweets', []):
+        if ref['type'] == ref_type:
+            return ref['id']
+    return None
 
 # Example usage
 # tweet_text = "Hello, Twitter! This is a test tweet with an image using API v2."
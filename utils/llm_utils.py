@@ -1,9 +1,26 @@
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from core.llm import call_llm
+from core.llm_scheduler import PRIORITY_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
+# Filter modes of should_ignore_messages
+FILTER_BATCH = "batch"
+FILTER_CONCURRENT = "concurrent"
+
+def _parse_json_block(response: str):
+    """Parse JSON from a ```json code block, a bare code block or the whole response"""
+    if "```json" in response:
+        json_str = response.split("```json")[1].split("```")[0].strip()
+    elif "```" in response:
+        json_str = response.split("```")[1].strip()
+    else:
+        json_str = response.strip()
+    return json.loads(json_str)
+
 def should_ignore_message(
     base_url: str,
     api_key: str,
@@ -36,21 +53,102 @@ def should_ignore_message(
             system_prompt=system_prompt,
             user_prompt=message,
             temperature=temperature,
-            max_tokens=100
+            max_tokens=100,
+            priority=PRIORITY_BACKGROUND
         )
 
-        # Extract JSON from code block if present
-        if "```json" in response:
-            json_str = response.split("```json")[1].split("```")[0].strip()
-        elif "```" in response:
-            json_str = response.split("```")[1].strip()
-        else:
-            json_str = response.strip()
-
         # Parse JSON and get ignore value
-        result = json.loads(json_str)
+        result = _parse_json_block(response)
         return bool(result.get("ignore", False))
 
     except (json.JSONDecodeError, KeyError, IndexError, Exception) as e:
         logger.warning(f"Error parsing ignore check response: {e}")
-        return False  # Default to not ignoring on error
\ No newline at end of file
+        return False  # Default to not ignoring on error
+
+def should_ignore_messages(
+    base_url: str,
+    api_key: str,
+    model_id: str,
+    criteria: str,
+    messages: List[str],
+    temperature: float = 0.0,
+    mode: str = FILTER_BATCH,
+    max_concurrency: int = 4,
+    batch_size: int = 20
+) -> List[bool]:
+    """
+    Check several messages against the same criteria.
+
+    In batch mode up to `batch_size` messages are packed into one call that
+    returns an ignore flag per message; messages the response does not cover
+    are checked one by one. In concurrent mode every message gets its own
+    call, at most `max_concurrency` at a time.
+
+    Args:
+        messages: Messages to check
+        mode: FILTER_BATCH or FILTER_CONCURRENT
+        Other arguments as for should_ignore_message
+
+    Returns:
+        list: One flag per message, True if it should be ignored
+    """
+    if not messages:
+        return []
+
+    def check_one(message: str) -> bool:
+        return should_ignore_message(base_url, api_key, model_id, criteria, message, temperature)
+
+    if mode == FILTER_BATCH:
+        flags: List = [None] * len(messages)
+        for start in range(0, len(messages), batch_size):
+            chunk = messages[start:start + batch_size]
+            for i, flag in enumerate(_check_batch(base_url, api_key, model_id, criteria, chunk, temperature)):
+                flags[start + i] = flag
+        missing = [i for i, flag in enumerate(flags) if flag is None]
+    else:
+        flags = [None] * len(messages)
+        missing = list(range(len(messages)))
+
+    if missing:
+        if mode == FILTER_BATCH:
+            logger.warning(f"Batch ignore check left {len(missing)} of {len(messages)} messages undecided, checking them one by one")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(missing)))) as executor:
+            for i, flag in zip(missing, executor.map(check_one, [messages[i] for i in missing])):
+                flags[i] = flag
+    return flags
+
+def _check_batch(
+    base_url: str,
+    api_key: str,
+    model_id: str,
+    criteria: str,
+    messages: List[str],
+    temperature: float
+) -> List:
+    """One call deciding a list of messages, None for every message it did not decide"""
+    system_prompt = (
+        f"Determine for each numbered user message whether it should be ignored. Criteria: {criteria} "
+        f"Your output should be in a JSON code block like this "
+        f"```json {{\"results\": [{{\"id\": 1, \"ignore\": true or false}}, ...]}}``` "
+        f"with exactly one entry per message. DO NOT explain. DO NOT output anything else."
+    )
+    user_prompt = "\n\n".join(f"Message {i + 1}:\n{message}" for i, message in enumerate(messages))
+    flags = [None] * len(messages)
+    try:
+        response = call_llm(
+            base_url=base_url,
+            api_key=api_key,
+            model_id=model_id,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=temperature,
+            max_tokens=50 + 15 * len(messages),
+            priority=PRIORITY_BACKGROUND
+        )
+        for entry in _parse_json_block(response).get("results", []):
+            index = int(entry["id"]) - 1
+            if 0 <= index < len(messages) and isinstance(entry.get("ignore"), bool):
+                flags[index] = entry["ignore"]
+    except Exception as e:
+        logger.warning(f"Error in batch ignore check: {e}")
+    return flags
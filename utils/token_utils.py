@@ -0,0 +1,24 @@
+import re
+
+# Rough BPE-style approximation: words and punctuation each cost a token,
+# long words are split into ~4 character pieces. Good enough for budgeting
+# without pulling in a tokenizer dependency.
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+CHARS_PER_TOKEN = 4
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a piece of text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        int: Approximate token count
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        tokens += max(1, -(-len(piece) // CHARS_PER_TOKEN))
+    return tokens